@@ -0,0 +1,57 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Benchmark checking check_files serially vs on the stat thread pool
+
+    python bench_chk_log_update.py [latency=0.1] [workers=16]
+
+Each os.stat is slowed by "latency" seconds to stand in for a
+synced/network drive (G:/My Drive/...) where a stat can take hundreds
+of milliseconds.  Wall time of the thread pool should stay flat as the
+number of watched files grows.
+
+'''
+import os
+import sys
+import time
+import tempfile
+import unittest.mock
+
+import chk_log_update
+
+
+if __name__ == '__main__':
+    args = dict(arg.split('=', 1) for arg in sys.argv[1:])
+    latency = float(args.get('latency', 0.1))
+    workers = int(args.get('workers', 16))
+
+    real_stat = os.stat
+
+    def slow_stat(path, *args, **kwargs):
+        time.sleep(latency)
+        return real_stat(path, *args, **kwargs)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print('{:>6} {:>12} {:>12}'.format('files', 'serial sec', 'pool sec'))
+        for count in (1, 5, 10, 20, 40):
+            recs = []
+            for cnt in range(count):
+                fname = os.path.join(tmpdir, 'f{}.csv'.format(cnt))
+                open(fname, 'w').close()
+                recs.append({'fname': fname, 'lock_fname': fname + '.lck'})
+
+            with unittest.mock.patch.object(chk_log_update.os, 'stat', slow_stat):
+                start = time.perf_counter()
+                for rec in recs:
+                    chk_log_update.stat_check_file(rec['fname'], rec['lock_fname'])
+                serial = time.perf_counter() - start
+
+                start = time.perf_counter()
+                chk_log_update.stat_check_files(recs, max_workers=workers)
+                pooled = time.perf_counter() - start
+
+            print('{:>6} {:>12.3f} {:>12.3f}'.format(count, serial, pooled))
+
+# eof
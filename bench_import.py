@@ -0,0 +1,87 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Benchmark the cold start import time of the scripts and libraries
+
+    python bench_import.py [count=7] [scale=1.0] [budget_pool=150] ...
+
+Imports each module "count" times in a fresh interpreter with
+"python -X importtime" and reports the median milliseconds to import the
+module and everything it pulls in.
+
+Fails (exit code 1) when:
+    the median is over the module budget (milliseconds - Pi-class budgets,
+        scale=0.35 is about right on a desktop x86 cpu)
+    the module loads a library that should only be imported when it is used
+        (google client libraries, dateutil, smtplib)
+
+'''
+import os
+import sys
+import tempfile
+import statistics
+import subprocess
+
+# module -> budget in milliseconds on a Pi-class cpu
+BUDGETS_MS = {
+    'pool': 150,
+    'chk_log_update': 150,
+    'kvutil': 80,
+    'kvdate': 50,
+    'kvnotifier': 60,
+    'kvgmailsendsimple': 60,
+}
+
+# libraries that must not be loaded just by importing the module
+DEFERRED = ('googleapiclient', 'google.oauth2', 'google_auth_oauthlib', 'dateutil', 'smtplib')
+
+
+def import_ms(module, cwd):
+    '''
+    cumulative milliseconds to import module in a fresh interpreter and the deferred libraries it loaded
+    '''
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    code = 'import sys, {0}; print(",".join(m for m in {1!r} if m in sys.modules))'.format(module, DEFERRED)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=cwd, env=env,
+                          capture_output=True, text=True, check=True)
+    cumulative = None
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) == 3 and parts[2].strip() == module:
+            cumulative = int(parts[1]) / 1000.0
+    loaded = [x for x in proc.stdout.strip().split(',') if x]
+    return cumulative, loaded
+
+
+if __name__ == '__main__':
+    args = dict(x.split('=', 1) for x in sys.argv[1:])
+    count = int(args.get('count', 7))
+    scale = float(args.get('scale', 1.0))
+
+    failed = []
+    # run from an empty directory - pool.py and chk_log_update.py create their log file on import
+    with tempfile.TemporaryDirectory() as cwd:
+        print('{:<20} {:>10} {:>10}  {}'.format('module', 'median ms', 'budget ms', 'deferred libraries loaded'))
+        for module, budget in BUDGETS_MS.items():
+            budget = float(args.get('budget_' + module, budget)) * scale
+            samples = []
+            loaded = []
+            for _ in range(count):
+                ms, loaded = import_ms(module, cwd)
+                samples.append(ms)
+            median = statistics.median(samples)
+            print('{:<20} {:>10.1f} {:>10.1f}  {}'.format(module, median, budget, ','.join(loaded) or '-'))
+            if median > budget:
+                failed.append('{} took {:.1f} ms - budget {:.1f} ms'.format(module, median, budget))
+            if loaded:
+                failed.append('{} loaded {}'.format(module, ','.join(loaded)))
+
+    if failed:
+        print('FAILED:\n    ' + '\n    '.join(failed))
+        sys.exit(1)
+    print('OK')
+
+# eof
@@ -0,0 +1,120 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Benchmark kvdate.datetime_from_str throughput
+
+    python bench_kvdate.py [count=1000000]
+
+Parses "count" strings of each format and reports strings/sec for the
+original implementation (patterns compiled on every call, tried in order)
+and the current one (patterns compiled once, fromisoformat fast path,
+last matching pattern tried first).
+
+Then parses a now_str column (pool_temps.csv) one value at a time and
+with the bulk parser (datetimes_from_strs) - as datetimes and as numpy.
+
+Then converts the column from local time to UTC one value at a time
+(datetime2utcdatetime - with and without the zone lookup on every call)
+and in one call (datetimes2utc) - as datetimes and as numpy.
+
+'''
+import re
+import sys
+import time
+import datetime
+
+import kvdate
+from dateutil import tz
+
+
+def legacy_datetime_from_str(value):
+    '''
+    datetime_from_str as it was before the patterns were compiled once
+    (re caches compiled patterns but the lookup and the tuple build run every call)
+    '''
+    datefmts = (
+        (re.compile(r'\d{1,2}/\d{1,2}/\d{2}$'), '%m/%d/%y'),
+        (re.compile(r'\d{1,2}/\d{1,2}/\d{4}$'), '%m/%d/%Y'),
+        (re.compile(r'\d{1,2}-\d{1,2}-\d{2}$'), '%m-%d-%y'),
+        (re.compile(r'\d{1,2}-\d{1,2}-\d{4}$'), '%m-%d-%Y'),
+        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}$'), '%Y-%m-%dT%H:%M:%S'),
+        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}\.\d+$'), '%Y-%m-%dT%H:%M:%S.%f'),
+        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}\s\d{1,2}:\d{1,2}:\d{1,2}$'), '%Y-%m-%d %H:%M:%S'),
+        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}\s\d{1,2}:\d{1,2}$'), '%Y-%m-%d %H:%M'),
+        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}:\d{1,2}:\d{1,2}:\d{1,2}$'), '%Y-%m-%d:%H:%M:%S'),
+        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}$'), '%Y-%m-%d'),
+        (re.compile(r'^\d{8}$'), '%Y%m%d'),
+    )
+    if value[-1].upper() == 'Z':
+        value = value[:-1]
+    for (redate, datefmt) in datefmts:
+        if redate.match(value):
+            return datetime.datetime.strptime(value, datefmt)
+    raise Exception(u'Unable to convert to date time:{}'.format(value))
+
+
+def build_values(fmt, count):
+    start = datetime.datetime(2020, 1, 1)
+    return [(start + datetime.timedelta(minutes=7 * cnt)).strftime(fmt) for cnt in range(count)]
+
+
+def rate(func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    return len(values) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    args = dict(arg.split('=', 1) for arg in sys.argv[1:])
+    count = int(args.get('count', 1000000))
+
+    print('{:<22} {:>10} {:>14} {:>14} {:>8}'.format('format', 'count', 'legacy/sec', 'current/sec', 'speedup'))
+    for fmt in ('%Y-%m-%d:%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d', '%m/%d/%Y'):
+        values = build_values(fmt, count)
+        legacy = rate(legacy_datetime_from_str, values)
+        current = rate(kvdate.datetime_from_str, values)
+        print('{:<22} {:>10} {:>14,.0f} {:>14,.0f} {:>7.1f}x'.format(fmt, count, legacy, current, current / legacy))
+
+    # bulk parse of a now_str column
+    values = build_values('%Y-%m-%d:%H:%M:%S', count)
+    print()
+    print('{:<34} {:>14}'.format('now_str column', 'values/sec'))
+    print('{:<34} {:>14,.0f}'.format('datetime_from_str per value', rate(kvdate.datetime_from_str, values)))
+    for label, kwargs in (('datetimes_from_strs', {}), ('datetimes_from_strs as_numpy', {'as_numpy': True})):
+        try:
+            # warm up - keep the numpy import out of the timing
+            kvdate.datetimes_from_strs(values[:10], **kwargs)
+            start = time.perf_counter()
+            kvdate.datetimes_from_strs(values, **kwargs)
+            print('{:<34} {:>14,.0f}'.format(label, count / (time.perf_counter() - start)))
+        except Exception as e:
+            print('{:<34} {:>14}'.format(label, str(e)[:40]))
+
+    # local to utc conversion of the column
+    zone = args.get('tz', 'America/Los_Angeles')
+    parsed, _ = kvdate.datetimes_from_strs(values)
+
+    def gettz_every_call(dt):
+        # datetime2utcdatetime as it was - the zone resolved on every call
+        return dt.replace(tzinfo=tz.gettz(zone)).astimezone(tz.UTC)
+
+    print()
+    print('{:<34} {:>14}'.format('local to utc ({})'.format(zone), 'values/sec'))
+    print('{:<34} {:>14,.0f}'.format('gettz on every call', rate(gettz_every_call, parsed)))
+    print('{:<34} {:>14,.0f}'.format('datetime2utcdatetime per value', rate(lambda dt: kvdate.datetime2utcdatetime(dt, zone), parsed)))
+    start = time.perf_counter()
+    kvdate.datetimes2utc(parsed, zone)
+    print('{:<34} {:>14,.0f}'.format('datetimes2utc list', count / (time.perf_counter() - start)))
+    try:
+        import numpy as np
+        arr = np.array(parsed, dtype='datetime64[s]')
+        start = time.perf_counter()
+        kvdate.datetimes2utc(arr, zone)
+        print('{:<34} {:>14,.0f}'.format('datetimes2utc numpy', count / (time.perf_counter() - start)))
+    except ImportError:
+        print('{:<34} {:>14}'.format('datetimes2utc numpy', 'numpy not installed'))
+
+# eof
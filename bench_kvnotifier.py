@@ -0,0 +1,53 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Benchmark the kvnotifier backends - messages per second per backend
+
+    python bench_kvnotifier.py [count=500] [gmail=to@address]
+
+file  - append json lines to a temporary file
+smtp  - send to the local SMTP stand-in (kvsmtpserver) reusing one connection
+smtp-noreuse - same but open a new connection for every message (the old one-call-per-message cost)
+gmail - only run when gmail=<to address> is passed (sends real messages)
+
+'''
+import os
+import sys
+import time
+import tempfile
+
+import kvnotifier
+import kvsmtpserver
+
+
+def bench(label, notifier_factory, count, email_to='to@example.com', reuse=True):
+    notifier = notifier_factory()
+    start = time.perf_counter()
+    for cnt in range(count):
+        notifier.send('from@example.com', email_to, 'bench message ' + str(cnt), 'benchmark body')
+        if not reuse:
+            notifier.close()
+    notifier.close()
+    elapsed = time.perf_counter() - start
+    print('{:<14} {:>7} msgs {:>9.3f} sec {:>10.1f} msgs/sec'.format(label, count, elapsed, count / elapsed))
+
+
+if __name__ == '__main__':
+    args = dict(arg.split('=', 1) for arg in sys.argv[1:])
+    count = int(args.get('count', 500))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sink = os.path.join(tmpdir, 'bench_messages.txt')
+        bench('file', lambda: kvnotifier.FileNotifier(sink), count)
+
+    with kvsmtpserver.LocalSMTPServer() as server:
+        bench('smtp', lambda: kvnotifier.SMTPNotifier(server.host, server.port), count)
+        bench('smtp-noreuse', lambda: kvnotifier.SMTPNotifier(server.host, server.port), count, reuse=False)
+
+    if 'gmail' in args:
+        gmail_count = min(count, 5)
+        bench('gmail', lambda: kvnotifier.GmailNotifier(), gmail_count, email_to=args['gmail'])
+
+# eof
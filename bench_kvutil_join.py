@@ -0,0 +1,109 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Benchmark kvutil.hash_join against the lookup helpers
+
+    python bench_kvutil_join.py [count=500000]
+
+Joins "count" destination records read from a csv file to "count" source
+records (half match) on two key fields - update (copy two fields on a
+match) and anti (records with no match):
+
+    current - read the csv into a list, create_multi_key_lookup,
+              copy_matched_data / extract_unmatched_data
+    hash_join - stream the csv rows past the build side and write the
+                result out as it is produced
+
+Reports the seconds and the peak memory (tracemalloc) of each.
+
+'''
+import os
+import csv
+import sys
+import time
+import tempfile
+import tracemalloc
+
+import kvutil
+
+KEY_FIELDS = ['site', 'part']
+COPY_FIELDS = ['qty', 'price']
+HEADER = ['site', 'part', 'desc', 'qty', 'price']
+
+
+def build_records(count, offset=0):
+    return [{'site': 'S{:03d}'.format(part % 997), 'part': str(part), 'desc': 'part {}'.format(part),
+             'qty': str(part % 50), 'price': '{:.2f}'.format(part * 0.01)} for part in range(offset, offset + count)]
+
+
+def write_csv(fname, records):
+    with open(fname, 'w', newline='') as t:
+        writer = csv.DictWriter(t, fieldnames=HEADER)
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def current_update(src_data, dst_fname, out_fname):
+    with open(dst_fname, newline='') as t:
+        dst_data = list(csv.DictReader(t))
+    matched = kvutil.copy_matched_data(dst_data, kvutil.create_multi_key_lookup(src_data, KEY_FIELDS), KEY_FIELDS, COPY_FIELDS)
+    write_csv(out_fname, dst_data)
+    return matched
+
+
+def hash_update(src_data, dst_fname, out_fname):
+    with open(dst_fname, newline='') as t:
+        rows, stats = kvutil.hash_join(csv.DictReader(t), src_data, KEY_FIELDS, how='update', copy_fields=COPY_FIELDS)
+        write_csv(out_fname, rows)
+    return stats['matched']
+
+
+def current_anti(src_data, dst_fname, out_fname):
+    with open(dst_fname, newline='') as t:
+        dst_data = list(csv.DictReader(t))
+    unmatched = kvutil.extract_unmatched_data(dst_data, kvutil.create_multi_key_lookup(src_data, KEY_FIELDS), KEY_FIELDS)
+    write_csv(out_fname, unmatched)
+    return len(dst_data) - len(unmatched)
+
+
+def hash_anti(src_data, dst_fname, out_fname):
+    with open(dst_fname, newline='') as t:
+        rows, stats = kvutil.hash_join(csv.DictReader(t), src_data, KEY_FIELDS, how='anti')
+        write_csv(out_fname, rows)
+    return stats['matched']
+
+
+def measure(func, *args):
+    '''
+    (seconds, peak MB) - run twice: once timed and once under tracemalloc (tracing slows it down)
+    '''
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak / 1e6
+
+
+if __name__ == '__main__':
+    args = dict(x.split('=', 1) for x in sys.argv[1:])
+    count = int(args.get('count', 500000))
+
+    src_data = build_records(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        dst_fname = os.path.join(tmp, 'dst.csv')
+        out_fname = os.path.join(tmp, 'out.csv')
+        write_csv(dst_fname, build_records(count, offset=count // 2))
+
+        print('{} source records - {} destination csv rows'.format(count, count))
+        print('{:<20} {:>9} {:>9} {:>9}'.format('join', 'seconds', 'peak MB', 'matched'))
+        for label, func in (('current update', current_update), ('hash_join update', hash_update),
+                            ('current anti', current_anti), ('hash_join anti', hash_anti)):
+            matched, seconds, peak = measure(func, src_data, dst_fname, out_fname)
+            print('{:<20} {:>9.2f} {:>9.1f} {:>9}'.format(label, seconds, peak, matched))
+
+# eof
@@ -0,0 +1,90 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Benchmark the kvutil lookup index modes
+
+    python bench_kvutil_lookup.py [count=1000000]
+
+Builds a lookup on two key fields over "count" source records with the
+nested index (create_multi_key_lookup), the tuple keyed index
+(create_flat_key_lookup) and the tuple keyed index with a record store
+(record_fields - only the fields copied are kept).
+
+Reports for each: seconds to build, memory held by the index (tracemalloc -
+the source records are not counted except for the record store tuples),
+seconds for copy_matched_data and extract_unmatched_data over "count"
+destination records (half match).
+
+'''
+import sys
+import time
+import tracemalloc
+
+import kvutil
+
+
+def build_records(count, offset=0):
+    return [{'site': 'S{:03d}'.format(part % 997), 'part': part, 'desc': 'part {}'.format(part),
+             'qty': part % 50, 'price': part * 0.01} for part in range(offset, offset + count)]
+
+
+def traced_size(build):
+    '''
+    bytes allocated by build() that are still held when it returns
+    '''
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def measure_build(build):
+    start = time.perf_counter()
+    lookup = build()
+    seconds = time.perf_counter() - start
+    # built again under tracemalloc - tracing slows the build down
+    return lookup, seconds, traced_size(build)
+
+
+if __name__ == '__main__':
+    args = dict(x.split('=', 1) for x in sys.argv[1:])
+    count = int(args.get('count', 1000000))
+
+    src_data = build_records(count)
+    src_size = traced_size(lambda: build_records(count))
+    # half the destination records have a match
+    dst_template = build_records(count, offset=count // 2)
+    key_fields = ['site', 'part']
+    copy_fields = ['qty', 'price']
+
+    modes = (
+        ('nested', lambda: kvutil.create_multi_key_lookup(src_data, key_fields)),
+        ('flat', lambda: kvutil.create_flat_key_lookup(src_data, key_fields)),
+        ('flat+record store', lambda: kvutil.create_flat_key_lookup(src_data, key_fields, record_fields=copy_fields)),
+    )
+
+    print('{} source records ({:.1f} MB - released when only the record store is kept) - {} destination records'.format(
+        count, src_size / 1e6, count))
+    print('{:<20} {:>9} {:>11} {:>9} {:>11} {:>9}'.format('index', 'build s', 'index MB', 'copy s', 'unmatched s', 'matched'))
+    for label, build in modes:
+        lookup, build_seconds, size = measure_build(build)
+        dst_data = [dict(x) for x in dst_template]
+
+        start = time.perf_counter()
+        matched = kvutil.copy_matched_data(dst_data, lookup, key_fields, copy_fields)
+        copy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        unmatched = kvutil.extract_unmatched_data(dst_data, lookup, key_fields)
+        unmatched_seconds = time.perf_counter() - start
+        assert matched + len(unmatched) == count
+
+        print('{:<20} {:>9.2f} {:>11.1f} {:>9.2f} {:>11.2f} {:>9}'.format(label, build_seconds, size / 1e6, copy_seconds,
+                                                                         unmatched_seconds, matched))
+        del lookup, dst_data, unmatched
+
+# eof
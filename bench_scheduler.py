@@ -0,0 +1,67 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Benchmark the per cycle overhead of the cron way (a new python process for
+each script each cycle) against pool_scheduler (one process, the cycle
+functions called in place)
+
+    python bench_scheduler.py [count=10]
+
+Runs "count" cycles of pool and chk_log_update both ways in an empty
+directory (notify_backend=file - no messages go out, screenlogic output is
+empty) and reports the milliseconds per cycle.
+
+'''
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ARGS = ['notify_backend=file']
+
+
+def cron_cycle(cwd, env):
+    for script in ('pool.py', 'chk_log_update.py'):
+        subprocess.run([sys.executable, os.path.join(HERE, script)] + ARGS, cwd=cwd, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+
+if __name__ == '__main__':
+    args = dict(x.split('=', 1) for x in sys.argv[1:])
+    count = int(args.get('count', 10))
+
+    with tempfile.TemporaryDirectory() as cwd:
+        open(os.path.join(cwd, 'output.txt'), 'w').close()
+        env = dict(os.environ, PYTHONPATH=HERE)
+
+        start = time.perf_counter()
+        for _ in range(count):
+            cron_cycle(cwd, env)
+        cron_ms = (time.perf_counter() - start) * 1000 / count
+
+        # in place - the scheduler pays the imports once at startup
+        os.chdir(cwd)
+        sys.path.insert(0, HERE)
+        import pool_scheduler
+        # pool cycle without the screenlogic command - the cron loop above does not run it either
+        pool_options = pool_scheduler.ModuleOptions('pool', pool_scheduler.pool.optiondictconfig, ARGS)
+        tasks = pool_scheduler.build_tasks({'pool_interval_seconds': 0, 'chk_interval_seconds': 1, 'chk_jitter_seconds': 0,
+                                            'chk_args': ARGS})
+        funcs = [lambda: pool_scheduler.pool.run_pool_cycle(pool_options.get()), tasks[0].func]
+
+        start = time.perf_counter()
+        for _ in range(count):
+            for func in funcs:
+                func()
+        scheduler_ms = (time.perf_counter() - start) * 1000 / count
+        os.chdir(HERE)
+
+    print('{:<16} {:>12}'.format('mode', 'ms / cycle'))
+    print('{:<16} {:>12.1f}'.format('cron', cron_ms))
+    print('{:<16} {:>12.1f}'.format('pool_scheduler', scheduler_ms))
+
+# eof
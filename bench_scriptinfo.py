@@ -0,0 +1,82 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Benchmark kvutil.scriptinfo
+
+    python bench_scriptinfo.py [count=200] [depth=20]
+
+pool.py and chk_log_update.py call scriptinfo() at import time to name the
+log file and again in __main__ for loggingAppStart.  This reports the
+milliseconds per call of the original implementation (inspect.stack() -
+reads the source lines of every frame) and the current one (__main__ /
+sys.argv - saved after the first call) from "depth" nested frames, and
+the startup time saved by the two calls a run makes.
+
+'''
+import os
+import sys
+import time
+import inspect
+
+import kvutil
+
+
+def legacy_scriptinfo():
+    '''
+    scriptinfo as it was before it used __main__ and saved the answer
+    '''
+    trc = ''
+    for teil in inspect.stack():
+        # skip system calls
+        if teil[1].startswith("<"):
+            continue
+        if teil[1].upper().startswith(sys.exec_prefix.upper()):
+            continue
+        trc = teil[1]
+    scriptdir, trc = os.path.split(trc)
+    if not scriptdir:
+        scriptdir = os.getcwd()
+    return {"name": trc, "source": trc, "dir": scriptdir}
+
+
+def nested(depth, func):
+    if depth:
+        return nested(depth - 1, func)
+    return func()
+
+
+def time_calls(func, count, depth):
+    start = time.perf_counter()
+    for _ in range(count):
+        nested(depth, func)
+    return (time.perf_counter() - start) / count * 1000.0
+
+
+def first_call(depth):
+    kvutil._scriptinfo_cache = None
+    start = time.perf_counter()
+    nested(depth, kvutil.scriptinfo)
+    return (time.perf_counter() - start) * 1000.0
+
+
+if __name__ == '__main__':
+    args = dict(x.split('=', 1) for x in sys.argv[1:])
+    count = int(args.get('count', 200))
+    depth = int(args.get('depth', 20))
+
+    # the same answer both ways
+    assert legacy_scriptinfo()['name'] == kvutil.scriptinfo()['name'], (legacy_scriptinfo(), kvutil.scriptinfo())
+
+    legacy_ms = time_calls(legacy_scriptinfo, count, depth)
+    first_ms = first_call(depth)
+    cached_ms = time_calls(kvutil.scriptinfo, count, depth)
+
+    print('scriptinfo - {} calls from {} nested frames'.format(count, depth))
+    print('{:<28} {:>10.4f} ms/call'.format('legacy (inspect.stack)', legacy_ms))
+    print('{:<28} {:>10.4f} ms/call'.format('current first call', first_ms))
+    print('{:<28} {:>10.4f} ms/call'.format('current saved', cached_ms))
+    print('{:<28} {:>10.4f} ms/run'.format('startup saved (2 calls)', 2 * legacy_ms - first_ms - cached_ms))
+
+# eof
@@ -1,7 +1,7 @@
 '''
 @author:   Ken Venner
 @contact:  ken@venerllc.com
-@version:  1.01
+@version:  1.10
 
 Check the directory where log files are saved to validate they are 
 updated within the window we expect - check the age of the 
@@ -16,8 +16,17 @@ import logging
 import re
 import datetime
 import kvutil
-import kvgmailsendsimple
-import pprint
+import kvdate
+import kvnotifier
+import kvlogscan
+import kvmetrics
+import kvwatch
+import time
+import stat
+import queue
+import threading
+import fnmatch
+import glob
 
 # CONSTANTS
 DAY_SECONDS = 60 * 60 * 24
@@ -57,7 +66,7 @@ logger = logging.getLogger(__name__)
 # application variables
 optiondictconfig = {
     'AppVersion' : {
-        'value': '1.04',
+        'value': '1.10',
         'description' : 'defines the version number for the app',
     },
     'debug' : {
@@ -80,7 +89,8 @@ optiondictconfig = {
                 'fname': 'G:/My Drive/VillaRaspi/pool_temps.csv',
                 'max_age_seconds': FOUR_HOUR_SECONDS,
                 'lock_fname': 'pool_temps.lck',
-                'max_lock_age_seconds': EIGHT_HOUR_SECONDS
+                'max_lock_age_seconds': EIGHT_HOUR_SECONDS,
+                'content_timestamp': True,
             },
             {
                 'fname': 'G:/My Drive/VillaRaspi/villatemps.txt',
@@ -90,7 +100,24 @@ optiondictconfig = {
             },
         ],
         'type': 'list',
-        'description': 'list of file records that we will process',
+        'description': 'list of file records that we will process - each record has one of fname, glob (with select: newest/all) or dir'
+                       ' - content_timestamp: True judges age on the timestamp in the last line (timestamp_column, delimiter, timestamp_format)',
+    },
+    'log_checks': {
+        'value': [],
+        'type': 'list',
+        'description': 'list of log file records scanned for error lines - keys: log_fname, lock_fname, max_lock_age_seconds,'
+                       ' patterns (list of dicts with regex, name, threshold (default 1), window_seconds (default 1 hour))'
+                       ' eg. {"log_fname": "pool.log", "patterns": [{"name": "traceback", "regex": "Traceback"}], ...}',
+    },
+    'log_checkpoint_filename' : {
+        'value' : 'chk_log_update_logscan.json',
+        'description' : 'defines the file holding the offset we have scanned each log_checks file to',
+    },
+    'log_scan_max_bytes' : {
+        'value' : 10 * 1024 * 1024,
+        'type'  : 'int',
+        'description' : 'defines the most bytes read from one log file in a run - the rest is read next run',
     },
     'email_from' : {
         'value' : '210608thSt@gmail.com',
@@ -120,6 +147,93 @@ optiondictconfig = {
         'value' : None,
         'description' : 'defines the gmail filename of the json file that contains the account credentials ',
     },
+    'notify_backend' : {
+        'value' : 'gmail',
+        'type'  : 'inlist',
+        'valid' : ['gmail', 'smtp', 'file'],
+        'description' : 'defines how messages are delivered - see kvnotifier.py',
+    },
+    'smtp_host' : {
+        'value' : 'localhost',
+        'description' : 'defines the smtp server used when notify_backend is smtp',
+    },
+    'smtp_port' : {
+        'value' : 25,
+        'type'  : 'int',
+        'description' : 'defines the smtp server port used when notify_backend is smtp',
+    },
+    'smtp_user' : {
+        'value' : None,
+        'description' : 'defines the smtp login user (not set - no login)',
+    },
+    'smtp_password' : {
+        'value' : None,
+        'description' : 'defines the smtp login password',
+    },
+    'smtp_starttls' : {
+        'value' : False,
+        'type'  : 'bool',
+        'description' : 'defines if we issue starttls on the smtp connection',
+    },
+    'notify_filename' : {
+        'value' : 'chk_log_update_messages.txt',
+        'description' : 'defines the file messages are appended to when notify_backend is file',
+    },
+    'stat_workers' : {
+        'value' : 16,
+        'type'  : 'int',
+        'description' : 'defines the number of threads used to check the check_files at the same time',
+    },
+    'stat_timeout_seconds' : {
+        'value' : 30,
+        'type'  : 'int',
+        'description' : 'defines the seconds we wait on each file check (from when it starts) before reporting it could not be checked',
+    },
+    'daemon' : {
+        'value' : False,
+        'type'  : 'bool',
+        'description' : 'defines if we stay running and watch the check_files directories instead of checking once',
+    },
+    'daemon_tick_seconds' : {
+        'value' : 1.0,
+        'type'  : 'float',
+        'description' : 'defines the resolution of the staleness timers when running as a daemon',
+    },
+    'daemon_poll_seconds' : {
+        'value' : 60,
+        'type'  : 'int',
+        'description' : 'defines the directory scan interval when running as a daemon where inotify is not available',
+    },
+    'daemon_refresh_seconds' : {
+        'value' : 3600,
+        'type'  : 'int',
+        'description' : 'defines how often the daemon refreshes the notifier token',
+    },
+    'daemon_log_scan_seconds' : {
+        'value' : 60,
+        'type'  : 'int',
+        'description' : 'defines how often the daemon scans the log_checks files (0 - every tick)',
+    },
+    'daemon_metrics_seconds' : {
+        'value' : 60,
+        'type'  : 'int',
+        'description' : 'defines the most seconds between metrics_filename writes when running as a daemon (the file ages keep moving with no file changes)',
+    },
+    'daemon_resolve_seconds' : {
+        'value' : 300,
+        'type'  : 'int',
+        'description' : 'defines how often the daemon matches the glob/dir check_files records against the directories again'
+                        ' and tries the directories it could not watch again',
+    },
+    'notify_digest' : {
+        'value' : True,
+        'type'  : 'bool',
+        'description' : 'defines if all stale/missing files found in a run are reported in one message (False - one message per file)',
+    },
+    'metrics_filename' : {
+        'value' : 'chk_log_update.prom',
+        'description' : 'defines the prometheus textfile the run metrics are written to (not set - no metrics)',
+    },
 }
 
 ### GLOBAL VARIABLES AND CONVERSIONS ###
@@ -148,7 +262,314 @@ def check_file_writable(fnm):
     return os.access(pdir, os.W_OK)
 
 
-def message_on_file_too_old(fname, max_age_seconds, lock_fname, max_lock_age_seconds, optiondict):
+def send_message(optiondict, email_from, email_to, email_subject, email_body):
+    '''
+    send a message through the notifier backend defined in optiondict (notify_backend)
+    returns the dict with the 'id' of the message sent - None when it could not be sent
+    '''
+    notifier = kvnotifier.notifier_from_optiondict(optiondict)
+    return notifier.send(email_from, email_to, email_subject, email_body)
+
+
+def stat_regular_file(fname):
+    '''
+    one os.stat of fname - returns the stat result if fname is a regular file, otherwise None
+    the stat result answers both "does it exist" and "how old is it"
+    '''
+    if not fname:
+        return None
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st
+
+
+def content_options(rec):
+    '''
+    the settings used to read the timestamp from the last line of the file
+    returns None when this record is judged on the file modified time
+    '''
+    if not rec.get('content_timestamp'):
+        return None
+    return {
+        'timestamp_column': rec.get('timestamp_column', 0),
+        'delimiter': rec.get('delimiter', ','),
+        'timestamp_format': rec.get('timestamp_format'),
+    }
+
+
+def content_timestamp(fname, content):
+    '''
+    read the last line of fname (from the end of the file - the cost does not
+    grow with the file) and return the timestamp in it as seconds since the epoch
+
+    content - dict from content_options()
+    returns None if the last line has no timestamp we can parse
+    '''
+    try:
+        line = kvutil.read_last_line(fname)
+    except (OSError, UnicodeDecodeError) as e:
+        logger.warning('Unable to read last line of %s:%s', fname, e)
+        return None
+
+    fields = line.split(content['delimiter'])
+    if content['timestamp_column'] >= len(fields):
+        logger.warning('Last line of %s has no column %s:%s', fname, content['timestamp_column'], line)
+        return None
+    value = fields[content['timestamp_column']].strip().strip('"')
+
+    try:
+        if content['timestamp_format']:
+            dt = datetime.datetime.strptime(value, content['timestamp_format'])
+        else:
+            dt = kvdate.datetime_from_str(value)
+    except Exception as e:
+        # a header only file or a partially written line
+        logger.warning('Unable to parse timestamp [%s] in last line of %s:%s', value, fname, e)
+        return None
+    return dt.timestamp()
+
+
+def stat_check_file(fname, lock_fname, candidates=None, content=None):
+    '''
+    stat the file of interest and its lock file
+    returns dict with keys:  fname (stat or None), lock (stat or None), error (None or string),
+                             path (the file the fname stat belongs to),
+                             content_ts (timestamp read from the last line or None)
+
+    candidates - when set (glob record selecting the newest file) the newest of
+                 these files is the file of interest
+    content - when set (see content_options) the timestamp in the last line of the file is read
+    '''
+    stats = {
+        'lock': stat_regular_file(lock_fname),
+        'fname': None,
+        'path': fname,
+        'error': None,
+        'content_ts': None,
+    }
+    if candidates is None:
+        stats['fname'] = stat_regular_file(fname)
+    else:
+        # pick the newest of the files matching the pattern
+        for candidate in candidates:
+            st = stat_regular_file(candidate)
+            if st and (stats['fname'] is None or st.st_mtime > stats['fname'].st_mtime):
+                stats['fname'] = st
+                stats['path'] = candidate
+
+    if content and stats['fname']:
+        stats['content_ts'] = content_timestamp(stats['path'], content)
+    return stats
+
+
+def check_timestamp(stats):
+    '''
+    the time the file of interest was last updated - the timestamp in its
+    last line when we read one, otherwise its modified time
+    '''
+    if stats.get('content_ts') is not None:
+        return stats['content_ts']
+    return stats['fname'].st_mtime
+
+
+def check_lock_fname(rec, fname):
+    '''
+    lock file used for one file of a directory/glob record checking every file
+    '''
+    if rec.get('lock_fname'):
+        lock_base, lock_ext = os.path.splitext(rec['lock_fname'])
+    else:
+        lock_base, lock_ext = os.path.splitext(os.path.basename(rec.get('glob') or rec['dir']))[0], '.lck'
+    return lock_base + '-' + os.path.basename(fname) + (lock_ext or '.lck')
+
+
+def resolve_check_files(check_files):
+    '''
+    convert the check_files records into the list of records we stat and check
+
+    a record is one of:
+        fname - check this one file
+        glob - check the files matching this pattern (eg. logs/*.csv)
+               select: newest (default) - the newest matching file must be younger than max_age_seconds
+               select: all - every matching file must be younger than max_age_seconds
+        dir - check every file in this directory (same as glob dir/* with select all)
+
+    files are resolved with one scandir of each directory (kvutil.filename_glob)
+
+    returned records always have fname (the file or the pattern) and lock_fname
+    newest records carry the list of matching files in candidates
+    '''
+    resolved = []
+    for rec in check_files:
+        if 'fname' in rec:
+            resolved.append(rec)
+            continue
+
+        if 'glob' in rec:
+            pattern = rec['glob']
+            select = rec.get('select', 'newest')
+        elif 'dir' in rec:
+            pattern = os.path.join(rec['dir'], '*')
+            select = rec.get('select', 'all')
+        else:
+            logger.error('check_files record has no fname, glob or dir:%s', rec)
+            raise Exception(u'check_files record has no fname, glob or dir:{}'.format(rec))
+
+        matches = sorted(kvutil.filename_glob(pattern, files_only=True))
+
+        if select == 'newest' or not matches:
+            # one check - no match is reported as the pattern not existing
+            resolved.append(dict(rec, fname=pattern, pattern=pattern, candidates=matches))
+        elif select == 'all':
+            for fname in matches:
+                resolved.append(dict(rec, fname=fname, lock_fname=check_lock_fname(rec, fname)))
+        else:
+            logger.error('check_files record select must be newest or all:%s', rec)
+            raise Exception(u'check_files record select must be newest or all:{}'.format(rec))
+
+    return resolved
+
+
+def stat_check_files(check_files, max_workers=16, timeout=30):
+    '''
+    stat every check_files record on max_workers threads so slow network/synced paths
+    are waited on at the same time instead of one after the other - the threads are
+    daemon threads so a stat hung on a network path does not hold up the process exit
+
+    check_files - list of records with keys fname, lock_fname
+    max_workers - max number of threads stat-ing at once
+    timeout - seconds we wait for each record from the time its check starts - records that do
+              not answer get error 'timeout'.  A record still waiting for a thread when every
+              thread could have used up its timeout (timeout * records / threads) gets 'timeout' too
+
+    returns list of stat dicts (see stat_check_file) in the same order as check_files
+    '''
+    results = [None] * len(check_files)
+    if not check_files:
+        return results
+
+    workers = max(1, min(max_workers, len(check_files)))
+
+    # records waiting for a thread
+    work = queue.Queue()
+    for idx in range(len(check_files)):
+        work.put(idx)
+    # when each check got a thread - its timeout counts from then
+    started = [None] * len(check_files)
+    # (stat dict, exception) of each check that finished
+    outcomes = [None] * len(check_files)
+    finished = threading.Condition()
+
+    def stat_worker():
+        while True:
+            try:
+                idx = work.get_nowait()
+            except queue.Empty:
+                return
+            rec = check_files[idx]
+            started[idx] = time.monotonic()
+            try:
+                outcome = (stat_check_file(rec['fname'], rec['lock_fname'], rec.get('candidates'), content_options(rec)), None)
+            except Exception as e:
+                outcome = (None, e)
+            with finished:
+                outcomes[idx] = outcome
+                finished.notify()
+
+    # daemon threads - a stat hung on a network path can not hold up the exit of the process
+    for cnt in range(workers):
+        threading.Thread(target=stat_worker, name='stat_{}'.format(cnt), daemon=True).start()
+
+    # a queue of records that each time out can not take longer than this
+    last_deadline = time.monotonic() + timeout * -(-len(check_files) // workers)
+    pending = set(range(len(check_files)))
+    with finished:
+        while pending:
+            now = time.monotonic()
+            for idx in sorted(pending):
+                if outcomes[idx] is not None:
+                    if outcomes[idx][1] is not None:
+                        raise outcomes[idx][1]
+                    results[idx] = outcomes[idx][0]
+                elif now >= last_deadline or (started[idx] is not None and now >= started[idx] + timeout):
+                    logger.warning('Timed out after %s seconds checking file:%s', timeout, check_files[idx]['fname'])
+                    results[idx] = {'lock': None, 'fname': None, 'path': check_files[idx]['fname'], 'error': 'timeout',
+                                    'content_ts': None}
+                else:
+                    continue
+                pending.discard(idx)
+            if pending:
+                # wake on the next result or the next deadline (a check starting now times out no sooner than now + timeout)
+                deadlines = [last_deadline] + [now + timeout if started[idx] is None else started[idx] + timeout for idx in pending]
+                finished.wait(max(0.0, min(deadlines) - time.monotonic()))
+
+    # records not started are not checked - the idle threads stop and a hung thread finishes on its own
+    try:
+        while True:
+            work.get_nowait()
+    except queue.Empty:
+        pass
+    return results
+
+
+def format_age(seconds):
+    '''
+    seconds as a readable age - eg. 1d 04h 10m
+    '''
+    minutes = int(seconds // 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return '{}d {:02d}h {:02d}m'.format(days, hours, minutes)
+    return '{}h {:02d}m'.format(hours, minutes)
+
+
+def evaluate_file_age(fname, max_age_seconds, lock_fname, max_lock_age_seconds, stats, now_ts):
+    '''
+    decide if a message is due on this file
+
+    a message is not due if the lock file (the last message we sent on this file)
+    is younger than max_lock_age_seconds or the file is younger than max_age_seconds
+
+    returns None if no message is due - otherwise dict with keys:
+        fname, lock_fname
+        problem - unable to check (error), does not exist, got stale
+        age_seconds - age of the file (None when we have no age)
+    '''
+    # LOCK FILE - we messaged on this file recently
+    if stats['lock'] and now_ts - stats['lock'].st_mtime < max_lock_age_seconds:
+        return None
+
+    finding = {'fname': fname, 'lock_fname': lock_fname, 'age_seconds': None}
+
+    if stats['error']:
+        # we could not get an answer on this file in time
+        finding['problem'] = 'unable to check (' + stats['error'] + ')'
+    elif not stats['fname']:
+        finding['problem'] = 'does not exist'
+    else:
+        # capture the age of the file of interest
+        finding['age_seconds'] = now_ts - check_timestamp(stats)
+        if finding['age_seconds'] < max_age_seconds:
+            return None
+        finding['problem'] = 'got stale'
+
+    return finding
+
+
+def create_lock_file(finding):
+    '''
+    the lock file holds off the next message on this file for max_lock_age_seconds
+    '''
+    with open(finding['lock_fname'], 'w') as lock_file:
+        lock_file.write('file ' + finding['problem'])
+
+
+def message_on_file_too_old(fname, max_age_seconds, lock_fname, max_lock_age_seconds, optiondict, stats=None, content=None):
     ''' 
     check to see if we have notified on aging file - by checking for lock file
         if lock file exists, check its age and see if it has exceeded its age
@@ -163,80 +584,486 @@ def message_on_file_too_old(fname, max_age_seconds, lock_fname, max_lock_age_sec
     and values from optiondict:
         scopes, file_token_json, file_credentials_json
     create a new/updated lock file
-    '''
-
-    msgid = None
 
-    # LOCK FILE
-    if lock_fname and os.path.isfile(lock_fname):
-        # if there is a lock file - capture the informatoin about this lock file
-        lock_days, lock_seconds = modification_days_and_seconds(lock_fname)
+    stats - the stat dict from stat_check_files() - when not passed we stat the files here
+    content - when set (see content_options) the age is taken from the timestamp in the last line
+    '''
 
-        # log message
-        # logger.info('Lock file age %s is not older than %s', lock_seconds, max_lock_age_seconds)
-
-        # check age of the lock file
-        if lock_seconds < max_lock_age_seconds:
-            return
-
-    # Get the age of the file of interest
-    if not os.path.isfile(fname):
-        # send message that file does not exist
-        msgid = kvgmailsendsimple.gmail_send_simple_message(
-            optiondict['email_from'],
-            optiondict['email_to'],
-            optiondict['email_subject']+fname+'-does not exist',
-            optiondict['email_body']+fname+'-does not exist',
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
-        )
-
-        # create the lock file
-        with open(lock_fname, 'w') as lock_file:
-            lock_file.write('file does not exist')
-            
-        # log message
-        logger.info('File is missing - sent message: %s and created file: %s', msgid['id'], fname)
+    # one stat per path - reused for existence and age
+    if stats is None:
+        stats = stat_check_file(fname, lock_fname, content=content)
 
-        # done - so return
+    finding = evaluate_file_age(fname, max_age_seconds, lock_fname, max_lock_age_seconds, stats, time.time())
+    if not finding:
         return
-    
-    # if there is a lock file - capture the informatoin about this lock file
-    fname_days, fname_seconds = modification_days_and_seconds(fname)
 
-    # check age of the lock file
-    if fname_seconds < max_age_seconds:
-        return
+    # return back the message id
+    return message_on_finding(finding, optiondict)
 
-    # we have aged out on the file and we have aged out on the last message sent
-    # send message that file does not exist
-    msgid = kvgmailsendsimple.gmail_send_simple_message(
+
+def message_on_finding(finding, optiondict):
+    '''
+    send the message on one finding (see evaluate_file_age) and create its lock file
+    '''
+    msgid = send_message(
+        optiondict,
         optiondict['email_from'],
         optiondict['email_to'],
-        optiondict['email_subject']+fname+'-got stale',
-        optiondict['email_body']+fname+'-got stale',
-        optiondict['scopes'],
-        optiondict['file_token_json'],
-        optiondict['file_credentials_json']
+        optiondict['email_subject']+finding['fname']+'-'+finding['problem'],
+        optiondict['email_body']+finding['fname']+'-'+finding['problem']
     )
 
     # create the lock file
-    with open(lock_fname, 'w') as lock_file:
-        lock_file.write('file does not exist')
-        
+    create_lock_file(finding)
+
+    # log message
+    logger.info('File %s - sent message: %s and created file: %s', finding['problem'], kvnotifier.message_id(msgid), finding['lock_fname'])
+
+    return msgid
+
+
+def message_digest_on_files_too_old(check_files, check_stats, optiondict, now_ts=None, log_findings=None):
+    '''
+    evaluate every file first and send one message listing every file
+    that is stale, missing or could not be checked
+
+    each file keeps its own lock file - a file inside its re-notify window
+    (max_lock_age_seconds) is left out of the digest
+
+    check_files - resolved check records
+    check_stats - stat dicts in the same order (see stat_check_files)
+    log_findings - findings from scan_log_checks() reported in the same digest
+
+    returns the message id dict - None if no message was due
+    '''
+    if now_ts is None:
+        now_ts = time.time()
+
+    findings = []
+    for rec, stats in zip(check_files, check_stats):
+        finding = evaluate_file_age(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], stats, now_ts)
+        if finding:
+            findings.append(finding)
+    findings.extend(log_findings or [])
+
+    if not findings:
+        return None
+
+    lines = []
+    for finding in findings:
+        if finding['age_seconds'] is None:
+            lines.append('{} - {}'.format(finding['fname'], finding['problem']))
+        else:
+            lines.append('{} - {} - age {}'.format(finding['fname'], finding['problem'], format_age(finding['age_seconds'])))
+
+    if len(findings) == 1:
+        # same subject as the single file message
+        subject = optiondict['email_subject'] + findings[0]['fname'] + '-' + findings[0]['problem']
+    elif log_findings:
+        subject = optiondict['email_subject'] + '{} file alerts'.format(len(findings))
+    else:
+        subject = optiondict['email_subject'] + '{} files stale or missing'.format(len(findings))
+
+    msgid = send_message(
+        optiondict,
+        optiondict['email_from'],
+        optiondict['email_to'],
+        subject,
+        optiondict['email_body'] + 'results:\n' + '\n'.join(lines)
+    )
+
+    # each file gets its own re-notify window
+    for finding in findings:
+        create_lock_file(finding)
+
     # log message
-    logger.info('File and lock are too old - sent message: %s and created file: %s', msgid['id'], fname)
+    logger.info('Sent digest message: %s covering %d files:%s', kvnotifier.message_id(msgid), len(findings), [x['fname'] for x in findings])
 
-    # return back the message id or none
     return msgid
+
+
+def check_messages(check_files, check_stats, optiondict, log_findings=None):
+    '''
+    send the messages due on these files - one digest (notify_digest) or one message per file
+    '''
+    if optiondict.get('notify_digest'):
+        message_digest_on_files_too_old(check_files, check_stats, optiondict, log_findings=log_findings)
+        return
+    for rec, stats in zip(check_files, check_stats):
+        message_on_file_too_old(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], optiondict, stats)
+    for finding in log_findings or []:
+        message_on_finding(finding, optiondict)
+
+
+def evaluate_log_check(rec, result, scanner, now_ts):
+    '''
+    decide if a message is due on a log_checks record after its scan
+
+    a pattern alerts when the lines it matched in the last window_seconds
+    reach its threshold - the lock file holds off the next message for
+    max_lock_age_seconds
+
+    returns None if no message is due - otherwise a finding (see evaluate_file_age)
+    '''
+    finding = {'fname': rec['log_fname'], 'lock_fname': rec['lock_fname'], 'age_seconds': None}
+
+    if result['error']:
+        finding['problem'] = 'unable to scan (' + result['error'] + ')'
+    else:
+        # rates are captured even inside the lock window (metrics)
+        alerts = []
+        for pattern in rec['patterns']:
+            if isinstance(pattern, str):
+                pattern = {'regex': pattern}
+            name = pattern.get('name', pattern['regex'])
+            window_seconds = pattern.get('window_seconds', 3600)
+            count = scanner.rate(rec['log_fname'], name, window_seconds)
+            result['rates'][name] = count
+            if count >= pattern.get('threshold', 1):
+                alerts.append('{} x{} in {}'.format(name, count, format_age(window_seconds)))
+        if not alerts:
+            return None
+        finding['problem'] = 'logged errors (' + ', '.join(alerts) + ')'
+
+    # LOCK FILE - we messaged on this log recently
+    lock_stat = stat_regular_file(rec['lock_fname'])
+    if lock_stat and now_ts - lock_stat.st_mtime < rec['max_lock_age_seconds']:
+        return None
+    return finding
+
+
+def scan_log_checks(log_checks, optiondict):
+    '''
+    scan each log_checks file from its checkpoint - only the bytes appended
+    since the last run are read
+
+    returns (list of findings (see evaluate_log_check), list of scan results in log_checks order)
+    '''
+    findings = []
+    results = []
+    if not log_checks:
+        return findings, results
+
+    scanner = kvlogscan.LogScanner(optiondict['log_checkpoint_filename'], optiondict.get('log_scan_max_bytes'))
+    now_ts = time.time()
+    for rec in log_checks:
+        result = scanner.scan(rec['log_fname'], rec['patterns'])
+        result['rates'] = {}
+        logger.info('Scanned %s bytes (%s lines) of %s - matches:%s', result['bytes_read'], result['lines'], rec['log_fname'], result['matches'])
+        finding = evaluate_log_check(rec, result, scanner, now_ts)
+        if finding:
+            findings.append(finding)
+        results.append(result)
+
+    # the checkpoint moves forward only after every file was scanned
+    scanner.save()
+    return findings, results
+
+
+def add_log_metrics(metrics, log_checks, results):
+    '''
+    add the log scan bytes and error rates to the metrics registry
+    '''
+    for rec, result in zip(log_checks, results):
+        labels = {'file': rec['log_fname']}
+        metrics.gauge('log_bytes_scanned', result['bytes_read'], labels, 'bytes of the log file read this run')
+        metrics.gauge('log_rotated', result['rotated'], labels, '1 if the log file was rotated since the last run')
+        for name, count in result['rates'].items():
+            metrics.gauge('log_pattern_matches', count, dict(labels, pattern=name),
+                          'lines matching the pattern within its window_seconds')
+
+
+def add_check_metrics(metrics, check_files, check_stats, now_ts=None):
+    '''
+    add the age of every checked file and lock file to the metrics registry
+    '''
+    if now_ts is None:
+        now_ts = time.time()
+    for rec, stats in zip(check_files, check_stats):
+        labels = {'file': rec['fname']}
+        metrics.gauge('check_error', bool(stats['error']), labels, '1 if the file could not be checked in time')
+        metrics.gauge('file_exists', bool(stats['fname']), labels, '1 if the file exists')
+        metrics.gauge('file_age_seconds', now_ts - check_timestamp(stats) if stats['fname'] else None, labels,
+                      'seconds since the file (or the newest matching file) was last updated')
+        metrics.gauge('max_age_seconds', rec['max_age_seconds'], labels, 'age at which the file is stale')
+        metrics.gauge('lock_age_seconds', now_ts - stats['lock'].st_mtime if stats['lock'] else None,
+                      {'file': rec['fname'], 'lock_fname': rec['lock_fname']},
+                      'seconds since we last messaged about this file (NaN - no lock file)')
+
+
+def refresh_check_stats(rec):
+    '''
+    stat one resolved check record - a glob record selecting the newest file
+    is matched against the directory again first (files come and go)
+    '''
+    candidates = None
+    if 'pattern' in rec:
+        candidates = sorted(kvutil.filename_glob(rec['pattern'], files_only=True))
+    return stat_check_file(rec['fname'], rec['lock_fname'], candidates, content_options(rec))
+
+
+def daemon_watch_dirs(key):
+    '''
+    the directories the daemon watches for a resolved check record (key - absolute fname or pattern)
+
+    a pattern with a wildcard in its directory part (eg. logs/*/data.csv) watches the
+    directories it matches now plus the fixed parent above the wildcard (logs) so a new
+    matching directory is seen
+    '''
+    dirname = os.path.dirname(key)
+    if not glob.has_magic(dirname):
+        return [dirname]
+    fixed = []
+    for part in dirname.split(os.sep):
+        if glob.has_magic(part):
+            break
+        fixed.append(part)
+    return [os.sep.join(fixed) or os.sep] + sorted(x for x in glob.glob(dirname) if os.path.isdir(x))
+
+
+def run_daemon(optiondict, max_loops=None):
+    '''
+    stay running and check the check_files as they change instead of polling them
+
+    the parent directories of check_files are watched (inotify on linux, a directory
+    scan every daemon_poll_seconds elsewhere) - a file is only stat'ed when it changes.
+    each file has a timer in a timer wheel set to last write + max_age_seconds and
+    the staleness check runs when that timer fires.  after a check the timer is set
+    to come back after max_lock_age_seconds (the re-notify window) unless the file
+    is written first - when the check finds the file fresh (a write we did not see) the
+    timer goes back to last write + max_age_seconds.
+
+    glob and dir records are matched against the directories again when a new file
+    matching them (or a new directory) shows up and every daemon_resolve_seconds - files
+    created after the daemon started are watched and checked too.
+
+    the log_checks files are scanned every daemon_log_scan_seconds - their findings go
+    out with the checks that expire in the same loop.
+
+    metrics_filename is written after a loop that saw file changes, expired checks or a
+    log scan - and at least every daemon_metrics_seconds so the ages stay current.
+
+    max_loops - stop after this many wait loops (used for testing)
+
+    returns the dict of last write times we hold for each file
+    '''
+    # lookup from the resolved records (absolute fname or pattern) to the record we check
+    # and from each watched directory to the records whose files land in it
+    checks = {}
+    watched = {}
+    # absolute patterns of the glob/dir records - a new file matching one is a new record
+    patterns = [os.path.abspath(x['glob'] if 'glob' in x else os.path.join(x['dir'], '*'))
+                for x in optiondict['check_files'] if 'fname' not in x]
+
+    def resolve():
+        checks.clear()
+        watched.clear()
+        for rec in resolve_check_files(optiondict['check_files']):
+            key = os.path.abspath(rec['fname'])
+            checks[key] = rec
+            for dirname in daemon_watch_dirs(key):
+                watched.setdefault(dirname, set()).add(key)
+
+    resolve()
+    watcher = kvwatch.DirectoryWatcher(list(watched.keys()), poll_seconds=optiondict['daemon_poll_seconds'])
+    wheel = kvwatch.TimerWheel(optiondict['daemon_tick_seconds'])
+
+    # last write time and last stat dict of each file we are watching
+    last_write = {}
+    last_stats = {}
+    # results of the last log_checks scan
+    log_results = []
+
+    def schedule(key, stats=None):
+        if stats is None:
+            stats = refresh_check_stats(checks[key])
+        last_stats[key] = stats
+        last_write[key] = check_timestamp(stats) if stats['fname'] else None
+        if last_write[key] is None:
+            # missing file - check now
+            wheel.schedule(key, time.time())
+        else:
+            wheel.schedule(key, last_write[key] + checks[key]['max_age_seconds'])
+
+    def keys_for_event(dirname, name):
+        path = os.path.join(dirname, name) if name else None
+        for key in watched.get(dirname, ()):
+            if name is None or path == key or ('pattern' in checks[key] and fnmatch.fnmatch(path, key)):
+                yield key
+
+    def is_new_match(dirname, name):
+        # a file we do not check yet that a glob/dir record matches - or a directory a pattern may match
+        path = os.path.join(dirname, name)
+        return any(fnmatch.fnmatch(path, x) for x in patterns) or os.path.isdir(path)
+
+    def add_watch_dirs():
+        # directories not watched yet (new or could not be watched before) - their files are stat'ed again
+        for dirname in watched:
+            if dirname not in watcher.dirs and watcher.add_dir(dirname):
+                for key in watched[dirname]:
+                    schedule(key)
+
+    def re_resolve():
+        before = set(checks)
+        resolve()
+        add_watch_dirs()
+        for key in before - set(checks):
+            # the file went away - no longer a record of a glob/dir
+            wheel.cancel(key)
+            last_write.pop(key, None)
+            last_stats.pop(key, None)
+        for key in checks:
+            # new files and the newest-file patterns (their candidates changed)
+            if key not in before or 'pattern' in checks[key]:
+                schedule(key)
+        logger.info('Daemon matched the check_files again - watching %d files in %d directories', len(checks), len(watched))
+
+    def write_metrics():
+        # ages as of now from the last stat of each file - the notify counts are for the life of the daemon
+        metrics = kvmetrics.MetricsRegistry('chk_log_update_')
+        keys = list(checks)
+        add_check_metrics(metrics, [checks[key] for key in keys], [last_stats[key] for key in keys])
+        add_log_metrics(metrics, optiondict['log_checks'], log_results)
+        kvmetrics.add_notify_metrics(metrics)
+        metrics.write(optiondict['metrics_filename'])
+
+    # initial state of every file
+    for key in checks:
+        schedule(key)
+
+    logger.info('Daemon started - watching %d files in %d directories (%s)', len(checks), len(watched), watcher.mode)
+
+    next_refresh = time.time() + optiondict['daemon_refresh_seconds']
+    next_resolve = time.time() + optiondict['daemon_resolve_seconds']
+    # the first scan and metrics write are on the first loop
+    next_log_scan = time.time()
+    next_metrics = time.time()
+    loops = 0
+    try:
+        while max_loops is None or loops < max_loops:
+            loops += 1
+
+            # wait for file changes - at most one tick so timers fire on time
+            # (name None means events were lost - restat everything in that directory)
+            keys = set()
+            new_match = False
+            for dirname, name in watcher.read_events(timeout=optiondict['daemon_tick_seconds']):
+                event_keys = set(keys_for_event(dirname, name))
+                keys.update(event_keys)
+                if patterns and (name is None or (not event_keys and is_new_match(dirname, name))):
+                    new_match = True
+
+            now_ts = time.time()
+            changed = bool(keys)
+            if patterns and (new_match or now_ts >= next_resolve):
+                changed = True
+                re_resolve()
+                next_resolve = now_ts + optiondict['daemon_resolve_seconds']
+            elif now_ts >= next_resolve:
+                # try the directories we could not watch again
+                add_watch_dirs()
+                next_resolve = now_ts + optiondict['daemon_resolve_seconds']
+            for key in keys:
+                if key in checks:
+                    schedule(key)
+
+            # read what was added to the log files - on its own timer
+            now_ts = time.time()
+            log_findings = []
+            if optiondict['log_checks'] and now_ts >= next_log_scan:
+                log_findings, log_results = scan_log_checks(optiondict['log_checks'], optiondict)
+                next_log_scan = now_ts + optiondict['daemon_log_scan_seconds']
+                changed = True
+
+            # run the checks whose timers have expired
+            # (checks that expire together are reported together)
+            expired = wheel.advance(now_ts)
+            if expired or log_findings:
+                recs = [checks[key] for key in expired]
+                stats = [refresh_check_stats(rec) for rec in recs]
+                check_messages(recs, stats, optiondict, log_findings)
+                for key, rec, rec_stats in zip(expired, recs, stats):
+                    # the message may have created the lock file
+                    rec_stats['lock'] = stat_regular_file(rec['lock_fname'])
+                    last_stats[key] = rec_stats
+                    if rec_stats['fname'] and check_timestamp(rec_stats) + rec['max_age_seconds'] > now_ts:
+                        # fresh - we missed the write - check again when it can next go stale
+                        schedule(key, rec_stats)
+                    else:
+                        # come back after the re-notify window - a write to the file reschedules sooner
+                        wheel.schedule(key, now_ts + rec['max_lock_age_seconds'])
+                changed = True
+
+            # write the metrics for the node exporter
+            if optiondict['metrics_filename'] and (changed or now_ts >= next_metrics):
+                write_metrics()
+                next_metrics = now_ts + optiondict['daemon_metrics_seconds']
+
+            # keep the token current
+            if now_ts >= next_refresh:
+                kvnotifier.notifier_from_optiondict(optiondict).refresh(optiondict['email_from'])
+                next_refresh = now_ts + optiondict['daemon_refresh_seconds']
+    except KeyboardInterrupt:
+        logger.info('Daemon stopped by keyboard interrupt')
+    finally:
+        watcher.close()
+
+    return last_write
     
     
+# ---------------------------------------------------------------------------
+def run_check_cycle(optiondict):
+    '''
+    one check of the check_files and log_checks - message on the stale/missing files and
+    log errors and write the metrics
+
+    called once when chk_log_update.py is run (not daemon) and every cycle by pool_scheduler.py
+    '''
+    # the notify metrics are for this cycle
+    kvnotifier.reset_send_stats()
+
+    # refresh the token - always do this as we don't always send an email
+    kvnotifier.notifier_from_optiondict(optiondict).refresh(optiondict['email_from'])
+    # log message
+    logger.info('Refreshed the %s token', optiondict['notify_backend'])
+
+    # time each stage of the run
+    metrics = kvmetrics.MetricsRegistry('chk_log_update_')
+
+    # expand directory and glob records into the files to check
+    with metrics.stage('resolve'):
+        check_files = resolve_check_files(optiondict['check_files'])
+
+    # stat all the files at the same time
+    with metrics.stage('stat'):
+        check_stats = stat_check_files(check_files, optiondict['stat_workers'], optiondict['stat_timeout_seconds'])
+
+    # read what was added to the log files since the last run
+    with metrics.stage('log_scan'):
+        log_findings, log_results = scan_log_checks(optiondict['log_checks'], optiondict)
+
+    # message on the files that are stale or missing
+    with metrics.stage('check'):
+        check_messages(check_files, check_stats, optiondict, log_findings)
+
+    # release any connection held by the notifier
+    with metrics.stage('notify_close'):
+        kvnotifier.close_notifiers()
+
+    # write the metrics for the node exporter - lock ages are as of the start of the run
+    if optiondict['metrics_filename']:
+        add_check_metrics(metrics, check_files, check_stats)
+        add_log_metrics(metrics, optiondict['log_checks'], log_results)
+        kvmetrics.add_notify_metrics(metrics)
+        metrics.write(optiondict['metrics_filename'])
+
+
 # ---------------------------------------------------------------------------
 if __name__ == '__main__':
 
-    # capture the command line
-    optiondict = kvutil.kv_parse_command_line( optiondictconfig, debug=False )
+    # capture the command line - reuse the options of the last run when the config is unchanged
+    optiondict = kvutil.kv_parse_command_line( optiondictconfig, debug=False,
+                                               cache_filename=os.path.splitext(kvutil.scriptinfo()['name'])[0] + '_options.cache' )
 
     # set variables based on what came form command line
     debug = optiondict['debug']
@@ -244,22 +1071,20 @@ if __name__ == '__main__':
     # print header to show what is going on (convert this to a kvutil function:  kvutil.loggingStart(logger,optiondict))
     kvutil.loggingAppStart( logger, optiondict, kvutil.scriptinfo()['name'] )
 
-    # refresh the token - always do this as we don't always send an email
-    kvgmailsendsimple.gmail_refresh_token_take_no_action(
-            optiondict['email_from'],
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
-    )
-    # log message
-    logger.info('Refreshed the gmail token')
+    if optiondict['daemon']:
+        # refresh the token - always do this as we don't always send an email
+        kvnotifier.notifier_from_optiondict(optiondict).refresh(optiondict['email_from'])
+        # log message
+        logger.info('Refreshed the %s token', optiondict['notify_backend'])
 
-    
-    # step through each of the files to process
-    for rec in optiondict['check_files']:
-        message_on_file_too_old(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], optiondict)
-    
-    
+        # stay running and react to file changes
+        run_daemon(optiondict)
+    else:
+        # check once
+        run_check_cycle(optiondict)
+
+    # release any connection held by the notifier
+    kvnotifier.close_notifiers()
 
-# eof
 
+# eof
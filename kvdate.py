@@ -3,18 +3,20 @@ from __future__ import print_function
 '''
 @author:   Ken Venner
 @contact:  ken@venerllc.com
-@version:  1.03
+@version:  1.06
 
 Library of tools for date time processing used in general by KV
 
 Update:  2024-06-06;kv - added try/except on datetime_from_str
+Update:  2026-10-19;kv - compile the date patterns once - fromisoformat fast path - last matching pattern tried first
+Update:  2026-10-19;kv - dateutil imported on first timezone use
 
 '''
 
 import os
+import re
 import datetime
-from dateutil import tz
-from dateutil.zoneinfo import get_zonefile_instance
+import functools
 import sys
 import errno
 
@@ -24,8 +26,8 @@ import logging
 logger = logging.getLogger(__name__)
 
 # set the module version number
-AppVersion = '1.03'
-__version__ = '1.03'
+AppVersion = '1.06'
+__version__ = '1.06'
 
 
 def current_timezone_string():
@@ -36,18 +38,36 @@ def current_timezone_string():
     return local_tzname
 
 
+# dateutil (and its zone file) is imported on first use - most runs only parse dates
+def _tzmod():
+    from dateutil import tz
+    return tz
+
+
+# resolve a timezone name (None - the local timezone) once per process
+# (call get_tz.cache_clear() if the TZ environment variable is changed)
+@functools.lru_cache(maxsize=None)
+def get_tz(tzstr=None):
+    tz = _tzmod()
+    return tz.gettz(tzstr) if tzstr is not None else tz.gettz()
+
+
+# the timezone names in the dateutil zone file - read once
+@functools.lru_cache(maxsize=1)
+def zone_names():
+    from dateutil.zoneinfo import get_zonefile_instance
+    return tuple(sorted(get_zonefile_instance().zones))
+
+
 def datetime2utcdatetime(dt, default_tz=None, no_tz=False):
     # define it because it was not passed in
-    if default_tz is None:
-        default_tz = tz.gettz()
-    else:
-        default_tz = tz.gettz(default_tz)
+    default_tz = get_tz(default_tz)
 
     # convert the naive date to localize date
     local_dt = dt.replace(tzinfo=default_tz)
 
     # convert the local time to UTC time
-    utc_datetime = local_dt.astimezone(tz.UTC)
+    utc_datetime = local_dt.astimezone(_tzmod().UTC)
 
     # strip the timezone from datetime
     if no_tz:
@@ -66,26 +86,64 @@ def datetime2utcdatetime(dt, default_tz=None, no_tz=False):
 #  YYYY-MM-DDTHH:MM:SS.mmmmm
 #  YYYY-MM-DD HH:MM:SS
 #  YYYY-MM-DD HH:MM
+#  YYYY-MM-DD:HH:MM:SS   (format pool.py writes into pool_temps.csv)
 #  YYYY-MM-DD
 #  YYYYMMDD
 #
 # and allow a Z to be on the end of this string that we will strip out
 #
-def datetime_from_str(value, skipblank=False):
-    import re
-    datefmts = (
-        (re.compile(r'\d{1,2}/\d{1,2}/\d{2}$'), '%m/%d/%y'),
-        (re.compile(r'\d{1,2}/\d{1,2}/\d{4}$'), '%m/%d/%Y'),
-        (re.compile(r'\d{1,2}-\d{1,2}-\d{2}$'), '%m-%d-%y'),
-        (re.compile(r'\d{1,2}-\d{1,2}-\d{4}$'), '%m-%d-%Y'),
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}$'), '%Y-%m-%dT%H:%M:%S'),
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}\.\d+$'), '%Y-%m-%dT%H:%M:%S.%f'),
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}\s\d{1,2}:\d{1,2}:\d{1,2}$'), '%Y-%m-%d %H:%M:%S'),
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}\s\d{1,2}:\d{1,2}$'), '%Y-%m-%d %H:%M'),
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}$'), '%Y-%m-%d'),
-        (re.compile(r'^\d{8}$'), '%Y%m%d'),
-    )
+# patterns are compiled once - the pattern that matched last is tried first
+# (values in a file/column tend to share one format)
+DATEFMTS = (
+    (re.compile(r'\d{1,2}/\d{1,2}/\d{2}$'), '%m/%d/%y'),
+    (re.compile(r'\d{1,2}/\d{1,2}/\d{4}$'), '%m/%d/%Y'),
+    (re.compile(r'\d{1,2}-\d{1,2}-\d{2}$'), '%m-%d-%y'),
+    (re.compile(r'\d{1,2}-\d{1,2}-\d{4}$'), '%m-%d-%Y'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}$'), '%Y-%m-%dT%H:%M:%S'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}\.\d+$'), '%Y-%m-%dT%H:%M:%S.%f'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}\s\d{1,2}:\d{1,2}:\d{1,2}$'), '%Y-%m-%d %H:%M:%S'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}\s\d{1,2}:\d{1,2}$'), '%Y-%m-%d %H:%M'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}:\d{1,2}:\d{1,2}:\d{1,2}$'), '%Y-%m-%d:%H:%M:%S'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}$'), '%Y-%m-%d'),
+    (re.compile(r'^\d{8}$'), '%Y%m%d'),
+)
+_datefmt_last = [DATEFMTS[0]]
+
+_fromisoformat = getattr(datetime.datetime, 'fromisoformat', None)
+
+
+def _iso_shape(value):
+    '''
+    if value has exactly the shape of one of the ISO formats datetime_from_str
+    supports (two digit month/day) return it in a form datetime.fromisoformat takes,
+    otherwise None - fromisoformat accepts more than we do so anything else
+    goes through the patterns
+    '''
+    size = len(value)
+    if size < 10 or value[4] != '-' or value[7] != '-':
+        return None
+    if size == 10:
+        return value
+    # time separators - fromisoformat also takes the compact forms (eg. 12345678) we reject
+    if size < 16 or value[13] != ':' or (size != 16 and value[16] != ':'):
+        return None
+    sep = value[10]
+    if size == 19:
+        if sep in 'T ':
+            return value
+        if sep == ':':
+            # pool_temps.csv now_str format
+            return value[:10] + 'T' + value[11:]
+        return None
+    if size == 16:
+        return value if sep == ' ' else None
+    # fractional seconds - T separator only - at most 6 digits (strptime %f)
+    if sep == 'T' and 21 <= size <= 26 and value[19] == '.':
+        return value
+    return None
 
+
+def datetime_from_str(value, skipblank=False):
     if skipblank and not value:
         return value
 
@@ -98,16 +156,30 @@ def datetime_from_str(value, skipblank=False):
     # debugging
     # print('value:', value)
 
-    for (redate, datefmt) in datefmts:
+    # fast path - C parser for the ISO shapes
+    iso_value = _iso_shape(value) if _fromisoformat is not None else None
+    if iso_value:
+        try:
+            result = _fromisoformat(iso_value)
+        except ValueError:
+            result = None
+        if result is not None and result.tzinfo is None:
+            return result
+
+    # the pattern that matched last time first - then the rest in order
+    last = _datefmt_last[0]
+    for (redate, datefmt) in ((last,) + DATEFMTS):
         if redate.match(value):
             try:
-                return datetime.datetime.strptime(value, datefmt)
+                result = datetime.datetime.strptime(value, datefmt)
             except Exception as e:
                 print('-'*40)
                 print('datetime_from_str - conversion error:')
                 print(f'    value..:  {value}')
                 print(f'    datefmt:  {datefmt}')
                 raise e
+            _datefmt_last[0] = (redate, datefmt)
+            return result
             
     raise Exception(u'Unable to convert to date time:{}'.format(orig_value))
 
@@ -124,49 +196,283 @@ def datetime_from_str(value, skipblank=False):
 #     YYYY-MM-DD HH:MM:SS.mmmm[+-]HH:HH
 #     YYYY-MM-DDTHH:MM:SS.mmmm[+-]HH:HH
 #
-def datetimezone_from_str(value, skipblank=False):
-    import re
-    datefmtscleanup = (
-        (re.compile(r'(.*[+-])(\d{2}):(\d{2})$'), 'remove-colon-2'),
-    )
-    datefmts = (
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}\.\d+[+-]\d{4}$'), '%Y-%m-%dT%H:%M:%S.%f%z'),
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}:\d{1,2}\.\d+[+-]\d{4}$'), '%Y-%m-%d %H:%M:%S.%f%z'),
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}[+-]\d{4}$'), '%Y-%m-%dT%H:%M:%S%z'),
-        (re.compile(r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}:\d{1,2}[+-]\d{4}$'), '%Y-%m-%d %H:%M:%S%z'),
-    )
+DATEZONE_COLON = re.compile(r'(.*[+-])(\d{2}):(\d{2})$')
+DATEZONEFMTS = (
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}\.\d+[+-]\d{4}$'), '%Y-%m-%dT%H:%M:%S.%f%z'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}:\d{1,2}\.\d+[+-]\d{4}$'), '%Y-%m-%d %H:%M:%S.%f%z'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}T\d{1,2}:\d{1,2}:\d{1,2}[+-]\d{4}$'), '%Y-%m-%dT%H:%M:%S%z'),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}:\d{1,2}[+-]\d{4}$'), '%Y-%m-%d %H:%M:%S%z'),
+)
+_datezonefmt_last = [DATEZONEFMTS[0]]
+
 
+def datetimezone_from_str(value, skipblank=False):
     if skipblank and not value:
         return value
 
     # see if we need to change the format of the data we got in
-    for (redate, action) in datefmtscleanup:
-        if redate.match(value):
-            m = redate.match(value)
-            if action == 'remove-colon-2':
-                value = m.group(1) + m.group(2) + m.group(3)
+    m = DATEZONE_COLON.match(value)
+    if m:
+        value = m.group(1) + m.group(2) + m.group(3)
 
-    # convert date into date/time/zone
-    for (redate, datefmt) in datefmts:
+    # convert date into date/time/zone - the pattern that matched last time first
+    last = _datezonefmt_last[0]
+    for (redate, datefmt) in ((last,) + DATEZONEFMTS):
         if redate.match(value):
-            return datetime.datetime.strptime(value, datefmt)
+            result = datetime.datetime.strptime(value, datefmt)
+            _datezonefmt_last[0] = (redate, datefmt)
+            return result
 
     # error out because we could not convert
     raise Exception(u'Unable to convert to date time:{}'.format(value))
 
 
+# formats the bulk parser hands to fromisoformat/numpy - format -> (length, separator at position 10)
+# (the now_str format pool.py writes has a : between date and time - it is changed to T)
+ISO_BULK_SHAPES = {
+    '%Y-%m-%d': (10, None),
+    '%Y-%m-%d %H:%M': (16, ' '),
+    '%Y-%m-%d %H:%M:%S': (19, ' '),
+    '%Y-%m-%dT%H:%M:%S': (19, 'T'),
+    '%Y-%m-%d:%H:%M:%S': (19, ':'),
+}
+
+
+def detect_datefmt(values, sample_size=20):
+    '''
+    find the strptime format (see DATEFMTS) most of a sample of the
+    non blank values match (a few bad rows do not stop detection)
+    - None if no value in the sample matches a format
+    '''
+    sample = []
+    for value in values:
+        if value:
+            sample.append(value[:-1] if value[-1] in 'Zz' else value)
+            if len(sample) >= sample_size:
+                break
+    if not sample:
+        return None
+    best_count, best_datefmt = 0, None
+    for (redate, datefmt) in DATEFMTS:
+        count = sum(1 for value in sample if redate.match(value))
+        if count > best_count:
+            best_count, best_datefmt = count, datefmt
+    return best_datefmt
+
+
+def _bulk_numpy_iso(np, values, size, sep):
+    '''
+    vectorized parse of the ISO shaped formats - the strings become a matrix of
+    character codes, the shape and digits are checked and the fields are built
+    from the digits with array arithmetic (no per value python code)
+    returns (datetime64[s] array with NaT for bad/blank rows, list of bad row indexes)
+    '''
+    arr = np.array(values, dtype='U{}'.format(size + 1))
+    codes = arr.view(np.uint32).reshape(len(arr), size + 1).astype(np.int64)
+    lengths = np.char.str_len(arr)
+
+    # shape - separators where they belong - digits everywhere else
+    good = (lengths == size) & (codes[:, 4] == ord('-')) & (codes[:, 7] == ord('-'))
+    digit_cols = [0, 1, 2, 3, 5, 6, 8, 9]
+    if sep is not None:
+        good &= (codes[:, 10] == ord(sep)) & (codes[:, 13] == ord(':'))
+        digit_cols += [11, 12, 14, 15]
+        if size == 19:
+            good &= codes[:, 16] == ord(':')
+            digit_cols += [17, 18]
+    digits = codes[:, digit_cols] - ord('0')
+    good &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+    def field(first):
+        return digits[:, first] * 10 + digits[:, first + 1]
+
+    year = field(0) * 100 + field(2)
+    month = field(4)
+    day = field(6)
+    hour = field(8) if sep is not None else 0
+    minute = field(10) if sep is not None else 0
+    second = field(12) if size == 19 else 0
+    good &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+
+    # build the dates from the fields - bad rows get a placeholder
+    year = np.where(good, year, 1970)
+    month = np.where(good, month, 1)
+    day = np.where(good, day, 1)
+    months = (year - 1970) * 12 + (month - 1)
+    first_of_month = months.astype('datetime64[M]')
+    dates = first_of_month.astype('datetime64[D]') + (day - 1)
+    # day past the end of the month rolls into the next month
+    good &= dates.astype('datetime64[M]') == first_of_month
+
+    result = dates.astype('datetime64[s]') + (hour * 3600 + minute * 60 + second)
+    result[~good] = np.datetime64('NaT')
+    return result, [int(idx) for idx in np.flatnonzero(~good & (lengths > 0))]
+
+
+# parse a whole column of date strings - the format is detected once from a sample
+# (or passed in) and every value is parsed with that one format
+#
+# returns (parsed, bad)
+#   parsed - list of datetime aligned with values (None for blank/bad values)
+#            or with as_numpy a numpy datetime64 array (NaT for blank/bad values)
+#   bad - list of (index, value) for the non blank values that did not parse
+#
+def datetimes_from_strs(values, datefmt=None, sample_size=20, as_numpy=False):
+    values = list(values)
+    if datefmt is None:
+        datefmt = detect_datefmt(values, sample_size)
+        if datefmt is None:
+            raise Exception(u'Unable to detect a date format from sample:{}'.format(
+                [x for x in values if x][:sample_size]))
+
+    # strip the Z on the end when the data carries it
+    if any(value and value[-1] in 'Zz' for value in values[:sample_size]):
+        values = [value[:-1] if value and value[-1] in 'Zz' else value for value in values]
+
+    if as_numpy:
+        try:
+            import numpy as np
+        except ImportError:
+            logger.error('as_numpy requires numpy to be installed')
+            raise Exception(u'datetimes_from_strs as_numpy requires numpy to be installed')
+        if datefmt in ISO_BULK_SHAPES and values:
+            result, bad_idx = _bulk_numpy_iso(np, values, *ISO_BULK_SHAPES[datefmt])
+            # not the zero padded shape (eg. 2024-7-1) - strptime takes these
+            bad = []
+            for idx in bad_idx:
+                try:
+                    result[idx] = np.datetime64(datetime.datetime.strptime(values[idx], datefmt), 's')
+                except ValueError:
+                    bad.append((idx, values[idx]))
+            return result, bad
+        parsed, bad = datetimes_from_strs(values, datefmt, sample_size)
+        return np.array([np.datetime64('NaT') if x is None else x for x in parsed], dtype='datetime64[us]'), bad
+
+    parsed = []
+    bad = []
+    if datefmt in ISO_BULK_SHAPES and _fromisoformat is not None:
+        # exact shape check (fromisoformat accepts more than the format does) then the C parser
+        # values not in the zero padded shape (eg. 2024-7-1 1:02:03) go to strptime
+        size, sep = ISO_BULK_SHAPES[datefmt]
+        fromisoformat = _fromisoformat
+        strptime = datetime.datetime.strptime
+        for idx, value in enumerate(values):
+            result = None
+            if len(value) == size and value[4] == '-' and value[7] == '-' \
+                    and (sep is None or (value[10] == sep and value[13] == ':' and (size == 16 or value[16] == ':'))):
+                try:
+                    result = fromisoformat(value[:10] + 'T' + value[11:] if sep == ':' else value)
+                except ValueError:
+                    pass
+            if result is None and value:
+                try:
+                    result = strptime(value, datefmt)
+                except ValueError:
+                    bad.append((idx, value))
+            parsed.append(result)
+        return parsed, bad
+
+    strptime = datetime.datetime.strptime
+    for idx, value in enumerate(values):
+        result = None
+        if value:
+            try:
+                result = strptime(value, datefmt)
+            except ValueError:
+                bad.append((idx, value))
+        parsed.append(result)
+    return parsed, bad
+
+
+# seconds in the buckets batch conversion computes one utc offset for - a bucket
+# whose offset at the start and the end differ holds a DST change and its values
+# are converted one at a time (zones change offset at most once a day)
+UTC_BUCKET_SECONDS = 86400
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _bucket_offsets(zone, buckets):
+    '''
+    utc offset in seconds of each bucket - None for a bucket the offset changes within
+    '''
+    offsets = {}
+    for bucket in buckets:
+        start = _EPOCH + datetime.timedelta(seconds=int(bucket) * UTC_BUCKET_SECONDS)
+        offset = zone.utcoffset(start)
+        end_offset = zone.utcoffset(start + datetime.timedelta(seconds=UTC_BUCKET_SECONDS - 1))
+        offsets[bucket] = offset.total_seconds() if offset == end_offset else None
+    return offsets
+
+
+# convert a batch of naive local timestamps to UTC in one call
+#
+# values - list of naive datetimes (None is passed through)
+#          or a numpy datetime64 array (NaT is passed through)
+# default_tz - timezone name of the values (None - the local timezone)
+# no_tz - return naive utc datetimes (list input - numpy values are always naive)
+#
+# gives the same answer as datetime2utcdatetime on each value (including the
+# repeated/skipped hour at DST changes) but the zone is asked for the offset once
+# per day of values instead of once per value
+#
+def datetimes2utc(values, default_tz=None, no_tz=False):
+    zone = get_tz(default_tz)
+
+    if hasattr(values, 'dtype'):
+        import numpy as np
+        nat = np.isnat(values)
+        seconds = values.astype('datetime64[s]').astype(np.int64)
+        buckets = seconds // UTC_BUCKET_SECONDS
+        unique_buckets, inverse = np.unique(buckets[~nat], return_inverse=True)
+        offsets = _bucket_offsets(zone, unique_buckets)
+        bucket_offsets = np.array([np.nan if offsets[b] is None else offsets[b] for b in unique_buckets], dtype=np.float64)
+
+        offset_seconds = np.zeros(len(values), dtype=np.float64)
+        offset_seconds[~nat] = bucket_offsets[inverse]
+        # values in a bucket holding an offset change - one at a time
+        for idx in np.flatnonzero(np.isnan(offset_seconds)):
+            local_dt = _EPOCH + datetime.timedelta(seconds=int(seconds[idx]))
+            offset_seconds[idx] = zone.utcoffset(local_dt).total_seconds()
+
+        return values - offset_seconds.astype(np.int64).astype('timedelta64[s]')
+
+    results = []
+    # bucket -> offset as a timedelta (None - the offset changes in this bucket)
+    offsets = {}
+    utc = _tzmod().UTC
+    for dt in values:
+        if dt is None:
+            results.append(None)
+            continue
+        if dt.tzinfo is not None:
+            dt = dt.replace(tzinfo=None)
+        delta = dt - _EPOCH
+        bucket = (delta.days * 86400 + delta.seconds) // UTC_BUCKET_SECONDS
+        if bucket in offsets:
+            offset = offsets[bucket]
+        else:
+            offset = _bucket_offsets(zone, [bucket])[bucket]
+            offset = offsets[bucket] = None if offset is None else datetime.timedelta(seconds=offset)
+        utc_dt = dt - (zone.utcoffset(dt) if offset is None else offset)
+        results.append(utc_dt if no_tz else utc_dt.replace(tzinfo=utc))
+    return results
+
+
 def valid_tz_string(tzstr):
-    if tz.gettz(tzstr):
+    if get_tz(tzstr):
         return True
     return False
 
 
 def show_timezones(sublist=None, debug=False):
     # get the full list
-    sorted_zonenames = sorted(list(get_zonefile_instance().zones))
+    sorted_zonenames = list(zone_names())
     sections = set([x.split('/')[0] for x in sorted_zonenames if '/' in x])
 
-    if sublist.capitalize() in sections:
+    if not sublist:
+        display_zonenames = sorted_zonenames
+    elif sublist.capitalize() in sections:
         display_zonenames = [x for x in sorted_zonenames if x.startswith(str(sublist.capitalize()) + '/')]
     elif sublist.upper() in ('US', 'USA'):
         display_zonenames = [x for x in sorted_zonenames if x.startswith('US/')]
@@ -3,19 +3,15 @@ import os.path
 import base64
 from email.message import EmailMessage
 
-import google.auth
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
+# the google client libraries take a few hundred milliseconds to import - they are
+# imported by the functions that talk to google so a run that sends nothing never loads them
 
 '''
 
 kvgmailsendsimple.py - send out simple emails from gmail using API methods
 
 Main routine is:  gmail_send_simple()
+Send a burst of messages in one round trip:  gmail_send_batch_messages()
 
 This will create OATH json files to be used when executing.
 And will require a one time authentication by the "email_from" user account
@@ -28,7 +24,7 @@ pip install --upgrade google-api-python-client google-auth-httplib2 google-auth-
 
 @author:  Ken Venner
 @contact: ken@vennerllc.com
-@version:  1.04
+@version:  1.07
 
 
 Created:  2024-02-18;kv
@@ -44,8 +40,12 @@ SCOPES = [
 ]
 
 
+# gmail batch requests allow up to 100 calls - gmail recommends no more than 50
+BATCH_MAX_MESSAGES = 50
+
+
 # version number
-AppVersion = '1.04'
+AppVersion = '1.07'
 
 
 
@@ -79,6 +79,11 @@ def google_creds_from_json(scopes=None, file_token_json=None, file_credentials_j
       and force the local browser to authenticate
 
   """
+  from google.auth.transport.requests import Request
+  from google.oauth2.credentials import Credentials
+  from google_auth_oauthlib.flow import InstalledAppFlow
+  import kvutil
+
   # if we don't have scopes - we error out
   if not scopes:
     scopes = SCOPES
@@ -103,9 +108,8 @@ def google_creds_from_json(scopes=None, file_token_json=None, file_credentials_j
           file_credentials_json, scopes
       )
       creds = flow.run_local_server(port=0)
-    # Save the credentials for the next run
-    with open(file_token_json, "w") as token:
-      token.write(creds.to_json())
+    # Save the credentials for the next run - atomically so a crash never leaves a partial token file
+    kvutil.write_file_atomic(file_token_json, creds.to_json(), fsync=True)
 
   return creds
 
@@ -122,6 +126,45 @@ def gmail_refresh_token_take_no_action(email_from, scopes=None, file_token_json=
   #creds, _ = google.auth.default()
   
 
+def create_message_body(email_from, email_to, email_subject, email_body):
+  """Build the gmail api message body (base64 encoded raw message)
+
+  email_from - the account that is sending out the email
+  email_to - the address or set of addresses we are sending emails to
+  email_subject - subject line of the email
+  email_body - the text in the body being sent
+  """
+  message = EmailMessage()
+
+  message.set_content(email_body)
+
+  message["To"] = email_to
+  message["From"] = email_from
+  message["Subject"] = email_subject
+
+  # encoded message
+  encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+  return {"raw": encoded_message}
+
+
+def gmail_build_service(email_from, scopes=None, file_token_json=None, file_credentials_json=None):
+  """Load the credentials for email_from and build the gmail api service object
+
+  the service object can be reused across many sends in the same run
+  """
+  from googleapiclient.discovery import build
+
+  # determien the token.json file
+  if not file_token_json:
+    file_token_json = convert_email_to_filename(email_from)
+
+   # set the credentials
+  creds = google_creds_from_json(scopes, file_token_json, file_credentials_json)
+
+  return build("gmail", "v1", credentials=creds)
+
+
 def gmail_send_simple_message(email_from, email_to, email_subject, email_body, scopes=None, file_token_json=None, file_credentials_json=None):
   """Create and send an email message
   Print the returned  message id
@@ -141,28 +184,12 @@ def gmail_send_simple_message(email_from, email_to, email_subject, email_body, s
   file_credentials_json - the filename holding the OATH app approval credentials (default:  credentials.json)
 
   """
-  # determien the token.json file
-  if not file_token_json:
-    file_token_json = convert_email_to_filename(email_from)
-
-   # set the credentials
-  creds = google_creds_from_json(scopes, file_token_json, file_credentials_json)
-  #creds, _ = google.auth.default()
+  from googleapiclient.errors import HttpError
 
   try:
-    service = build("gmail", "v1", credentials=creds)
-    message = EmailMessage()
-
-    message.set_content(email_body)
+    service = gmail_build_service(email_from, scopes, file_token_json, file_credentials_json)
 
-    message["To"] = email_to
-    message["From"] = email_from
-    message["Subject"] = email_subject
-
-    # encoded message
-    encoded_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-
-    create_message = {"raw": encoded_message}
+    create_message = create_message_body(email_from, email_to, email_subject, email_body)
     # pylint: disable=E1101
     send_message = (
         service.users()
@@ -177,6 +204,71 @@ def gmail_send_simple_message(email_from, email_to, email_subject, email_body, s
   return send_message
 
 
+def gmail_send_batch_messages(email_from, messages, scopes=None, file_token_json=None, file_credentials_json=None, batch_size=BATCH_MAX_MESSAGES, service=None):
+  """Create and send a list of email messages through the gmail batch endpoint
+  Returns: list of dicts (same order as messages) with keys:
+      id - the gmail message id (None if this message failed)
+      error - the error string (None if this message was sent)
+
+  email_from - the account that is sending out the emails
+  messages - list of dicts with keys:  email_to, email_subject, email_body
+             (optional key email_from overrides the sending account header)
+  batch_size - number of messages submitted per batch request (gmail allows up to 100)
+  service - an already built gmail service (when not set we build one from the credentials)
+
+  Each chunk of batch_size messages costs one http round trip instead of one per message.
+  """
+  from googleapiclient.errors import HttpError
+
+  results = [{'id': None, 'error': None} for _ in messages]
+
+  # nothing to send
+  if not messages:
+    return results
+
+  # never exceed the gmail limit on calls in a single batch
+  batch_size = max(1, min(batch_size, BATCH_MAX_MESSAGES))
+
+  def batch_callback(request_id, response, exception):
+    # request_id is the index of the message in the list passed in
+    idx = int(request_id)
+    if exception is not None:
+      results[idx]['error'] = str(exception)
+    else:
+      results[idx]['id'] = response['id']
+
+  # one set of credentials and one service for all the messages
+  if service is None:
+    service = gmail_build_service(email_from, scopes, file_token_json, file_credentials_json)
+
+  # step through the messages one chunk at a time
+  for start in range(0, len(messages), batch_size):
+    chunk = range(start, min(start + batch_size, len(messages)))
+    batch = service.new_batch_http_request(callback=batch_callback)
+    for idx in chunk:
+      msg = messages[idx]
+      create_message = create_message_body(msg.get('email_from', email_from), msg['email_to'], msg['email_subject'], msg['email_body'])
+      # pylint: disable=E1101
+      batch.add(service.users().messages().send(userId="me", body=create_message), request_id=str(idx))
+    try:
+      batch.execute()
+    except HttpError as error:
+      # the whole batch failed - flag every message in this chunk not already answered
+      print(f"An error occurred: {error}")
+      for idx in chunk:
+        if results[idx]['id'] is None and results[idx]['error'] is None:
+          results[idx]['error'] = str(error)
+
+  # display what we sent
+  for result in results:
+    if result['id']:
+      print(f'Message Id: {result["id"]}')
+    else:
+      print(f'An error occurred: {result["error"]}')
+
+  return results
+
+
 if __name__ == "__main__":
   email_from = '210608thSt@gmail.com'
   email_to = 'ken@vennerllc.com'
@@ -200,4 +292,11 @@ if __name__ == "__main__":
   except Exception as err:
     print('Err: ', err)
     print('this failed - you must delete the input json and reauthenticate the application')
+
+  print('Test generation of batch email send through:  ', email_from)
+  messages = [
+    {'email_to': email_to, 'email_subject': email_subject + ' - batch ' + str(cnt), 'email_body': email_body}
+    for cnt in range(1, 3)
+  ]
+  print(gmail_send_batch_messages(email_from, messages, scopes, file_token_json, file_credentials_json))
 # eof
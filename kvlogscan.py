@@ -0,0 +1,217 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.01
+
+Incremental scanning of log files for error patterns
+
+Each log file has a checkpoint (device/inode, byte offset, fingerprint of
+the start of the file) saved in a json file between runs.  A scan reads
+only the bytes appended since the last scan - complete lines only - and
+counts the lines matching each pattern.
+
+Rotation is handled:
+    renamed (RotatingFileHandler, logrotate) - the inode changes - the rest of
+        the old file is read to its end from the rotated copy (name.1, name.*)
+        when we can find it and the new file is read from the start
+    truncated (copytruncate) - the file is smaller than the offset or the start
+        of the file no longer matches the fingerprint - read from the start
+
+The match counts are kept with the time of the scan so a rate
+(matches in the last window_seconds) can be checked against a threshold.
+
+'''
+
+import os
+import re
+import time
+
+import kvutil
+
+# setup the logger
+import logging
+
+logger = logging.getLogger(__name__)
+
+# set the module version number
+AppVersion = '1.01'
+__version__ = '1.01'
+
+# bytes at the start of the file used to detect the file was replaced in place
+FINGERPRINT_BYTES = 128
+
+
+def compile_patterns(patterns):
+    '''
+    patterns - list of strings (regex) or dicts with keys: regex, name (default regex)
+    returns list of (name, compiled regex)
+    '''
+    compiled = []
+    for pattern in patterns:
+        if isinstance(pattern, str):
+            pattern = {'regex': pattern}
+        compiled.append((pattern.get('name', pattern['regex']), re.compile(pattern['regex'])))
+    return compiled
+
+
+def read_fingerprint(t):
+    t.seek(0)
+    return t.read(FINGERPRINT_BYTES).hex()
+
+
+def same_start(fingerprint, saved):
+    '''
+    the file starts with the same bytes it did when saved (a file shorter than
+    FINGERPRINT_BYTES at the last scan has a shorter fingerprint)
+    '''
+    size = min(len(fingerprint), len(saved))
+    return fingerprint[:size] == saved[:size]
+
+
+class LogScanner:
+    '''
+    scan log files from their saved checkpoint
+
+    checkpoint_filename - json file holding the offsets and match history between runs
+    max_bytes - most bytes read from one file in one scan (None - no limit) - the rest is read next scan
+                (the rest of a rotated copy is read in full - there is no next scan for it)
+    start_at_end - a file seen for the first time is read from its end (history is not alerted on)
+    clock - function returning the current time in seconds (default: time.time)
+    '''
+
+    def __init__(self, checkpoint_filename, max_bytes=None, start_at_end=True, clock=time.time):
+        self.checkpoint_filename = checkpoint_filename
+        self.max_bytes = max_bytes
+        self.start_at_end = start_at_end
+        self.clock = clock
+        self.state = self._load()
+
+    def _load(self):
+        if self.checkpoint_filename and os.path.exists(self.checkpoint_filename):
+            try:
+                return kvutil.load_json_file_to_dict(self.checkpoint_filename)
+            except Exception as e:
+                logger.warning('Unable to read log checkpoint %s - starting over:%s', self.checkpoint_filename, e)
+        return {}
+
+    def save(self):
+        if self.checkpoint_filename:
+            kvutil.dump_dict_to_json_file(self.checkpoint_filename, self.state)
+
+    def _find_rotated(self, fname, entry):
+        '''
+        the rotated copy of fname that still has the inode we were reading
+        '''
+        for candidate in sorted(kvutil.filename_glob(fname + '.*', files_only=True)):
+            try:
+                st = os.stat(candidate)
+            except OSError:
+                continue
+            if [st.st_dev, st.st_ino] == [entry['dev'], entry['ino']]:
+                return candidate
+        return None
+
+    def _read_lines(self, fname, offset, max_bytes, final=False):
+        '''
+        read the complete lines from offset
+        final - the file is no longer written (rotated copy) - a partial last line is read too
+        returns (list of lines, offset after the last complete line)
+        '''
+        with open(fname, 'rb') as t:
+            t.seek(offset)
+            data = t.read(-1 if max_bytes is None else max_bytes)
+        # a partial last line is left for the next scan
+        end = len(data) if final else data.rfind(b'\n') + 1
+        if not end:
+            return [], offset
+        return data[:end].decode('utf-8', errors='replace').splitlines(), offset + end
+
+    def scan(self, fname, patterns):
+        '''
+        read what was appended to fname since the last scan and count the matching lines
+
+        patterns - see compile_patterns()
+
+        returns dict with keys:
+            matches - pattern name -> lines matched in this scan
+            lines - lines read
+            bytes_read - bytes read
+            rotated - True if the file was rotated/truncated since the last scan
+            error - None or the reason the file could not be scanned
+        '''
+        compiled = compile_patterns(patterns)
+        result = {'matches': {name: 0 for name, _ in compiled}, 'lines': 0, 'bytes_read': 0, 'rotated': False, 'error': None}
+
+        try:
+            st = os.stat(fname)
+        except OSError as e:
+            result['error'] = 'missing' if not os.path.exists(fname) else str(e)
+            return result
+
+        with open(fname, 'rb') as t:
+            fingerprint = read_fingerprint(t)
+
+        entry = self.state.get(fname)
+        lines = []
+        if entry is None:
+            offset = st.st_size if self.start_at_end else 0
+            if offset:
+                # start at the end of the last complete line
+                with open(fname, 'rb') as t:
+                    t.seek(max(0, offset - 4096))
+                    tail = t.read(offset - max(0, offset - 4096))
+                if b'\n' in tail:
+                    offset -= len(tail) - (tail.rfind(b'\n') + 1)
+            entry = {'hits': {}}
+        elif [st.st_dev, st.st_ino] != [entry['dev'], entry['ino']]:
+            # renamed - finish the old file then start the new one from the top
+            result['rotated'] = True
+            rotated = self._find_rotated(fname, entry)
+            if rotated:
+                # no cap - the lines we do not read now are never read
+                old_lines, old_offset = self._read_lines(rotated, entry['offset'], None, final=True)
+                lines.extend(old_lines)
+                result['bytes_read'] += old_offset - entry['offset']
+            else:
+                logger.info('Log %s rotated - rotated copy not found - lines after offset %s not scanned', fname, entry['offset'])
+            offset = 0
+        elif st.st_size < entry['offset'] or not same_start(fingerprint, entry['fingerprint']):
+            # truncated/replaced in place
+            result['rotated'] = True
+            offset = 0
+        else:
+            offset = entry['offset']
+
+        new_lines, new_offset = self._read_lines(fname, offset, self.max_bytes)
+        lines.extend(new_lines)
+        result['bytes_read'] += new_offset - offset
+        result['lines'] = len(lines)
+
+        for line in lines:
+            for name, regex in compiled:
+                if regex.search(line):
+                    result['matches'][name] += 1
+
+        # record the hits with the time we found them
+        now = self.clock()
+        for name, count in result['matches'].items():
+            if count:
+                entry['hits'].setdefault(name, []).append([now, count])
+
+        entry.update({'dev': st.st_dev, 'ino': st.st_ino, 'offset': new_offset, 'fingerprint': fingerprint})
+        self.state[fname] = entry
+        return result
+
+    def rate(self, fname, name, window_seconds):
+        '''
+        number of lines that matched pattern name in the last window_seconds
+        (hits older than the window are dropped)
+        '''
+        entry = self.state.get(fname)
+        if not entry or name not in entry['hits']:
+            return 0
+        since = self.clock() - window_seconds
+        entry['hits'][name] = [hit for hit in entry['hits'][name] if hit[0] > since]
+        return sum(hit[1] for hit in entry['hits'][name])
+
+# eof
@@ -0,0 +1,207 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.01
+
+Collect run metrics and write them as a Prometheus textfile
+(the node exporter textfile collector scrapes *.prom files from a directory)
+
+The file is written to a temp file in the same directory and renamed
+into place so the exporter never reads a partially written file.
+
+Usage:
+
+    metrics = kvmetrics.MetricsRegistry('pool_')
+    with metrics.stage('parse'):
+        ...
+    metrics.gauge('temperature_fahrenheit', 82, {'body': 'pool'}, 'last temperature reading')
+    metrics.histogram('task_duration_seconds', histogram, {'task': 'pool'}, 'seconds each run took')
+    metrics.write('pool.prom')
+
+'''
+
+import time
+import bisect
+import contextlib
+
+import kvutil
+
+# setup the logger
+import logging
+
+logger = logging.getLogger(__name__)
+
+# set the module version number
+AppVersion = '1.01'
+__version__ = '1.01'
+
+# histogram bucket upper bounds (seconds) sized for runs of a fraction of a second to minutes
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def escape_label_value(value):
+    '''
+    escape a label value per the prometheus text format
+    '''
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value):
+    '''
+    format a sample value - booleans as 0/1, missing values as NaN
+    '''
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_labels(labels):
+    '''
+    tuple of (name, value) pairs as {name="value",...} - empty string when there are none
+    '''
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, escape_label_value(v)) for k, v in labels) + '}'
+
+
+def to_number(value):
+    '''
+    convert a reading (often a string from a parsed file) to a float - None if it is not a number
+    '''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def write_textfile(filename, text):
+    '''
+    atomically replace filename with text - temp file in the same directory then rename
+    '''
+    # the exporter runs as another user - readable by everyone
+    kvutil.write_file_atomic(filename, text, perms=0o644)
+
+
+class Histogram:
+    '''
+    count of observed values by bucket - rendered as a prometheus histogram
+
+    buckets - upper bounds of the buckets (a value equal to a bound is in that bucket) - +Inf is added
+
+    observe(value) - add a value
+    cumulative() - list of (le label, values <= le) ending with +Inf
+    '''
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        # one count per bucket plus the +Inf bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (None,), self.counts):
+            total += count
+            result.append(('+Inf' if bound is None else format_value(bound), total))
+        return result
+
+
+class MetricsRegistry:
+    '''
+    the metrics captured during one run
+
+    prefix - prepended to every metric name (eg. 'pool_')
+
+    gauge(name, value, labels, help) - set the value of a sample
+    histogram(name, histogram, labels, help) - set a Histogram sample
+    stage(name) - context manager that records the seconds the stage took
+    render() - the metrics in prometheus text format
+    write(filename) - atomically write the rendered metrics
+    '''
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        # name -> {'type', 'help', 'samples': {labels tuple: value}} - kept in insert order
+        self._metrics = {}
+        self._start = time.monotonic()
+
+    def _metric(self, name, mtype, help):
+        name = self.prefix + name
+        metric = self._metrics.setdefault(name, {'type': mtype, 'help': help, 'samples': {}})
+        if help and not metric['help']:
+            metric['help'] = help
+        return metric
+
+    def gauge(self, name, value, labels=None, help=None):
+        metric = self._metric(name, 'gauge', help)
+        metric['samples'][tuple(sorted((labels or {}).items()))] = value
+
+    def add(self, name, value, labels=None, help=None):
+        '''
+        add to the value of a gauge (starting at 0)
+        '''
+        metric = self._metric(name, 'gauge', help)
+        key = tuple(sorted((labels or {}).items()))
+        metric['samples'][key] = metric['samples'].get(key, 0) + value
+
+    def histogram(self, name, histogram, labels=None, help=None):
+        metric = self._metric(name, 'histogram', help)
+        metric['samples'][tuple(sorted((labels or {}).items()))] = histogram
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add('stage_duration_seconds', time.monotonic() - start, {'stage': name},
+                     'seconds spent in each stage of the run')
+
+    def render(self):
+        lines = []
+        for name, metric in self._metrics.items():
+            if metric['help']:
+                lines.append('# HELP {} {}'.format(name, metric['help'].replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE {} {}'.format(name, metric['type']))
+            for labels, value in metric['samples'].items():
+                if metric['type'] == 'histogram':
+                    for le, count in value.cumulative():
+                        lines.append('{}_bucket{} {}'.format(name, render_labels(labels + (('le', le),)), count))
+                    lines.append('{}_sum{} {}'.format(name, render_labels(labels), format_value(value.sum)))
+                    lines.append('{}_count{} {}'.format(name, render_labels(labels), value.count))
+                else:
+                    lines.append('{}{} {}'.format(name, render_labels(labels), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        '''
+        add the run duration and timestamp and write the textfile
+        '''
+        self.gauge('run_duration_seconds', time.monotonic() - self._start, help='seconds the run took')
+        self.gauge('last_run_timestamp_seconds', time.time(), help='time the run finished')
+        write_textfile(filename, self.render())
+        logger.info('Wrote metrics to:%s', filename)
+
+
+def add_notify_metrics(metrics):
+    '''
+    add the message send counts and latency captured by kvnotifier in this process
+    '''
+    import kvnotifier
+    for backend, stats in kvnotifier.send_stats().items():
+        labels = {'backend': backend}
+        metrics.gauge('notify_messages_sent', stats['count'], labels, 'message sends attempted this run (including errors)')
+        metrics.gauge('notify_send_errors', stats['errors'], labels, 'message sends that failed this run')
+        metrics.gauge('notify_send_seconds_sum', stats['seconds'], labels, 'total seconds spent sending messages this run')
+        metrics.gauge('notify_send_seconds_max', stats['max_seconds'], labels, 'slowest message send this run')
+
+# eof
@@ -0,0 +1,440 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.04
+
+Pluggable delivery of alert messages
+
+Backends:
+    gmail - send through the gmail api (kvgmailsendsimple.py)
+    smtp  - send through a plain SMTP server - one connection is reused for all sends
+    file  - append each message as a json line to a file (offline testing)
+
+Any backend can be wrapped by RateLimitedNotifier - a token bucket per
+recipient list (see kvratelimit.py) that suppresses alert storms and
+sends one summary of what was suppressed once the bucket refills.
+
+Every backend returns a dict with the key 'id' from send() so callers
+can log the message id the same way they do with gmail - or None when the
+message could not be delivered (the error is logged, the run goes on) -
+message_id() gives the id or None for either.
+
+The count and latency of the sends made by each backend are kept for
+the life of the process - send_stats() - so they can be exported as metrics.
+
+The backend is selected from the application optiondict:
+
+    notifier = kvnotifier.notifier_from_optiondict(optiondict)
+    msgid = notifier.send(email_from, email_to, email_subject, email_body)
+
+'''
+
+import abc
+import json
+import time
+import datetime
+import functools
+
+# setup the logger
+import logging
+
+logger = logging.getLogger(__name__)
+
+# set the module version number
+AppVersion = '1.04'
+__version__ = '1.04'
+
+NOTIFY_BACKENDS = ('gmail', 'smtp', 'file')
+
+# notifiers created from optiondict settings - reused for the life of the process
+_notifier_cache = {}
+
+# backend -> count, errors, seconds, max_seconds of the sends made in this process
+_send_stats = {}
+
+
+def record_send(backend, seconds, count=1, errors=0):
+    '''
+    add the timing of a send (or a batch of count sends) to the process send stats
+    '''
+    stats = _send_stats.setdefault(backend, {'count': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+    stats['count'] += count
+    stats['errors'] += errors
+    stats['seconds'] += seconds
+    stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+
+def send_stats():
+    '''
+    copy of the send stats by backend (keys: count, errors, seconds, max_seconds)
+    '''
+    return {backend: dict(stats) for backend, stats in _send_stats.items()}
+
+
+def reset_send_stats():
+    '''
+    clear the send stats - a long running process calls this at the start of each cycle
+    '''
+    _send_stats.clear()
+
+
+def message_id(msgid):
+    '''
+    the 'id' of the result of send() - None when the message was not sent
+    '''
+    return msgid['id'] if msgid else None
+
+
+def timed_send(func):
+    '''
+    decorator for a backend send() - records the time taken and whether it failed
+    '''
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            result = func(self, *args, **kwargs)
+        except Exception:
+            record_send(self.backend, time.monotonic() - start, errors=1)
+            raise
+        record_send(self.backend, time.monotonic() - start)
+        return result
+    return wrapper
+
+
+def build_email_message(email_from, email_to, email_subject, email_body):
+    '''
+    create the EmailMessage object with the Message-ID we report back as the id
+    '''
+    from email.message import EmailMessage
+    from email.utils import make_msgid
+    message = EmailMessage()
+    message.set_content(email_body)
+    message['To'] = email_to
+    message['From'] = email_from
+    message['Subject'] = email_subject
+    message['Message-ID'] = make_msgid()
+    return message
+
+
+class Notifier(abc.ABC):
+    '''
+    base class for notifier backends - a backend must implement send()
+
+    send() - deliver one message and return a dict with key 'id' (None - not delivered)
+    send_many() - deliver a list of messages - returns list of dicts with keys 'id', 'error'
+    refresh() - keep credentials current when no message is sent
+    close() - release any connection held open
+    '''
+    backend = None
+
+    @abc.abstractmethod
+    def send(self, email_from, email_to, email_subject, email_body):
+        pass
+
+    def send_many(self, messages):
+        '''
+        messages - list of dicts with keys:  email_from, email_to, email_subject, email_body
+        '''
+        results = []
+        for msg in messages:
+            try:
+                sent = self.send(msg['email_from'], msg['email_to'], msg['email_subject'], msg['email_body'])
+                results.append({'id': sent['id'] if sent else None, 'error': None if sent else 'not sent'})
+            except Exception as e:
+                logger.error('Send failed to %s:%s', msg['email_to'], e)
+                results.append({'id': None, 'error': str(e)})
+        return results
+
+    def refresh(self, email_from):
+        pass
+
+    def close(self):
+        pass
+
+
+class GmailNotifier(Notifier):
+    '''
+    send through the gmail api using the token/credential files
+    '''
+    backend = 'gmail'
+
+    def __init__(self, scopes=None, file_token_json=None, file_credentials_json=None):
+        self.scopes = scopes
+        self.file_token_json = file_token_json
+        self.file_credentials_json = file_credentials_json
+
+    @timed_send
+    def send(self, email_from, email_to, email_subject, email_body):
+        import kvgmailsendsimple
+        return kvgmailsendsimple.gmail_send_simple_message(
+            email_from,
+            email_to,
+            email_subject,
+            email_body,
+            self.scopes,
+            self.file_token_json,
+            self.file_credentials_json
+        )
+
+    def send_many(self, messages):
+        import kvgmailsendsimple
+        if not messages:
+            return []
+        # a batch is sent using the credentials of one account
+        start = time.monotonic()
+        results = kvgmailsendsimple.gmail_send_batch_messages(
+            messages[0]['email_from'],
+            messages,
+            self.scopes,
+            self.file_token_json,
+            self.file_credentials_json
+        )
+        record_send(self.backend, time.monotonic() - start, count=len(results),
+                    errors=sum(1 for x in results if x['error']))
+        return results
+
+    def refresh(self, email_from):
+        import kvgmailsendsimple
+        kvgmailsendsimple.gmail_refresh_token_take_no_action(
+            email_from,
+            self.scopes,
+            self.file_token_json,
+            self.file_credentials_json
+        )
+
+
+class SMTPNotifier(Notifier):
+    '''
+    send through an SMTP server - the connection is opened on first send
+    and reused until close() is called (or the server drops it)
+    '''
+    backend = 'smtp'
+
+    def __init__(self, host='localhost', port=25, user=None, password=None, starttls=False, timeout=30):
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._conn = None
+
+    def _connect(self):
+        import smtplib
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.user:
+            conn.login(self.user, self.password)
+        logger.debug('Connected to SMTP server %s:%s', self.host, self.port)
+        return conn
+
+    @timed_send
+    def _deliver(self, message):
+        import smtplib
+        if self._conn is None:
+            self._conn = self._connect()
+        try:
+            self._conn.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # server closed the idle connection - reconnect once and resend
+            logger.info('SMTP connection dropped - reconnecting to %s:%s', self.host, self.port)
+            self._conn = None
+            self._conn = self._connect()
+            self._conn.send_message(message)
+
+    def send(self, email_from, email_to, email_subject, email_body):
+        import smtplib
+        message = build_email_message(email_from, email_to, email_subject, email_body)
+        try:
+            self._deliver(message)
+        except (smtplib.SMTPException, OSError) as e:
+            # like the gmail backend - log it and go on (the next send reconnects)
+            logger.error('SMTP send to %s through %s:%s failed:%s', email_to, self.host, self.port, e)
+            self.close()
+            return None
+        return {'id': message['Message-ID']}
+
+    def close(self):
+        if self._conn is not None:
+            import smtplib
+            try:
+                self._conn.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._conn = None
+
+
+class FileNotifier(Notifier):
+    '''
+    append each message as one json line to filename
+    '''
+    backend = 'file'
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    @timed_send
+    def send(self, email_from, email_to, email_subject, email_body):
+        from email.utils import make_msgid
+        msgid = make_msgid()
+        rec = {
+            'id': msgid,
+            'now': datetime.datetime.now().strftime('%Y-%m-%d:%H:%M:%S'),
+            'email_from': email_from,
+            'email_to': email_to,
+            'email_subject': email_subject,
+            'email_body': email_body,
+        }
+        with open(self.filename, 'a') as sink:
+            sink.write(json.dumps(rec) + '\n')
+        return {'id': msgid}
+
+
+class RateLimitedNotifier(Notifier):
+    '''
+    wrap a notifier with a per audience (email_to) token bucket
+
+    notifier - the backend that actually delivers the messages
+    limiter - kvratelimit.AudienceRateLimiter holding the persisted bucket state
+
+    a message sent when the bucket is empty is not delivered - send() returns
+    {'id': None, 'suppressed': True} - and is rolled up into a summary message
+    delivered ahead of the next message (or on flush/close) once a token is available
+    (a summary that fails to send is kept and tried again)
+
+    send_now() - delivers even when the bucket is empty (control actions)
+    '''
+
+    def __init__(self, notifier, limiter):
+        self.notifier = notifier
+        self.limiter = limiter
+        self.backend = notifier.backend
+
+    def _send_summary(self, audience):
+        summary = self.limiter.peek_summary(audience)
+        if not summary:
+            return
+        try:
+            sent = self.notifier.send(summary['email_from'], summary['email_to'], summary['email_subject'], summary['email_body'])
+        except Exception as e:
+            logger.error('Suppressed alert summary to [%s] failed:%s', audience, e)
+            sent = None
+        if sent:
+            self.limiter.summary_sent(audience, summary['count'])
+            logger.info('Sent suppressed alert summary to [%s]:%s', audience, message_id(sent))
+        else:
+            # the suppressed messages are kept - the summary is tried again on the next send/flush
+            logger.warning('Suppressed alert summary to [%s] not sent - kept %d message(s)', audience, summary['count'])
+
+    def send(self, email_from, email_to, email_subject, email_body):
+        # the summary of what we held back goes out ahead of the new message
+        self._send_summary(email_to)
+
+        if not self.limiter.acquire(email_to):
+            self.limiter.suppress(email_from, email_to, email_subject)
+            self.limiter.save()
+            return {'id': None, 'suppressed': True}
+
+        self.limiter.save()
+        return self.notifier.send(email_from, email_to, email_subject, email_body)
+
+    def send_now(self, email_from, email_to, email_subject, email_body):
+        '''
+        deliver a message that must not be held back (eg. a control action) - it takes a
+        token when one is available so it still counts against the audience
+        '''
+        self._send_summary(email_to)
+        self.limiter.acquire(email_to)
+        self.limiter.save()
+        return self.notifier.send(email_from, email_to, email_subject, email_body)
+
+    def flush(self):
+        '''
+        send the summary for every audience whose bucket has refilled
+        '''
+        for audience in self.limiter.pending_audiences():
+            self._send_summary(audience)
+        self.limiter.save()
+
+    def refresh(self, email_from):
+        self.notifier.refresh(email_from)
+
+    def close(self):
+        self.flush()
+        self.notifier.close()
+
+
+def notifier_from_optiondict(optiondict):
+    '''
+    return the notifier backend defined by the optiondict settings:
+
+        notify_backend - gmail (default), smtp or file
+        scopes, file_token_json, file_credentials_json - gmail settings
+        smtp_host, smtp_port, smtp_user, smtp_password, smtp_starttls - smtp settings
+        notify_filename - file sink settings
+        notify_rate_filename - when set the backend is rate limited per recipient list
+                               and the bucket state is saved in this file
+        notify_rate_capacity, notify_rate_refill_seconds - bucket size and seconds to earn back a message
+
+    the same notifier object is returned for the same settings so
+    connections are reused within a run
+    '''
+    backend = optiondict.get('notify_backend') or 'gmail'
+
+    if backend == 'gmail':
+        key = (backend, str(optiondict.get('scopes')), optiondict.get('file_token_json'),
+               optiondict.get('file_credentials_json'))
+    elif backend == 'smtp':
+        key = (backend, optiondict.get('smtp_host'), optiondict.get('smtp_port'), optiondict.get('smtp_user'),
+               optiondict.get('smtp_starttls'))
+    elif backend == 'file':
+        key = (backend, optiondict.get('notify_filename'))
+    else:
+        logger.error('Unknown notify_backend:%s', backend)
+        raise Exception(u'Unknown notify_backend:{} - valid values:{}'.format(backend, NOTIFY_BACKENDS))
+
+    # rate limit settings are part of what makes this notifier unique
+    if optiondict.get('notify_rate_filename'):
+        key += (optiondict.get('notify_rate_filename'), optiondict.get('notify_rate_capacity'),
+                optiondict.get('notify_rate_refill_seconds'))
+
+    if key in _notifier_cache:
+        return _notifier_cache[key]
+
+    if backend == 'gmail':
+        notifier = GmailNotifier(optiondict.get('scopes'), optiondict.get('file_token_json'),
+                                 optiondict.get('file_credentials_json'))
+    elif backend == 'smtp':
+        notifier = SMTPNotifier(optiondict.get('smtp_host') or 'localhost',
+                                optiondict.get('smtp_port') or 25,
+                                optiondict.get('smtp_user'),
+                                optiondict.get('smtp_password'),
+                                bool(optiondict.get('smtp_starttls')))
+    else:
+        if not optiondict.get('notify_filename'):
+            raise Exception(u'notify_backend:file requires notify_filename to be set')
+        notifier = FileNotifier(optiondict['notify_filename'])
+
+    if optiondict.get('notify_rate_filename'):
+        import kvratelimit
+        limiter = kvratelimit.AudienceRateLimiter(optiondict['notify_rate_filename'],
+                                                  optiondict.get('notify_rate_capacity') or 5,
+                                                  optiondict.get('notify_rate_refill_seconds') or 900)
+        notifier = RateLimitedNotifier(notifier, limiter)
+
+    logger.debug('Created notifier backend:%s', backend)
+    _notifier_cache[key] = notifier
+    return notifier
+
+
+def close_notifiers():
+    '''
+    close every notifier created from optiondict settings
+    '''
+    for notifier in _notifier_cache.values():
+        notifier.close()
+    _notifier_cache.clear()
+
+# eof
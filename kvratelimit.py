@@ -0,0 +1,151 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.01
+
+Token bucket rate limiting of alert messages per audience (recipient list)
+
+Each audience gets a bucket holding up to "capacity" tokens that refills
+one token every "refill_seconds".  Sending a message takes a token.
+When the bucket is empty the message is suppressed and remembered so it
+can be rolled up into one summary message once the bucket refills.
+
+The bucket levels and the suppressed messages are persisted to a json
+state file so the limit holds across runs of a cron driven program.
+
+'''
+
+import os
+import time
+import datetime
+
+import kvutil
+
+# setup the logger
+import logging
+
+logger = logging.getLogger(__name__)
+
+# set the module version number
+AppVersion = '1.01'
+__version__ = '1.01'
+
+
+def audience_key(email_to):
+    '''
+    normalize a recipient list so the same set of addresses is one audience
+    '''
+    return ', '.join(sorted(addr.strip().lower() for addr in email_to.split(',') if addr.strip()))
+
+
+class AudienceRateLimiter:
+    '''
+    per audience token buckets with persisted state
+
+    state_filename - json file holding the bucket state between runs
+    capacity - max number of messages sent in a burst
+    refill_seconds - seconds to earn back one token
+    clock - function returning the current time in seconds (default: time.time)
+    '''
+
+    def __init__(self, state_filename, capacity=5, refill_seconds=900, clock=time.time):
+        self.state_filename = state_filename
+        self.capacity = float(capacity)
+        self.refill_seconds = float(refill_seconds)
+        self.clock = clock
+        self.state = self._load()
+
+    def _load(self):
+        if self.state_filename and os.path.exists(self.state_filename):
+            try:
+                return kvutil.load_json_file_to_dict(self.state_filename)
+            except Exception as e:
+                logger.warning('Unable to read rate limit state %s - starting over:%s', self.state_filename, e)
+        return {}
+
+    def save(self):
+        if self.state_filename:
+            kvutil.dump_dict_to_json_file(self.state_filename, self.state)
+
+    def _bucket(self, email_to):
+        '''
+        return the bucket for this audience refilled to the current time
+        '''
+        now = self.clock()
+        bucket = self.state.setdefault(audience_key(email_to), {
+            'tokens': self.capacity,
+            'updated': now,
+            'suppressed': [],
+        })
+        elapsed = max(0.0, now - bucket['updated'])
+        bucket['tokens'] = min(self.capacity, bucket['tokens'] + elapsed / self.refill_seconds)
+        bucket['updated'] = now
+        return bucket
+
+    def tokens(self, email_to):
+        return self._bucket(email_to)['tokens']
+
+    def acquire(self, email_to):
+        '''
+        take a token for this audience - return False if the bucket is empty
+        '''
+        bucket = self._bucket(email_to)
+        if bucket['tokens'] >= 1.0:
+            bucket['tokens'] -= 1.0
+            return True
+        return False
+
+    def suppress(self, email_from, email_to, email_subject):
+        '''
+        remember a message that was not sent because the bucket was empty
+        '''
+        bucket = self._bucket(email_to)
+        bucket['suppressed'].append({
+            'now': datetime.datetime.fromtimestamp(self.clock()).strftime('%Y-%m-%d:%H:%M:%S'),
+            'email_from': email_from,
+            'email_to': email_to,
+            'email_subject': email_subject,
+        })
+        logger.info('Rate limit reached for [%s] - suppressed:%s', email_to, email_subject)
+
+    def suppressed(self, email_to):
+        return self._bucket(email_to)['suppressed']
+
+    def pending_audiences(self):
+        '''
+        list of audiences holding suppressed messages
+        '''
+        return [key for key, bucket in self.state.items() if bucket['suppressed']]
+
+    def peek_summary(self, audience):
+        '''
+        if this audience has suppressed messages and a token is available return the
+        summary message dict (keys: email_from, email_to, email_subject, email_body, count)
+        otherwise return None
+
+        nothing is taken - call summary_sent() once the summary was delivered so a failed
+        send keeps the suppressed messages for the next try
+        '''
+        bucket = self._bucket(audience)
+        if not bucket['suppressed'] or bucket['tokens'] < 1.0:
+            return None
+        suppressed = bucket['suppressed']
+        lines = ['{} - {}'.format(rec['now'], rec['email_subject']) for rec in suppressed]
+        return {
+            'email_from': suppressed[-1]['email_from'],
+            'email_to': suppressed[-1]['email_to'],
+            'email_subject': 'Alert summary - {} message(s) suppressed by rate limit'.format(len(suppressed)),
+            'email_body': 'The following alerts were not sent because too many alerts were generated:\n'
+                          + '\n'.join(lines),
+            'count': len(suppressed),
+        }
+
+    def summary_sent(self, audience, count):
+        '''
+        the summary of the first count suppressed messages was delivered - take the token and drop them
+        '''
+        bucket = self._bucket(audience)
+        bucket['tokens'] = max(0.0, bucket['tokens'] - 1.0)
+        bucket['suppressed'] = bucket['suppressed'][count:]
+
+# eof
@@ -0,0 +1,214 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Run tasks in one long running process - each on its own cadence
+
+Task - a function run every interval_seconds plus a random 0..jitter_seconds
+    (tasks on the same cadence do not all start at the same moment).  The
+    jitter is added to each run - it does not move the cadence.
+
+Scheduler - runs the tasks one at a time in the calling thread so a task
+    never overlaps itself or another task.  When a run takes longer than
+    the interval, the runs that came due while it ran are skipped (and
+    counted) instead of being run back to back, and the task stays on its
+    cadence.  An exception in a task is logged and counted - the scheduler
+    keeps going.
+
+The seconds each run took are kept in a histogram per task (see
+kvmetrics.Histogram) - add_metrics() puts the task counts and histograms
+in a kvmetrics.MetricsRegistry.
+
+instance_lock(filename) - hold an exclusive lock so a second copy of the
+    scheduler (or a leftover cron entry using the same lock) cannot run
+
+'''
+
+import os
+import time
+import random
+import threading
+
+import kvmetrics
+
+# setup the logger
+import logging
+
+logger = logging.getLogger(__name__)
+
+# set the module version number
+AppVersion = '1.00'
+__version__ = '1.00'
+
+
+class Task:
+    '''
+    a function run on a cadence
+
+    name - used in the log and the metric labels
+    func - called with no arguments
+    interval_seconds - seconds between the start of each run
+    jitter_seconds - random seconds (0..jitter_seconds) added to each run
+    run_at_start - first run when the scheduler starts (False - after one interval)
+    buckets - histogram buckets for the run seconds (default: kvmetrics.DURATION_BUCKETS)
+
+    runs/errors/skipped - counts since the scheduler started
+    last_seconds - seconds the last run took
+    durations - kvmetrics.Histogram of the run seconds
+    '''
+
+    def __init__(self, name, func, interval_seconds, jitter_seconds=0, run_at_start=True, buckets=kvmetrics.DURATION_BUCKETS):
+        if interval_seconds <= 0:
+            logger.error('Task %s interval_seconds must be greater than zero:%s', name, interval_seconds)
+            raise Exception(u'Task {} interval_seconds must be greater than zero:{}'.format(name, interval_seconds))
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.jitter_seconds = jitter_seconds
+        self.run_at_start = run_at_start
+        self.runs = 0
+        self.errors = 0
+        self.skipped = 0
+        self.last_seconds = None
+        self.durations = kvmetrics.Histogram(buckets)
+        # the cadence slot this task is waiting on and the time it runs (slot plus jitter)
+        self.due = None
+        self.next_run = None
+
+
+class Scheduler:
+    '''
+    run tasks on their cadence one at a time
+
+    tasks - list of Task
+    on_run - function(scheduler, task) called after each run (eg. to write the metrics)
+    clock - function returning the current time in seconds (default: time.monotonic)
+    sleep - function(seconds) used to wait (default: wait on the stop event so stop() wakes it)
+    rand - function(low, high) returning the jitter (default: random.uniform)
+
+    run(max_runs) - run until stop() is called (or max_runs task runs)
+    run_due() - run the task that is due next (waiting for it)
+    stop() - finish the current run and return from run()
+    '''
+
+    def __init__(self, tasks, on_run=None, clock=time.monotonic, sleep=None, rand=random.uniform):
+        self.tasks = list(tasks)
+        self.on_run = on_run
+        self.clock = clock
+        self.rand = rand
+        self._stop = threading.Event()
+        self.sleep = sleep or self._stop.wait
+        now = self.clock()
+        for task in self.tasks:
+            self._set_next_run(task, now if task.run_at_start else now + task.interval_seconds)
+
+    def _set_next_run(self, task, due):
+        task.due = due
+        task.next_run = due + (self.rand(0, task.jitter_seconds) if task.jitter_seconds else 0)
+
+    def _plan(self, task):
+        '''
+        move task to its next slot on the cadence - the slots that passed while it waited or ran are skipped
+        '''
+        due = task.due + task.interval_seconds
+        now = self.clock()
+        if due <= now:
+            missed = int((now - due) // task.interval_seconds) + 1
+            task.skipped += missed
+            logger.warning('Task %s ran past its next run - skipped %d run(s)', task.name, missed)
+            due += missed * task.interval_seconds
+        self._set_next_run(task, due)
+
+    def run_task(self, task):
+        '''
+        run task now - record the seconds it took and count an exception as an error
+        '''
+        start = self.clock()
+        try:
+            task.func()
+        except Exception:
+            task.errors += 1
+            logger.exception('Task %s failed', task.name)
+        finally:
+            task.last_seconds = self.clock() - start
+            task.durations.observe(task.last_seconds)
+            task.runs += 1
+        logger.info('Task %s ran in %.3f seconds', task.name, task.last_seconds)
+
+    def run_due(self):
+        '''
+        wait for the next task to come due and run it
+
+        returns the task run - None if stop() was called while waiting
+        '''
+        task = min(self.tasks, key=lambda x: x.next_run)
+        wait = task.next_run - self.clock()
+        if wait > 0:
+            self.sleep(wait)
+        if self._stop.is_set():
+            return None
+        self.run_task(task)
+        self._plan(task)
+        if self.on_run:
+            self.on_run(self, task)
+        return task
+
+    def run(self, max_runs=None):
+        '''
+        run the tasks until stop() is called (or max_runs runs - used for testing)
+        '''
+        if not self.tasks:
+            logger.warning('No tasks to schedule')
+            return
+        logger.info('Scheduler started - %s', ', '.join('{} every {}s'.format(x.name, x.interval_seconds) for x in self.tasks))
+        runs = 0
+        try:
+            while not self._stop.is_set() and (max_runs is None or runs < max_runs):
+                if self.run_due():
+                    runs += 1
+        except KeyboardInterrupt:
+            logger.info('Scheduler stopped by keyboard interrupt')
+        logger.info('Scheduler stopped after %d runs', runs)
+
+    def stop(self):
+        self._stop.set()
+
+    def add_metrics(self, metrics):
+        '''
+        add the task counts and run seconds histograms to a kvmetrics.MetricsRegistry
+        '''
+        for task in self.tasks:
+            labels = {'task': task.name}
+            metrics.gauge('task_runs', task.runs, labels, 'runs of each task since the scheduler started')
+            metrics.gauge('task_errors', task.errors, labels, 'runs of each task that raised an exception')
+            metrics.gauge('task_skipped', task.skipped, labels, 'runs skipped because the task was still running')
+            metrics.gauge('task_last_duration_seconds', task.last_seconds, labels, 'seconds the last run of each task took')
+            metrics.histogram('task_duration_seconds', task.durations, labels, 'seconds each run of each task took')
+
+
+def instance_lock(filename):
+    '''
+    take an exclusive lock on filename (created if needed) - held until the process exits
+    raises an exception when another process holds the lock
+
+    returns the open file descriptor - None on a platform without fcntl (not enforced)
+    '''
+    try:
+        import fcntl
+    except ImportError:
+        logger.info('No fcntl on this platform - instance lock not enforced:%s', filename)
+        return None
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        logger.error('Another process holds the lock:%s', filename)
+        raise Exception(u'Another process holds the lock:{}'.format(filename))
+    # record who holds it
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode('ascii'))
+    return fd
+
+# eof
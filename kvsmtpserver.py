@@ -0,0 +1,164 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Minimal local SMTP server used as a stand-in for a real mail server
+so the notifier backends can be tested and benchmarked offline
+
+Only the commands smtplib needs to deliver a plain message are
+supported (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT).
+Every message received is kept in memory on the server object.
+
+Usage:
+
+    with kvsmtpserver.LocalSMTPServer() as server:
+        # point smtplib / kvnotifier at server.host, server.port
+        ...
+        print(server.messages)
+
+'''
+
+import socketserver
+import threading
+
+# setup the logger
+import logging
+
+logger = logging.getLogger(__name__)
+
+# set the module version number
+AppVersion = '1.00'
+__version__ = '1.00'
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    '''
+    handle one client connection - many messages can be sent on one connection
+    '''
+
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('utf-8'))
+
+    def handle(self):
+        server = self.server.owner
+        with server.lock:
+            server.connections += 1
+
+        mail_from = None
+        rcpt_tos = []
+
+        self.reply('220 localhost kvsmtpserver ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.decode('utf-8', errors='replace').rstrip('\r\n')
+            verb = line[:4].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                mail_from = line.split(':', 1)[1].strip()
+                rcpt_tos = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                rcpt_tos.append(line.split(':', 1)[1].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data_lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    # remove dot stuffing
+                    if data.startswith(b'..'):
+                        data = data[1:]
+                    data_lines.append(data)
+                with server.lock:
+                    server.messages.append({
+                        'mail_from': mail_from,
+                        'rcpt_tos': rcpt_tos,
+                        'data': b''.join(data_lines).decode('utf-8', errors='replace'),
+                    })
+                mail_from = None
+                rcpt_tos = []
+                self.reply('250 OK: queued')
+            elif verb == 'RSET':
+                mail_from = None
+                rcpt_tos = []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalSMTPServer:
+    '''
+    local SMTP stand-in that runs on a background thread
+
+    host - interface to listen on (default: 127.0.0.1)
+    port - port to listen on (default: 0 - let the OS pick a free port)
+
+    messages - list of dicts (mail_from, rcpt_tos, data) received
+    connections - number of client connections accepted
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.messages = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        self._server = _ThreadingTCPServer((self.host, self.port), _SMTPHandler)
+        self._server.owner = self
+        # capture the port the OS assigned
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='kvsmtpserver', daemon=True)
+        self._thread.start()
+        logger.debug('Local SMTP server listening on %s:%s', self.host, self.port)
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import time
+
+    with LocalSMTPServer(port=8025) as server:
+        print('Local SMTP server listening on {}:{} - ctrl-c to stop'.format(server.host, server.port))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        print('Messages received:', len(server.messages))
+
+# eof
@@ -3,18 +3,18 @@ from __future__ import print_function
 '''
 @author:   Ken Venner
 @contact:  ken@venerllc.com
-@version:  1.75
+@version:  1.85
 
 Library of tools used in general by KV
 '''
 
 import glob
+import fnmatch
 import os
 import datetime
-import pprint
 
 # moved datetime processing to its own module
-import kvdate
+# (kvdate is imported where a date option is converted - most programs never need it)
 
 # these were pulled out and put in kvdate.py
 # from dateutil import tz
@@ -23,7 +23,7 @@ import kvdate
 import sys
 import errno
 import json
-from distutils.util import strtobool
+import operator
 
 # setup the logger
 import logging
@@ -31,8 +31,8 @@ import logging
 logger = logging.getLogger(__name__)
 
 # set the module version number
-AppVersion = '1.75'
-__version__ = '1.75'
+AppVersion = '1.85'
+__version__ = '1.85'
 HELP_KEYS = ('help', 'helpall',)
 HELP_VALUE_TABLE = ('tbl', 'table', 'helptbl', 'fmt',)
 
@@ -40,6 +40,97 @@ HELP_VALUE_TABLE = ('tbl', 'table', 'helptbl', 'fmt',)
 # import ast
 #   and call bool(ast.literal_eval(value)) 
 
+# strings accepted for a bool option (distutils.util.strtobool - distutils is removed in python 3.12)
+TRUE_STRINGS = ('y', 'yes', 't', 'true', 'on', '1')
+FALSE_STRINGS = ('n', 'no', 'f', 'false', 'off', '0')
+
+
+# convert a string to a bool - raise ValueError if it is not a bool string (UT)
+def str2bool(value):
+    val = str(value).lower()
+    if val in TRUE_STRINGS:
+        return True
+    if val in FALSE_STRINGS:
+        return False
+    raise ValueError(u'invalid truth value {!r}'.format(value))
+
+
+# signature of the config files - [filename, mtime_ns, size] (None when the file is missing) (UT)
+#   a daemon can compare the signature of optiondict['conf_json'] to see if it should reload
+def conf_json_signature(conf_json_files):
+    signature = []
+    for conf_json_file in conf_json_files or []:
+        try:
+            st = os.stat(conf_json_file)
+            signature.append([conf_json_file, st.st_mtime_ns, st.st_size])
+        except OSError:
+            signature.append([conf_json_file, None, None])
+    return signature
+
+
+# pprint imports dataclasses/inspect - load it only when a diagnostic is printed
+def _pprint(obj):
+    import pprint
+    pprint.pprint(obj)
+
+
+# key of the kv_parse_command_line cache - everything the parsed options depend on
+#   the default options a parse adds to optiondictconfig (tagged applied) are left out so
+#   parsing with the same optiondictconfig again gives the same key
+def _kv_parse_cache_key(optiondictconfig, raise_error, keymapdict, conf_json_files):
+    import hashlib
+    app_config = sorted((key, sorted((k, v) for k, v in value.items() if k != 'error'))
+                        for key, value in optiondictconfig.items() if not value.get('applied'))
+    digest = hashlib.sha1(repr((app_config, raise_error,
+                                sorted((keymapdict or {}).items()))).encode('utf-8')).hexdigest()
+    return [AppVersion, digest, sys.argv[1:], conf_json_signature(conf_json_files)]
+
+
+# the option cache is json (loading it never runs code) - datetime values are saved as {'__datetime__': iso}
+def _kv_parse_cache_default(value):
+    if isinstance(value, datetime.datetime) and (value.tzinfo is None or isinstance(value.tzinfo, datetime.timezone)):
+        return {'__datetime__': value.isoformat()}
+    raise TypeError(u'{} value can not be saved in the option cache'.format(type(value).__name__))
+
+
+def _kv_parse_cache_hook(obj):
+    if len(obj) == 1 and '__datetime__' in obj:
+        return datetime.datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+# load the cached options if they were built from the same inputs - otherwise None
+def _kv_parse_cache_load(cache_filename, cache_key):
+    if not os.path.exists(cache_filename):
+        return None
+    try:
+        with open(cache_filename, 'r') as cache_in:
+            cache = json.loads(cache_in.read(), object_hook=_kv_parse_cache_hook)
+    except Exception as e:
+        logger.warning('Unable to read option cache %s - rebuilding:%s', cache_filename, e)
+        return None
+    if not isinstance(cache, dict) or cache.get('key') != cache_key:
+        logger.debug('Option cache out of date:%s', cache_filename)
+        return None
+    return cache
+
+
+# save the options - replaced atomically so a reader never sees a partial file
+#   options that do not come back the same from json (eg. tuples, timezones other than fixed offsets) are not cached
+def _kv_parse_cache_save(cache_filename, cache_key, optiondict, applied):
+    cache = {'key': cache_key, 'optiondict': optiondict, 'applied': applied}
+    try:
+        text = json.dumps(cache, default=_kv_parse_cache_default)
+        if json.loads(text, object_hook=_kv_parse_cache_hook) != cache:
+            logger.warning('Options can not be saved as json without changing them - not cached:%s', cache_filename)
+            return
+        # the options can hold passwords - only this user can read the cache
+        write_file_atomic(cache_filename, text, perms=0o600)
+    except Exception as e:
+        # options that can not be saved are rebuilt next run
+        logger.warning('Unable to save option cache %s:%s', cache_filename, e)
+
+
 # ken's command line processor (UT)
 #   expects options defined as key=value pair strings on the command line
 # input:
@@ -79,7 +170,12 @@ HELP_VALUE_TABLE = ('tbl', 'table', 'helptbl', 'fmt',)
 #
 #  if <value> in list ('tbl','table','helptbl','fmt'), then the output is mark down table
 #
-def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None, debug=False):
+# -- Option cache
+#  cache_filename - when set the final optiondict is saved to this file keyed by the command line,
+#  optiondictconfig and the modified time and size of the conf_json files - the next run with the
+#  same inputs uses the saved options and skips reading the config files and converting the values
+#
+def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None, debug=False, cache_filename=None):
     # debug
     if debug: print('kv_parse_command_line:sys.argv:', sys.argv)
     if debug: print('kv_parse_command_line:optiondictconfig:', optiondictconfig)
@@ -156,6 +252,9 @@ def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None,
         },
     }
 
+    # key the cache on the app definition before defaults get added to it
+    cache_config = {key: dict(value) for key, value in optiondictconfig.items()} if cache_filename else None
+
     # create the dictionary - and populate values from configuration passed in
     optiondict = {}
     for key in optiondictconfig:
@@ -218,6 +317,18 @@ def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None,
             optiondict['conf_json'] = conf_json_files
         logger.debug('Config files defined on optiondictconfig:%s', conf_json_files)
 
+    # use the options saved by the last run when nothing they depend on changed
+    cache_key = None
+    if cache_filename and not any(key in HELP_KEYS for key in cmdlineargs):
+        cache_key = _kv_parse_cache_key(cache_config, raise_error, keymapdict, conf_json_files)
+        cache = _kv_parse_cache_load(cache_filename, cache_key)
+        if cache:
+            logger.debug('Options loaded from cache:%s', cache_filename)
+            # the default options used are added to optiondictconfig as a full parse does
+            for key in cache['applied']:
+                optiondictconfig[key] = dict(defaultdictconfig[key], applied=True)
+            return _kv_parse_command_line_finish(cache['optiondict'], debug)
+
     # step through all the configuration files reading in the settings
     # and flatten them out into a final configuratin file based dictionary
     confargs = {}
@@ -274,8 +385,8 @@ def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None,
         if key not in optiondictconfig and key in defaultdictconfig:
             if debug: print('kv_parse_command_line:key-not-in-optiondictconfig-but-in-defaultoptiondictconfig:', key)
             logger.debug('Key-not-in-optiondictconfig-but-in-defaultoptiondictconfig:%s', key)
-            # copy over this default into optiondict
-            optiondictconfig[key] = defaultdictconfig[key].copy()
+            # copy over this default into optiondict - tagged as a default we added
+            optiondictconfig[key] = dict(defaultdictconfig[key], applied=True)
             # tag the defaultdictconfig that we used this key
             defaultdictconfig[key]['applied'] = True
             # set the value
@@ -297,7 +408,7 @@ def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None,
                 if debug: print('type not in optiondictconfig[key]')
                 logger.debug('Type not in optiondictconfig[key] for key:%s', key)
             elif optiondictconfig[key]['type'] == 'bool':
-                optiondict[key] = bool(strtobool(value))
+                optiondict[key] = str2bool(value)
             elif optiondictconfig[key]['type'] == 'int':
                 optiondict[key] = int(value)
             elif optiondictconfig[key]['type'] == 'float':
@@ -307,8 +418,10 @@ def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None,
             elif optiondictconfig[key]['type'] == 'liststr':
                 optiondict[key] = value.split(',')
             elif optiondictconfig[key]['type'] == 'date':
+                import kvdate
                 optiondict[key] = kvdate.datetime_from_str(value)
             elif optiondictconfig[key]['type'] == 'datetimezone':
+                import kvdate
                 optiondict[key] = kvdate.datetimezone_from_str(value)
             elif optiondictconfig[key]['type'] == 'inlist':
                 # value must be from a predefined list of acceptable values
@@ -369,6 +482,16 @@ def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None,
         raise Exception(errmsg)
         # sys.exit(1)
 
+    # save what we built for the next run
+    if cache_key:
+        _kv_parse_cache_save(cache_filename, cache_key, optiondict,
+                             [key for key in defaultdictconfig if defaultdictconfig[key].get('applied')])
+
+    return _kv_parse_command_line_finish(optiondict, debug)
+
+
+# the steps run on the final optiondict - built or loaded from the cache
+def _kv_parse_command_line_finish(optiondict, debug=False):
     # debug when we are done
     if debug: print('kv_parse_command_line:optiondict:', optiondict)
     logger.debug('optiondict:%s', optiondict)
@@ -540,18 +663,37 @@ def filename_log_day_of_month(filename, ext_override=None, path_override=None):
 
 # return the filename that is max or min for a given query (UT)
 # default is to return the MIN filematch
-def filename_maxmin(file_glob, reverse=False):
+#   by - name (default) or mtime (modified time - ties broken by name)
+#   use_cache - reuse the directory listing until the directory mtime changes (see scandir_index)
+def filename_maxmin(file_glob, reverse=False, by='name', use_cache=False):
     # pull the list of files
-    filelist = glob.glob(file_glob)
+    filelist = filename_glob(file_glob, use_cache=use_cache)
     # debugging
     logger.debug('filelist:%s', filelist)
     # if we got no files - return none
     if not filelist:
         logger.debug('Return none')
         return None
-    logger.debug('File:%s', sorted(filelist, reverse=reverse)[0])
-    # sort this list - and return the desired value
-    return sorted(filelist, reverse=reverse)[0]
+    # one pass to find the extreme - no sort
+    pick = max if reverse else min
+    if by == 'mtime':
+        mtimes = {}
+        for fname in filelist:
+            try:
+                mtimes[fname] = os.stat(fname).st_mtime_ns
+            except OSError:
+                # removed since the directory was listed
+                continue
+        if not mtimes:
+            return None
+        found = pick(mtimes, key=lambda fname: (mtimes[fname], fname))
+    elif by == 'name':
+        found = pick(filelist)
+    else:
+        logger.error('Unknown filename_maxmin by:%s', by)
+        raise Exception(u'Unknown filename_maxmin by:{} - valid values:name,mtime'.format(by))
+    logger.debug('File:%s', found)
+    return found
 
 
 # create a filename from part of a filename
@@ -613,51 +755,114 @@ def filename_splitall(path):
     return allparts
 
 
+# directory listings built by scandir_index - key = absolute directory path
+# value = ((directory mtime_ns, ctime_ns, size), list of (name, is_file))
+# holds at most SCANDIR_INDEX_CACHE_SIZE directories - the oldest listing is dropped first
+_scandir_index_cache = {}
+SCANDIR_INDEX_CACHE_SIZE = 256
+
+
+# list the entries of a directory with one os.scandir pass - the listing is
+# cached and reused until the directory mtime, ctime or size changes (a file is added,
+# removed or renamed - ctime/size catch a change inside the mtime granularity)
+#
+# returns list of (name, is_file) - raises OSError if the directory does not exist
+#
+# note: only the names are cached - a file changed in place does not change the
+# directory mtime so callers must stat files they need current ages for
+def scandir_index(dirpath, use_cache=True):
+    if not dirpath:
+        dirpath = '.'
+    key = os.path.abspath(dirpath)
+    st = os.stat(key)
+    dir_sig = (st.st_mtime_ns, st.st_ctime_ns, st.st_size)
+    if use_cache and key in _scandir_index_cache and _scandir_index_cache[key][0] == dir_sig:
+        return _scandir_index_cache[key][1]
+    entries = []
+    with os.scandir(key) as it:
+        for entry in it:
+            try:
+                entries.append((entry.name, entry.is_file()))
+            except OSError:
+                continue
+    if use_cache:
+        _scandir_index_cache.pop(key, None)
+        if len(_scandir_index_cache) >= SCANDIR_INDEX_CACHE_SIZE:
+            del _scandir_index_cache[next(iter(_scandir_index_cache))]
+        _scandir_index_cache[key] = (dir_sig, entries)
+    logger.debug('scandir_index:%s:%d entries', key, len(entries))
+    return entries
+
+
+# return the list of filenames that match a glob pattern using the scandir_index
+# of the pattern directory instead of a glob.glob directory walk on every call
+#
+# patterns with wildcards in the directory part are passed to glob.glob
+# like glob - names starting with "." only match patterns that start with "."
+#   use_cache - reuse the directory listing until the directory changes (see scandir_index)
+def filename_glob(file_glob, files_only=False, use_cache=False):
+    dirpath, namepat = os.path.split(file_glob)
+    if glob.has_magic(dirpath) or not glob.has_magic(namepat):
+        # not a single directory pattern - use glob directly
+        flist = glob.glob(file_glob)
+        if files_only:
+            flist = [x for x in flist if os.path.isfile(x)]
+        return flist
+    try:
+        entries = scandir_index(dirpath, use_cache=use_cache)
+    except OSError:
+        return []
+    match_hidden = namepat.startswith('.')
+    flist = []
+    for name, is_file in entries:
+        if files_only and not is_file:
+            continue
+        if name.startswith('.') and not match_hidden:
+            continue
+        if fnmatch.fnmatch(name, namepat):
+            flist.append(os.path.join(dirpath, name))
+    return flist
+
+
 # create a list of filenames given a name, a list of names, file glob,
 # list of include files in a file, list of exclue files in a file
+#   globs are matched with one scandir per directory (filename_glob)
+#   use_cache - reuse the directory listing until the directory mtime changes (see scandir_index)
 def filename_list(filename=None, filenamelist=None, fileglob=None, strippath=False, includelist_filename=None,
-                  excludefilenamelist=None, excludelist_filename=None, glob_filename=None):
+                  excludefilenamelist=None, excludelist_filename=None, glob_filename=None, use_cache=False):
     # local variable
-    flist = []
-    exclude_list = []
+    flist = set()
+    exclude_set = set()
     # read list from files provide
     if includelist_filename:
-        flist = read_list_from_file_lines(includelist_filename, trim=True)
+        flist.update(iter_file_lines(includelist_filename, trim=True))
     if excludelist_filename:
-        exclude_list = read_list_from_file_lines(excludelist_filename, trim=True)
+        exclude_set.update(iter_file_lines(excludelist_filename, trim=True))
     if excludefilenamelist:
-        exclude_list.extend(excludefilenamelist)
+        exclude_set.update(excludefilenamelist)
     # read list from records provided
     if fileglob:
-        flist.extend(glob.glob(fileglob))
+        flist.update(filename_glob(fileglob, use_cache=use_cache))
     if filenamelist:
-        flist.extend(filenamelist)
+        flist.update(filenamelist)
     if filename:
+        if not isinstance(filename, list):
+            filename = [filename]
         if glob_filename:
-            if isinstance(filename, list):
-                for fname in filename:
-                    flist.extend(glob.glob(fname))
-            else:
-                flist.append(glob.glob(filename))
+            for fname in filename:
+                flist.update(filename_glob(fname, use_cache=use_cache))
         else:
-            if isinstance(filename, list):
-                flist.extend(filename)
-            else:
-                flist.append(filename)
-            
+            flist.update(filename)
+
     # remove records if exclude definitions provided
-    if exclude_list:
-        for excludefile in exclude_list:
-            if excludefile in flist:
-                flist.remove(excludefile)
+    flist -= exclude_set
 
     # strip path from filename if flag is set
     if strippath:
-        for ndx in range(len(flist)):
-            flist[ndx] = os.path.basename(flist[ndx])
+        flist = set(os.path.basename(x) for x in flist)
 
     # create the unique list of filenames and return them
-    return sorted(list(set(flist)))
+    return sorted(flist)
 
 
 # create a full filename and optionally validate directory exists and is writeabile (UT)
@@ -729,6 +934,7 @@ def filename_unique(filename=None, filename_href=None, debug=False):
         'maxcnt': 100,  # maximum count to search for unique filename
         'forceuniq': False,  # do not force unique filename creation
         'overwrite': False,  # 1=overwrite an existing file
+        'claim': False,  # create the (empty) file with O_EXCL so concurrent callers get different names
         'create_dir': False,  # if true - we will create the directory specified if it does not exist
         'write_check': True,  # validate we can write in the specified directory
         'verbose_uf': 0,
@@ -810,38 +1016,47 @@ def filename_unique(filename=None, filename_href=None, debug=False):
     else:
         date_file = datetime.datetime.now().strftime(default_options['datefmt'])
 
-    # start the counter for file version number
-    unique_counter = 1
+    # the names we try in order - the filename passed in (unless forcing unique) then the counted names
+    # (the same names and maxcnt limit as the original probe loop)
+    def counted_filename(unique_counter):
+        return default_options['base_filename'] + date_file + (default_options['cntfmt'] % unique_counter) + \
+               default_options['file_ext']
 
-    # set the starting filename
-    if default_options['forceuniq']:
-        # want a unique filename - create a filename base on the filename options
-        filename = default_options['base_filename'] + date_file + (default_options['cntfmt'] % unique_counter) + \
-                   default_options['file_ext']
-    else:
-        # not a unique - try the filename passed infirst
-        filename = default_options['filename']
+    def candidate_filenames():
+        if default_options['maxcnt'] > 1:
+            yield counted_filename(1) if default_options['forceuniq'] else default_options['filename']
+        for cnt in range(2 if default_options['forceuniq'] else 1, default_options['maxcnt'] - 1):
+            yield counted_filename(cnt)
 
     # debugging
-    # print('file_unique:filename:', filename)
     # print('file_unique:default_options:', default_options)
 
-    # take action if we are not going to overwrite the filename
-    if not default_options['overwrite']:
-
-        # look for the filename that works
-        while (os.path.exists(os.path.join(default_options['file_path'], filename)) and unique_counter <
-               default_options['maxcnt']):
-            # create a new filename
-            filename = default_options['base_filename'] + date_file + (default_options['cntfmt'] % unique_counter) + \
-                       default_options['file_ext']
-            # increment the counter
-            unique_counter += 1
+    if default_options['overwrite']:
+        # we will overwrite what is there - take the first name
+        filename = default_options['filename'] if not default_options['forceuniq'] else counted_filename(1)
+    else:
+        # one directory scan - then pick the first name not in use without touching the disk per name
+        existing = set(os.path.normcase(name) for name, _ in scandir_index(default_options['file_path'], use_cache=False))
+        filename = None
+        for candidate in candidate_filenames():
+            if os.path.normcase(candidate) in existing:
+                continue
+            if default_options['claim']:
+                # create the file so a concurrent writer can not get the same name
+                try:
+                    os.close(os.open(os.path.join(default_options['file_path'], candidate),
+                                     os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+                except FileExistsError:
+                    # someone created it after our scan - try the next name
+                    continue
+            filename = candidate
+            break
 
         # test to see if we exceeded the max count and if so error out.
-        if unique_counter >= default_options['maxcnt']:
+        if filename is None:
+            filename = counted_filename(default_options['maxcnt'] - 1)
             if debug: print('kvutil:filename_unique:reached maximum count and not unique filename:', filename)
-            logger.error('Reached maximum count and not unique filename:%d:%s', unique_counter, filename)
+            logger.error('Reached maximum count and not unique filename:%d:%s', default_options['maxcnt'], filename)
             raise Exception(
                 u'kvutil:filename_unique:reached maximum count and not unique filename: {}'.format(filename))
 
@@ -880,29 +1095,87 @@ def slurp(filename):
         return t.read()
 
 
-# read in a file and create a list of each populated line (UT)
-def read_list_from_file_lines(filename, stripblank=False, trim=False, encoding=None):
-    # read in the file as a list of strings
-    if encoding:
-        with open(filename, 'r', encoding=encoding) as t:
-            filelist = t.readlines()
-    else:
-        with open(filename, 'r') as t:
-            filelist = t.readlines()
-
-    # strip the trailing \n
-    filelist = [line.strip('\n') for line in filelist]
-
-    # strip the trailing \n
-    if trim:
-        filelist = [line.strip() for line in filelist]
+# return the last populated line of a file by reading backward from the end
+# the cost is the size of the last line - not the size of the file
+def read_last_line(filename, encoding='utf-8', blocksize=4096):
+    with open(filename, 'rb') as t:
+        t.seek(0, os.SEEK_END)
+        pos = t.tell()
+        buf = b''
+        while pos > 0:
+            readsize = min(blocksize, pos)
+            pos -= readsize
+            t.seek(pos)
+            buf = t.read(readsize) + buf
+            # ignore trailing line endings/blank lines
+            stripped = buf.rstrip(b'\r\n\t ')
+            idx = stripped.rfind(b'\n')
+            if idx >= 0:
+                return stripped[idx + 1:].decode(encoding).rstrip('\r')
+        # file is a single line (or empty)
+        return buf.rstrip(b'\r\n\t ').decode(encoding)
+
+
+# generator of the lines of a file - the same transforms as read_list_from_file_lines
+# applied one line at a time so memory does not grow with the file (UT)
+def iter_file_lines(filename, stripblank=False, trim=False, encoding=None):
+    with open(filename, 'r', encoding=encoding) as t:
+        for line in t:
+            # strip the trailing \n
+            line = line.strip('\n')
+            if trim:
+                line = line.strip()
+            # if they want to strip blank lines
+            if stripblank and not line.strip():
+                continue
+            yield line
+
+
+# generator of the lines of a file through mmap - first to last or last to first (reverse)
+# the file is paged in by the OS as it is read - a reverse scan of a big log
+# only touches the pages at the end that are read (UT)
+def iter_mmap_lines(filename, reverse=False, stripblank=False, trim=False, encoding='utf-8'):
+    import mmap
+    with open(filename, 'rb') as t:
+        if os.fstat(t.fileno()).st_size == 0:
+            # mmap can not map an empty file
+            return
+        with mmap.mmap(t.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            size = len(mm)
+            if reverse:
+                # a final line ending does not start an empty last line
+                end = size - 1 if mm[size - 1:size] == b'\n' else size
+                while end >= 0:
+                    start = mm.rfind(b'\n', 0, end) + 1
+                    line = mm[start:end]
+                    end = start - 1
+                    line = line.decode(encoding).rstrip('\r')
+                    if trim:
+                        line = line.strip()
+                    if stripblank and not line.strip():
+                        continue
+                    yield line
+                    if start == 0:
+                        break
+            else:
+                start = 0
+                while start < size:
+                    end = mm.find(b'\n', start)
+                    if end < 0:
+                        end = size
+                    line = mm[start:end].decode(encoding).rstrip('\r')
+                    start = end + 1
+                    if trim:
+                        line = line.strip()
+                    if stripblank and not line.strip():
+                        continue
+                    yield line
 
-    # if they want to strip blank lines
-    if stripblank:
-        filelist = [line for line in filelist if line and line.strip()]
 
-    # return the list of lines
-    return filelist
+# read in a file and create a list of each populated line (UT)
+def read_list_from_file_lines(filename, stripblank=False, trim=False, encoding=None):
+    # one pass - one list
+    return list(iter_file_lines(filename, stripblank=stripblank, trim=trim, encoding=encoding))
 
 
 # utility used to remove a filename - in windows sometimes we have a delay
@@ -992,6 +1265,44 @@ def loggingAppStart(logger, optiondict, pgm=None):
         logger.info('AppVersion:v%s', optiondict['AppVersion'])
 
 
+# scriptinfo() result - the top level script does not change during a run
+_scriptinfo_cache = None
+
+
+def _scriptinfo_main_source():
+    '''
+    the file of the top level script from __main__ / sys.argv - None when it can not
+    be told this way (interactive, -c, or the script was started by a stdlib/site-packages
+    runner like "python -m unittest")
+    '''
+    main = sys.modules.get('__main__')
+    trc = getattr(main, '__file__', None)
+    if not trc:
+        spec = getattr(main, '__spec__', None)
+        trc = getattr(spec, 'origin', None)
+    if not trc and sys.argv and sys.argv[0] not in ('', '-c', '-m'):
+        trc = sys.argv[0]
+    if not trc or trc.startswith('<') or trc.upper().startswith(sys.exec_prefix.upper()):
+        return None
+    return trc
+
+
+def _scriptinfo_stack_source():
+    '''
+    the outermost calling file that is not a system file - walks the frames
+    directly (inspect.stack() reads the source lines of every frame)
+    '''
+    trc = ''
+    frame = sys._getframe(1)
+    while frame is not None:
+        fname = frame.f_code.co_filename
+        # skip system calls
+        if not fname.startswith("<") and not fname.upper().startswith(sys.exec_prefix.upper()):
+            trc = fname
+        frame = frame.f_back
+    return trc
+
+
 def scriptinfo():
     """
     Returns a dictionary with information about the running top level Python
@@ -1005,31 +1316,28 @@ def scriptinfo():
     When running code compiled by py2exe or cx_freeze, "source" contains
     the name of the originating Python script.
     If compiled by PyInstaller, "source" contains no meaningful information.
+
+    The script is taken from __main__ (or sys.argv[0]) and the answer is
+    saved for the rest of the run - the call stack is only walked when
+    __main__ does not name the script.
     """
+    global _scriptinfo_cache
 
-    import os
-    import sys
-    import inspect
+    if _scriptinfo_cache is not None:
+        return dict(_scriptinfo_cache)
 
-    # ---------------------------------------------------------------------------
-    # scan through call stack for caller information
-    # ---------------------------------------------------------------------------
-    trc = ''
-    for teil in inspect.stack():
-        # skip system calls
-        if teil[1].startswith("<"):
-            continue
-        if teil[1].upper().startswith(sys.exec_prefix.upper()):
-            continue
-        trc = teil[1]
+    trc = _scriptinfo_main_source()
+    if trc is None:
+        trc = _scriptinfo_stack_source()
 
     # trc contains highest level calling script name
     # check if we have been compiled
     if getattr(sys, 'frozen', False):
         scriptdir, scriptname = os.path.split(sys.executable)
-        return {"dir": scriptdir,
-                "name": scriptname,
-                "source": trc}
+        _scriptinfo_cache = {"dir": scriptdir,
+                             "name": scriptname,
+                             "source": trc}
+        return dict(_scriptinfo_cache)
 
     # from here on, we are in the interpreted case
     scriptdir, trc = os.path.split(trc)
@@ -1038,39 +1346,91 @@ def scriptinfo():
     if not scriptdir:
         scriptdir = os.getcwd()
 
-    scr_dict = {"name": trc,
-                "source": trc,
-                "dir": scriptdir}
-    return scr_dict
+    _scriptinfo_cache = {"name": trc,
+                         "source": trc,
+                         "dir": scriptdir}
+    return dict(_scriptinfo_cache)
 
 
-# utility used to dump a dictionary to a file in json format
+# utility used to load a json file into a dictionary
+#   the file is read once - on a parse error the line in error is displayed from that text
 def load_json_file_to_dict(filename):
     import json
     with open(filename, 'r') as json_in:
-        try:
-            json_dict = json.load(json_in)
-        except json.decoder.JSONDecodeError as e:
-            import re
-            with open(filename, 'r') as json_error:
-                json_lines = json_error.readlines()
-            err_line = re.search(r'line\s+(\d+)\s+', str(e))
-            print('-'*40)
-            if err_line:
-                err_line_int = int(err_line.group(1))
-                if err_line_int < len(json_lines):
-                    print('Error on line: ', err_line_int)
-                    print(json_lines[err_line_int-1])
-            print('-'*40)
-            raise
+        json_text = json_in.read()
+    try:
+        json_dict = json.loads(json_text)
+    except json.decoder.JSONDecodeError as e:
+        json_lines = json_text.splitlines()
+        print('-'*40)
+        if 0 < e.lineno <= len(json_lines):
+            print('Error on line: ', e.lineno)
+            print(json_lines[e.lineno-1])
+        print('-'*40)
+        raise
     return json_dict
 
 
-# utility used to dump a dictionary to a file in json format
-def dump_dict_to_json_file(filename, optiondict):
+# serialize to json text
+#   compact - no indent or spaces (default: indent=4)
+#   fast - use orjson when it is installed (indent is 2 - keys must be strings)
+def dumps_json(data, compact=False, fast=False):
+    if fast:
+        try:
+            import orjson
+        except ImportError:
+            pass
+        else:
+            return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2).decode('utf-8')
     import json
-    with open(filename, 'w') as json_out:
-        json.dump(optiondict, json_out, indent=4)
+    if compact:
+        return json.dumps(data, separators=(',', ':'))
+    return json.dumps(data, indent=4)
+
+
+# write text to filename atomically - write a temp file in the same directory then rename it
+# over filename - a reader (or a crash) never sees a partly written file
+#   fsync - flush the file (and the directory) to disk before returning
+#   binary - text is bytes and is written as is (encoding not used)
+#   perms - permissions of the new file (eg. 0o600 private cache, 0o644 read by another user) - when
+#           not set the file gets what a plain open() would give it and an existing file keeps its permissions
+def write_file_atomic(filename, text, fsync=False, encoding='utf-8', binary=False, perms=None):
+    import threading
+    dirname = os.path.dirname(os.path.abspath(filename))
+    tmpname = os.path.join(dirname, '.{}.{}.{}.tmp'.format(os.path.basename(filename), os.getpid(), threading.get_ident()))
+    try:
+        # created with perms so a private file is never readable by others - 0o666 less the umask otherwise
+        fd = os.open(tmpname, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666 if perms is None else perms)
+        with (os.fdopen(fd, 'wb') if binary else os.fdopen(fd, 'w', encoding=encoding)) as out:
+            out.write(text)
+            if fsync:
+                out.flush()
+                os.fsync(out.fileno())
+        if perms is not None:
+            # exactly perms - the umask applied at create
+            os.chmod(tmpname, perms)
+        elif os.path.exists(filename):
+            # keep the permissions of the file being replaced
+            os.chmod(tmpname, os.stat(filename).st_mode & 0o7777)
+        os.replace(tmpname, filename)
+    except Exception:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        # make the rename itself durable
+        dir_fd = os.open(dirname, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+# utility used to dump a dictionary to a file in json format
+#   the file is replaced atomically (see write_file_atomic)
+#   compact/fast - see dumps_json - fsync - see write_file_atomic
+def dump_dict_to_json_file(filename, optiondict, compact=False, fast=False, fsync=False):
+    write_file_atomic(filename, dumps_json(optiondict, compact=compact, fast=fast), fsync=fsync)
 
 
 # utility to convert a dict to a list of dicts that are key, value and new value
@@ -1200,7 +1560,7 @@ def create_multi_key_lookup(src_data, fldlist, copy_fields=None):
         if fld not in src_data[0]:
             print('ERROR:  Unable to find key field: ', fld)
             print('in first record:')
-            pprint.pprint(src_data[0])
+            _pprint(src_data[0])
             print('This routine will fail')
     # check that the copy_fields keys are in the first record
     if copy_fields:
@@ -1211,7 +1571,7 @@ def create_multi_key_lookup(src_data, fldlist, copy_fields=None):
             if fld not in src_data[0]:
                 print('ERROR:  Unable to find copy field: ', fld)
                 print('in first record:')
-                pprint.pprint(src_data[0])
+                _pprint(src_data[0])
                 print('This routine will fail')
     #
     # set up the dictionary to be populated
@@ -1266,7 +1626,7 @@ def create_multi_key_lookup_excel(excel_dict, fldlist, copy_fields=None):
         if fld not in excel_dict['header']:
             print('ERROR:  Unable to find key field: ', fld)
             print('in the header:')
-            pprint.pprint(excel_dict['header'])
+            _pprint(excel_dict['header'])
             print('This routine will fail')
     # check that the copy_fields keys are in the first record
     if copy_fields:
@@ -1277,7 +1637,7 @@ def create_multi_key_lookup_excel(excel_dict, fldlist, copy_fields=None):
             if fld not in excel_dict['header']:
                 print('ERROR:  Unable to find copy field: ', fld)
                 print('in the header:')
-                pprint.pprint(excel_dict['header'])
+                _pprint(excel_dict['header'])
                 print('This routine will fail')
     #
     # set up the dictionary to be populated
@@ -1313,10 +1673,226 @@ def create_multi_key_lookup_excel(excel_dict, fldlist, copy_fields=None):
     return src_lookup
 
 
+# single level lookup keyed by the tuple of the key field values
+class FlatKeyLookup(dict):
+    '''
+    lookup built by create_flat_key_lookup() - one dict keyed by the tuple of key
+    field values instead of one nested dict per key field
+
+    key_fields - the fields that make up the key (in order)
+    record_fields - None - the value is the source record
+                    list - the value is a tuple of these fields from the source record
+                           (record store - the source records can be released)
+
+    copy_matched_data and extract_unmatched_data accept this or a nested lookup
+    '''
+    __slots__ = ('key_fields', 'record_fields', 'field_index')
+
+    def __init__(self, key_fields, record_fields=None):
+        super().__init__()
+        self.key_fields = list(key_fields)
+        self.record_fields = list(record_fields) if record_fields is not None else None
+        self.field_index = {fld: idx for idx, fld in enumerate(self.record_fields or [])}
+
+    def field_refs(self, fields):
+        '''
+        list of (field, ref) - value[ref] is the field from a value in this lookup
+        (the field name for source records - the tuple position for the record store)
+        '''
+        if self.record_fields is None:
+            return [(fld, fld) for fld in fields]
+        missing = [fld for fld in fields if fld not in self.field_index]
+        if missing:
+            logger.error('Fields not in the lookup record store:%s', missing)
+            raise Exception(u'Fields not in the lookup record store:{}'.format(missing))
+        return [(fld, self.field_index[fld]) for fld in fields]
+
+    def record(self, key):
+        '''
+        the record for key as a dictionary (None if not found)
+        '''
+        value = self.get(tuple(key))
+        if value is None or self.record_fields is None:
+            return value
+        return dict(zip(self.record_fields, value))
+
+
+# function that returns the key tuple for a record - always a tuple (itemgetter returns the value for one field)
+def key_tuple_getter(key_fields):
+    if len(key_fields) == 1:
+        fld = key_fields[0]
+        return lambda rec: (rec[fld],)
+    return operator.itemgetter(*key_fields)
+
+
+# create a single level tuple keyed dictionary from a list of dictionaries
+def create_flat_key_lookup(src_data, fldlist, copy_fields=None, record_fields=None):
+    '''
+    Create a FlatKeyLookup that gets to the record based on the tuple of the
+    values of the fldlist keys in the record - the same records as
+    create_multi_key_lookup (first record wins with one key field, last record
+    wins with more than one) without a dictionary per key level
+
+    if user sets the copy_fields with the list of fields that can have values
+    then we check the record
+    to determine if any of the fields has a value, and if none have a value we skip
+    that record
+
+    record_fields - when set only these fields are kept for each record (as a tuple)
+    '''
+    if type(fldlist) is not list:
+        print('fldlist must be type - list - but is: ', type(fldlist))
+        raise TypeError()
+    if copy_fields and type(copy_fields) is not list:
+        print('copy_fields must be type - list - but is: ', type(copy_fields))
+        raise TypeError()
+    # check that the keys are in the first record
+    if src_data:
+        for fld in fldlist + (copy_fields or []) + (record_fields or []):
+            if fld not in src_data[0]:
+                print('ERROR:  Unable to find field: ', fld)
+                print('in first record:')
+                _pprint(src_data[0])
+                print('This routine will fail')
+    #
+    src_lookup = FlatKeyLookup(fldlist, record_fields)
+    get_key = key_tuple_getter(fldlist)
+    get_value = key_tuple_getter(record_fields) if record_fields else None
+    first_wins = len(fldlist) == 1
+    for rec in src_data:
+        # test that this record has values in the copy_fields attributes
+        if copy_fields and not any_field_is_populated(rec, copy_fields):
+            continue
+        key = get_key(rec)
+        if first_wins and key in src_lookup:
+            continue
+        src_lookup[key] = get_value(rec) if get_value else rec
+    #
+    return src_lookup
+
+
+# hash join - build a FlatKeyLookup from one side once and stream the other side past it
+class HashJoin:
+    '''
+    join records (dictionaries) on key fields without printing diagnostics
+
+    build_data - iterable of records held in memory (the smaller side)
+    key_fields - list of fields that make up the key in build_data
+    record_fields - when set only these fields of the build records are kept (see create_flat_key_lookup)
+    copy_fields - when set build records with none of these fields populated are skipped
+
+    the probe side is any iterable (a list, a csv.DictReader, a generator) and is
+    read one record at a time - memory is bounded by the build side
+
+    inner(probe_data) - generator of (probe record, build value) for the matches
+    anti(probe_data) - generator of the probe records with no match
+    update(probe_data, copy_fields) - generator of every probe record - copy_fields set from the match
+
+    stats - dictionary of counts updated as the records are read:
+        build_records, build_keys, build_duplicates, build_missing_key,
+        probe_records, matched, unmatched, probe_missing_key
+    '''
+
+    def __init__(self, build_data, key_fields, record_fields=None, copy_fields=None):
+        if type(key_fields) is not list:
+            raise TypeError(u'key_fields must be type - list - but is:{}'.format(type(key_fields)))
+        self.stats = {'build_records': 0, 'build_keys': 0, 'build_duplicates': 0, 'build_missing_key': 0,
+                      'probe_records': 0, 'matched': 0, 'unmatched': 0, 'probe_missing_key': 0}
+        self.lookup = FlatKeyLookup(key_fields, record_fields)
+        get_key = key_tuple_getter(key_fields)
+        get_value = key_tuple_getter(record_fields) if record_fields else None
+        # same record kept as create_multi_key_lookup
+        first_wins = len(key_fields) == 1
+        lookup = self.lookup
+        stats = self.stats
+        for rec in build_data:
+            stats['build_records'] += 1
+            if copy_fields and not any_field_is_populated(rec, copy_fields):
+                continue
+            try:
+                key = get_key(rec)
+            except KeyError:
+                stats['build_missing_key'] += 1
+                continue
+            if key in lookup:
+                stats['build_duplicates'] += 1
+                if first_wins:
+                    continue
+            lookup[key] = get_value(rec) if get_value else rec
+        stats['build_keys'] = len(lookup)
+
+    def _probe(self, probe_data, probe_keys):
+        '''
+        generator of (probe record, build value or None) - counts the matches
+        '''
+        get_key = key_tuple_getter(probe_keys or self.lookup.key_fields)
+        lookup_get = self.lookup.get
+        stats = self.stats
+        for rec in probe_data:
+            stats['probe_records'] += 1
+            try:
+                value = lookup_get(get_key(rec))
+            except KeyError:
+                stats['probe_missing_key'] += 1
+                value = None
+            if value is None:
+                stats['unmatched'] += 1
+            else:
+                stats['matched'] += 1
+            yield rec, value
+
+    def inner(self, probe_data, probe_keys=None):
+        '''
+        probe_keys - key fields in the probe records (default: the build key_fields) - matched by position
+        '''
+        for rec, value in self._probe(probe_data, probe_keys):
+            if value is not None:
+                yield rec, value
+
+    def anti(self, probe_data, probe_keys=None):
+        for rec, value in self._probe(probe_data, probe_keys):
+            if value is None:
+                yield rec
+
+    def update(self, probe_data, copy_fields, probe_keys=None):
+        refs = self.lookup.field_refs(copy_fields)
+        for rec, value in self._probe(probe_data, probe_keys):
+            if value is not None:
+                for cfld, ref in refs:
+                    rec[cfld] = value[ref]
+            yield rec
+
+
+# join probe_data to build_data - returns (generator of the joined records, stats dictionary)
+def hash_join(probe_data, build_data, key_fields, how='inner', copy_fields=None, probe_keys=None, record_fields=None):
+    '''
+    how - inner - (probe record, build value) for the matches
+          anti - probe records with no match in build_data
+          update - every probe record with copy_fields copied from the match
+
+    the stats are complete once the generator is exhausted - see HashJoin
+    '''
+    if how not in ('inner', 'anti', 'update'):
+        logger.error('Unknown join type:%s', how)
+        raise Exception(u'Unknown join type:{} - valid values:inner,anti,update'.format(how))
+    if how == 'update':
+        if not copy_fields:
+            raise Exception(u'update join requires copy_fields')
+        # only the fields copied are kept from the build side
+        join = HashJoin(build_data, key_fields, record_fields=record_fields or copy_fields)
+        return join.update(probe_data, copy_fields, probe_keys), join.stats
+    join = HashJoin(build_data, key_fields, record_fields=record_fields)
+    if how == 'anti':
+        return join.anti(probe_data, probe_keys), join.stats
+    return join.inner(probe_data, probe_keys), join.stats
+
+
 def copy_matched_data(dst_data, src_lookup, key_fields, copy_fields):
     '''
     copy into dst_data from src_lookup, copy_fields when there is a match
     on key_fields
+
+    src_lookup - nested lookup (create_multi_key_lookup) or FlatKeyLookup (create_flat_key_lookup)
     '''
     # make sure we passed in a list
     if type(key_fields) is not list:
@@ -1327,7 +1903,7 @@ def copy_matched_data(dst_data, src_lookup, key_fields, copy_fields):
         if fld not in dst_data[0]:
             print('ERROR:  Unable to find key_field field: ', fld)
             print('in first record:')
-            pprint.pprint(dst_data[0])
+            _pprint(dst_data[0])
             print('This routine will fail')
     # make sure we passed in a list
     if type(copy_fields) is not list:
@@ -1338,9 +1914,24 @@ def copy_matched_data(dst_data, src_lookup, key_fields, copy_fields):
         if fld not in dst_data[0]:
             print('ERROR:  Unable to find copy_field field: ', fld)
             print('in first record:')
-            pprint.pprint(dst_data[0])
+            _pprint(dst_data[0])
             print('This routine will fail')
     #
+    # tuple keyed lookup - one dictionary probe per record
+    if isinstance(src_lookup, FlatKeyLookup):
+        get_key = key_tuple_getter(key_fields)
+        refs = src_lookup.field_refs(copy_fields)
+        lookup_get = src_lookup.get
+        matched_recs = 0
+        for rec in dst_data:
+            value = lookup_get(get_key(rec))
+            if value is None:
+                continue
+            matched_recs += 1
+            for cfld, ref in refs:
+                rec[cfld] = value[ref]
+        return matched_recs
+    #
     # capture the count of matched records
     matched_recs = 0
     # step through the dst_data
@@ -1374,6 +1965,8 @@ def copy_matched_data(dst_data, src_lookup, key_fields, copy_fields):
 def extract_unmatched_data(src_data, dst_lookup, key_fields):
     '''
     return the list of records in src_data that are no longer in dst_lookup
+
+    dst_lookup - nested lookup (create_multi_key_lookup) or FlatKeyLookup (create_flat_key_lookup)
     '''
     # make sure we passed in a list
     if type(key_fields) is not list:
@@ -1384,9 +1977,14 @@ def extract_unmatched_data(src_data, dst_lookup, key_fields):
         if fld not in src_data[0]:
             print('ERROR:  Unable to find key_field field: ', fld)
             print('in first record:')
-            pprint.pprint(src_data[0])
+            _pprint(src_data[0])
             print('This routine will fail')
     #
+    # tuple keyed lookup - one dictionary probe per record
+    if isinstance(dst_lookup, FlatKeyLookup):
+        get_key = key_tuple_getter(key_fields)
+        return [rec for rec in src_data if get_key(rec) not in dst_lookup]
+    #
     # capture the count of matched records
     unmatched_recs = []
     # step through the src_data
@@ -0,0 +1,255 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.01
+
+Tools to react to file changes instead of polling them
+
+DirectoryWatcher - report (directory, name) for files written in a set of directories
+    uses linux inotify (through ctypes - no extra package) when available
+    and falls back to one scandir per directory every poll_seconds elsewhere
+    (eg. windows synced drives)
+
+TimerWheel - hashed timer wheel - schedule a key to expire at a time,
+    reschedule/cancel in O(1) and collect the expired keys as time advances
+
+'''
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+
+# setup the logger
+import logging
+
+logger = logging.getLogger(__name__)
+
+# set the module version number
+AppVersion = '1.01'
+__version__ = '1.01'
+
+# inotify event masks (see inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def _load_inotify():
+    '''
+    return the libc handle if this platform supports inotify - otherwise None
+    '''
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1') or not hasattr(libc, 'inotify_add_watch'):
+            logger.info('inotify not in libc - falling back to polling')
+            return None
+        return libc
+    except OSError as e:
+        logger.info('inotify not available - falling back to polling:%s', e)
+        return None
+
+
+class DirectoryWatcher:
+    '''
+    watch a set of directories for files being written, created, moved or removed
+
+    dirs - list of directories to watch
+    poll_seconds - scan interval used when inotify is not available
+    use_inotify - set to False to force the polling implementation
+
+    add_dir(d) - watch one more directory - False (and not watched) when inotify could not watch it
+    read_events(timeout) - wait up to timeout seconds and return a set of (directory, name)
+
+    dirs - the directories being watched (a directory add_dir could not watch is left out so it can be tried again)
+    '''
+
+    def __init__(self, dirs, poll_seconds=60, use_inotify=True):
+        self.dirs = []
+        self.poll_seconds = poll_seconds
+        self._libc = _load_inotify() if use_inotify else None
+        self._fd = None
+        self._wd2dir = {}
+        # polling state - directory -> {name: (mtime_ns, size)}
+        self._snapshot = {}
+        self._next_poll = 0.0
+
+        if self._libc:
+            self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+            if self._fd < 0:
+                logger.info('inotify_init1 failed errno %s - falling back to polling', self._errno())
+                self._libc = None
+                self._fd = None
+
+        for d in sorted(set(os.path.abspath(d) for d in dirs)):
+            self.add_dir(d)
+
+        self.mode = 'inotify' if self._libc else 'poll'
+        logger.info('Watching %d directories using %s', len(self.dirs), self.mode)
+
+    def _errno(self):
+        import ctypes
+        return ctypes.get_errno()
+
+    def add_dir(self, d):
+        d = os.path.abspath(d)
+        if self._libc:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(d), IN_WATCH_MASK)
+            if wd < 0:
+                logger.warning('Unable to watch directory %s errno:%s', d, self._errno())
+                return False
+            self._wd2dir[wd] = d
+        else:
+            # a missing directory scans empty - it is picked up once it exists
+            self._snapshot[d] = self._scan(d)
+        if d not in self.dirs:
+            self.dirs.append(d)
+        return True
+
+    def _scan(self, d):
+        snapshot = {}
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    snapshot[entry.name] = (st.st_mtime_ns, st.st_size)
+        except OSError as e:
+            logger.debug('Unable to scan %s:%s', d, e)
+        return snapshot
+
+    def fileno(self):
+        return self._fd
+
+    def read_events(self, timeout=None):
+        if self._libc:
+            return self._read_inotify(timeout)
+        return self._read_poll(timeout)
+
+    def _read_inotify(self, timeout):
+        events = set()
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return events
+        try:
+            buf = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return events
+            raise
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(buf):
+            wd, mask, _cookie, namelen = _INOTIFY_EVENT.unpack_from(buf, offset)
+            offset += _INOTIFY_EVENT.size
+            name = buf[offset:offset + namelen].rstrip(b'\0')
+            offset += namelen
+            if mask & IN_Q_OVERFLOW:
+                # we lost events - report every directory as changed
+                events.update((d, None) for d in self.dirs)
+                continue
+            if wd in self._wd2dir and name:
+                events.add((self._wd2dir[wd], os.fsdecode(name)))
+        return events
+
+    def _read_poll(self, timeout):
+        events = set()
+        now = time.monotonic()
+        if now < self._next_poll:
+            wait = self._next_poll - now
+            if timeout is not None:
+                wait = min(wait, timeout)
+            time.sleep(max(0.0, wait))
+            if time.monotonic() < self._next_poll:
+                return events
+        self._next_poll = time.monotonic() + self.poll_seconds
+        for d in self.dirs:
+            snapshot = self._scan(d)
+            previous = self._snapshot.get(d, {})
+            for name in set(snapshot) | set(previous):
+                if snapshot.get(name) != previous.get(name):
+                    events.add((d, name))
+            self._snapshot[d] = snapshot
+        return events
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class TimerWheel:
+    '''
+    hashed timer wheel
+
+    tick_seconds - resolution of the wheel
+    slots - number of slots (timers further out than slots*tick_seconds wait extra rotations)
+
+    schedule(key, when) - (re)schedule key to expire at time when (seconds)
+    cancel(key) - remove the timer for key
+    advance(now) - return the list of keys that expired up to now
+    '''
+
+    def __init__(self, tick_seconds=1.0, slots=512, now=None):
+        self.tick_seconds = float(tick_seconds)
+        self.slots = [dict() for _ in range(slots)]
+        self._key2slot = {}
+        self._current_tick = self._tick(time.time() if now is None else now)
+
+    def _tick(self, when):
+        return int(when // self.tick_seconds)
+
+    def __len__(self):
+        return len(self._key2slot)
+
+    def __contains__(self, key):
+        return key in self._key2slot
+
+    def schedule(self, key, when):
+        self.cancel(key)
+        # never schedule in the past - it fires on the next advance
+        tick = max(self._tick(when), self._current_tick)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = when
+        self._key2slot[key] = slot
+
+    def cancel(self, key):
+        slot = self._key2slot.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def deadline(self, key):
+        slot = self._key2slot.get(key)
+        return None if slot is None else self.slots[slot][key]
+
+    def advance(self, now):
+        expired = []
+        target_tick = self._tick(now)
+        # never walk more than one full rotation - every slot gets visited once
+        first_tick = max(self._current_tick, target_tick - len(self.slots) + 1)
+        for tick in range(first_tick, target_tick + 1):
+            slot = self.slots[tick % len(self.slots)]
+            for key, when in list(slot.items()):
+                if when <= now:
+                    del slot[key]
+                    del self._key2slot[key]
+                    expired.append((when, key))
+        self._current_tick = target_tick
+        return [key for _, key in sorted(expired, key=lambda x: x[0])]
+
+# eof
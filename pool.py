@@ -1,7 +1,7 @@
 '''
 @author:   Ken Venner
 @contact:  ken@venerllc.com
-@version:  1.12
+@version:  1.16
 
 Take the output from "screenlogic > output.txt" 
 and parse that data and create append the output
@@ -12,9 +12,12 @@ import os.path
 import os
 import logging
 import re
+import bisect
 import datetime
+import functools
 import kvutil
-import kvgmailsendsimple
+import kvnotifier
+import kvmetrics
 import kvdate
 
 # CONSTANTS
@@ -51,7 +54,7 @@ logger = logging.getLogger(__name__)
 # application variables
 optiondictconfig = {
     'AppVersion' : {
-        'value': '1.12',
+        'value': '1.16',
         'description' : 'defines the version number for the app',
     },
     'debug' : {
@@ -91,7 +94,27 @@ optiondictconfig = {
     },
     'pool_heater_allowed_filename' : {
         'value' : 'pool_heater_allowed.txt',
-        'description' : 'defines the name of the file that hold the list of dates we enable the pool heater to work',
+        'description' : 'defines the name of the file that hold the dates we enable the pool heater to work - one per line:'
+                        ' a date, a range (2024-07-01..2024-07-15) or a recurring rule (weekends, weekdays, fri,sat, holidays)'
+                        ' optionally limited to a range (weekends 2024-06-01..2024-09-01)',
+    },
+    'pool_heater_allowed_cache_filename' : {
+        'value' : 'pool_heater_allowed_cache.json',
+        'description' : 'defines the file the compiled pool_heater_allowed rules are saved in - reused until the allowed file changes (not set - no cache)',
+    },
+    'heat_mode_state_filename' : {
+        'value' : 'pool_heat_mode.json',
+        'description' : 'defines the name of the file that holds the recent heat mode readings used to debounce changes (not set - no debounce)',
+    },
+    'heat_mode_debounce_readings' : {
+        'value' : 2,
+        'type'  : 'int',
+        'description' : 'defines the number of consecutive readings required before we accept a heat mode change',
+    },
+    'heat_mode_debounce_seconds' : {
+        'value' : 0,
+        'type'  : 'int',
+        'description' : 'defines the seconds a new heat mode must hold before we accept it even with fewer readings (0 - not used)',
     },
     'pool_email_from' : {
         'value' : '210608thSt@gmail.com',
@@ -155,6 +178,56 @@ optiondictconfig = {
         'value' : None,
         'description' : 'defines the gmail filename of the json file that contains the account credentials ',
     },
+    'notify_backend' : {
+        'value' : 'gmail',
+        'type'  : 'inlist',
+        'valid' : ['gmail', 'smtp', 'file'],
+        'description' : 'defines how messages are delivered - see kvnotifier.py',
+    },
+    'smtp_host' : {
+        'value' : 'localhost',
+        'description' : 'defines the smtp server used when notify_backend is smtp',
+    },
+    'smtp_port' : {
+        'value' : 25,
+        'type'  : 'int',
+        'description' : 'defines the smtp server port used when notify_backend is smtp',
+    },
+    'smtp_user' : {
+        'value' : None,
+        'description' : 'defines the smtp login user (not set - no login)',
+    },
+    'smtp_password' : {
+        'value' : None,
+        'description' : 'defines the smtp login password',
+    },
+    'smtp_starttls' : {
+        'value' : False,
+        'type'  : 'bool',
+        'description' : 'defines if we issue starttls on the smtp connection',
+    },
+    'notify_filename' : {
+        'value' : 'pool_messages.txt',
+        'description' : 'defines the file messages are appended to when notify_backend is file',
+    },
+    'notify_rate_filename' : {
+        'value' : 'pool_ratelimit.json',
+        'description' : 'defines the file holding the per recipient list rate limit state (not set - no rate limit)',
+    },
+    'notify_rate_capacity' : {
+        'value' : 5,
+        'type'  : 'int',
+        'description' : 'defines the number of messages a recipient list can receive in a burst',
+    },
+    'notify_rate_refill_seconds' : {
+        'value' : 900,
+        'type'  : 'int',
+        'description' : 'defines the seconds it takes to earn back one message for a recipient list',
+    },
+    'metrics_filename' : {
+        'value' : 'pool.prom',
+        'description' : 'defines the prometheus textfile the run metrics are written to (not set - no metrics)',
+    },
 }
 
 ### GLOBAL VARIABLES AND CONVERSIONS ###
@@ -184,29 +257,211 @@ def check_file_writable(fnm):
     return os.access(pdir, os.W_OK)
 
 
-def read_pool_heater_allowable_file(input_file):
+def send_message(optiondict, email_from, email_to, email_subject, email_body, control_action=False):
     '''
-    if file exists, read in the file and convert each line to a date and build a list of dates
-    that we will not flag the pool is enabled and attempt to turn it off
+    send a message through the notifier backend defined in optiondict (notify_backend)
+    control_action - the message reports an action we are taking (heater being turned off) - never rate limited
+    returns the dict with the 'id' of the message sent - None when it could not be sent
     '''
-    pool_heater_allowed = []
-    pool_heater_invalid_dates = []
+    notifier = kvnotifier.notifier_from_optiondict(optiondict)
+    if control_action and isinstance(notifier, kvnotifier.RateLimitedNotifier):
+        return notifier.send_now(email_from, email_to, email_subject, email_body)
+    return notifier.send(email_from, email_to, email_subject, email_body)
+
+
+# day names used in recurring rules - monday is 0 (date.weekday())
+WEEKDAY_NAMES = {
+    'mon': 0, 'monday': 0, 'tue': 1, 'tuesday': 1, 'wed': 2, 'wednesday': 2,
+    'thu': 3, 'thursday': 3, 'fri': 4, 'friday': 4, 'sat': 5, 'saturday': 5, 'sun': 6, 'sunday': 6,
+    'weekdays': (0, 1, 2, 3, 4), 'weekends': (5, 6), 'weekend': (5, 6),
+}
 
+
+def nth_weekday(year, month, weekday, nth):
+    '''
+    date of the nth (1..5 or -1 for the last) weekday (monday is 0) of the month
+    '''
+    if nth > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (nth - 1))
+    last = datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+@functools.lru_cache(maxsize=None)
+def us_holidays(year):
+    '''
+    set of the US federal holidays (the day itself - not the observed day) for a year
+    '''
+    return frozenset([
+        datetime.date(year, 1, 1),          # new years day
+        nth_weekday(year, 1, 0, 3),         # martin luther king jr day
+        nth_weekday(year, 2, 0, 3),         # presidents day
+        nth_weekday(year, 5, 0, -1),        # memorial day
+        datetime.date(year, 6, 19),         # juneteenth
+        datetime.date(year, 7, 4),          # independence day
+        nth_weekday(year, 9, 0, 1),         # labor day
+        nth_weekday(year, 10, 0, 2),        # columbus day
+        datetime.date(year, 11, 11),        # veterans day
+        nth_weekday(year, 11, 3, 4),        # thanksgiving
+        datetime.date(year, 12, 25),        # christmas
+    ])
+
+
+class AllowedDates:
+    '''
+    compiled pool_heater_allowed rules - "date in allowed" is a set lookup,
+    a binary search of the merged ranges and a check of the recurring rules
+
+    dates - set of date ordinals
+    ranges - sorted, non overlapping list of [start ordinal, end ordinal] (inclusive)
+    recurring - list of [kind (weekday or holidays), weekdays, start ordinal or None, end ordinal or None]
+    '''
+
+    def __init__(self, dates=(), ranges=(), recurring=()):
+        self.dates = set(dates)
+        self.ranges = self.merge_ranges(ranges)
+        self._starts = [x[0] for x in self.ranges]
+        self.recurring = [list(x) for x in recurring]
+
+    @staticmethod
+    def merge_ranges(ranges):
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def __contains__(self, value):
+        if isinstance(value, datetime.datetime):
+            value = value.date()
+        ordinal = value.toordinal()
+        if ordinal in self.dates:
+            return True
+        idx = bisect.bisect_right(self._starts, ordinal) - 1
+        if idx >= 0 and ordinal <= self.ranges[idx][1]:
+            return True
+        for kind, weekdays, start, end in self.recurring:
+            if (start is not None and ordinal < start) or (end is not None and ordinal > end):
+                continue
+            if kind == 'weekday' and value.weekday() in weekdays:
+                return True
+            if kind == 'holidays' and value in us_holidays(value.year):
+                return True
+        return False
+
+    def __len__(self):
+        return len(self.dates) + len(self.ranges) + len(self.recurring)
+
+    def __str__(self):
+        return '{} dates, {} ranges, {} recurring rules'.format(len(self.dates), len(self.ranges), len(self.recurring))
+
+    def to_dict(self):
+        return {'dates': sorted(self.dates), 'ranges': self.ranges, 'recurring': self.recurring}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['dates'], data['ranges'], data['recurring'])
+
+
+def parse_allowed_range(text):
+    '''
+    convert "start..end" to [start ordinal, end ordinal]
+    '''
+    start, end = [kvdate.datetime_from_str(x.strip()).date().toordinal() for x in text.split('..', 1)]
+    if end < start:
+        raise Exception(u'Range end before start:{}'.format(text))
+    return [start, end]
+
+
+def parse_allowed_line(line, dates, ranges, recurring):
+    '''
+    add the rule on one line of the pool_heater_allowed file to dates/ranges/recurring
+    raises an exception if the line can not be understood
+    '''
+    words = line.split(None, 1)
+    rule = words[0].lower()
+    names = [x for x in rule.split(',') if x]
+    if rule == 'holidays' or (names and all(x in WEEKDAY_NAMES for x in names)):
+        # recurring rule - optionally limited to a range
+        start = end = None
+        if len(words) > 1:
+            start, end = parse_allowed_range(words[1])
+        if rule == 'holidays':
+            recurring.append(['holidays', [], start, end])
+        else:
+            weekdays = set()
+            for name in names:
+                day = WEEKDAY_NAMES[name]
+                weekdays.update(day if isinstance(day, tuple) else (day,))
+            recurring.append(['weekday', sorted(weekdays), start, end])
+    elif '..' in line:
+        ranges.append(parse_allowed_range(line))
+    else:
+        dates.add(kvdate.datetime_from_str(line).date().toordinal())
+
+
+def read_pool_heater_allowable_file(input_file, cache_file=None):
+    '''
+    if file exists, read in the file and compile the dates/ranges/recurring rules
+    that we will not flag the pool is enabled and attempt to turn it off
+
+    blank lines and lines starting with # are skipped
+
+    cache_file - when set the compiled rules are saved here keyed by the
+                 input file modified time and size - and reused while they match
+
+    returns (AllowedDates, list of invalid line strings)
+    '''
     # no file - so no inputs
     if not os.path.exists(input_file):
         logger.info(input_file + ' not found')
-        return pool_heater_allowed, pool_heater_invalid_dates
+        return AllowedDates(), []
+
+    st = os.stat(input_file)
+    cache_key = [st.st_mtime_ns, st.st_size]
+
+    # reuse the compiled rules if the file has not changed
+    if cache_file and os.path.exists(cache_file):
+        try:
+            cache = kvutil.load_json_file_to_dict(cache_file)
+            if cache.get('key') == cache_key and cache.get('filename') == input_file:
+                pool_heater_allowed = AllowedDates.from_dict(cache['allowed'])
+                logger.info('%s allowed for pool enabled (cached)', pool_heater_allowed)
+                return pool_heater_allowed, cache['invalid']
+        except Exception as e:
+            logger.warning('Unable to read cache %s - rebuilding:%s', cache_file, e)
+
+    dates = set()
+    ranges = []
+    recurring = []
+    pool_heater_invalid_dates = []
 
     # get the file read in the lines and convert the string to date
     with open(input_file, 'r') as file:
         # Read each line in the file
         for idx, line in enumerate(file):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
             try:
-                pool_heater_allowed.append(kvdate.datetime_from_str(line.strip()).date())
+                parse_allowed_line(line, dates, ranges, recurring)
             except Exception as e:
-                pool_heater_invalid_dates.append(f'{idx+1}|{line.strip()}|{e}')
+                pool_heater_invalid_dates.append(f'{idx+1}|{line}|{e}')
+
+    pool_heater_allowed = AllowedDates(dates, ranges, recurring)
 
-    logger.info(str(len(pool_heater_allowed)) + ' dates allowed to have pool enabled')
+    if cache_file:
+        kvutil.dump_dict_to_json_file(cache_file, {
+            'filename': input_file,
+            'key': cache_key,
+            'allowed': pool_heater_allowed.to_dict(),
+            'invalid': pool_heater_invalid_dates,
+        }, compact=True)
+
+    logger.info('%s allowed for pool enabled', pool_heater_allowed)
     return pool_heater_allowed, pool_heater_invalid_dates
 
 def read_parse_output_pool(input_file, output_file):
@@ -346,6 +601,150 @@ def read_parse_output_pool(input_file, output_file):
     }
 
 
+def add_pool_metrics(metrics, pool_settings):
+    '''
+    add the readings from this run to the metrics registry
+    pool_settings - the dict from read_parse_output_pool (None if the read failed)
+    '''
+    metrics.gauge('reading_ok', bool(pool_settings), help='1 if the screenlogic output was read this run')
+    if not pool_settings:
+        return
+
+    for body in ('pool', 'spa'):
+        labels = {'body': body}
+        metrics.gauge('temperature_fahrenheit', kvmetrics.to_number(pool_settings.get(body + '_temp_last')), labels,
+                      'last temperature reading')
+        metrics.gauge('setpoint_fahrenheit', kvmetrics.to_number(pool_settings.get(body + '_temp_set')), labels,
+                      'heat set point')
+        # modes are text - one sample per body carrying the mode as a label
+        metrics.gauge('heat_mode', 1, dict(labels, mode=pool_settings.get(body + '_heat_mode')),
+                      'heat mode (value is always 1 - the mode is the label)')
+        metrics.gauge('heat_state', 1, dict(labels, state=pool_settings.get(body + '_heat_set')),
+                      'heater state (value is always 1 - the state is the label)')
+
+
+def add_lock_metrics(metrics, optiondict, now_ts=None):
+    '''
+    add the age of the pool/spa lock files (heater on, missing, heater off) to the metrics registry
+    a lock file name that is not set is left out - a lock file that does not exist is NaN
+    '''
+    if now_ts is None:
+        now_ts = datetime.datetime.now().timestamp()
+    for body in ('pool', 'spa'):
+        for lock, fname_key in (('heater_on', '_heater_filename'), ('missing', '_missing_filename'), ('heater_off', '_heater_off_filename')):
+            fname = optiondict.get(body + fname_key)
+            if not fname:
+                continue
+            try:
+                age = now_ts - os.stat(fname).st_mtime
+            except OSError:
+                age = None
+            metrics.gauge('lock_age_seconds', age, {'body': body, 'lock': lock, 'lock_fname': fname},
+                          'seconds since the lock file was created (NaN - no lock file)')
+
+
+def debounce_heat_mode(body_state, reading, now_ts, readings_needed, dwell_seconds=0):
+    '''
+    decide the heat mode we act on for one body (pool or spa)
+
+    body_state - dict for this body that is updated in place:
+        stable - the heat mode we are acting on
+        since - timestamp the latest run of identical readings started
+        ring - the last readings_needed readings as [timestamp, mode]
+    reading - the heat mode just read from the gateway
+    now_ts - timestamp of this reading (seconds)
+    readings_needed - consecutive readings of a new mode required to change the stable mode
+    dwell_seconds - if set, a new mode that has held this long is accepted with fewer readings
+
+    returns (stable mode, flag that body_state was changed and must be saved)
+    '''
+    # first reading we have ever seen - accept it
+    if 'stable' not in body_state:
+        body_state.update({'stable': reading, 'since': now_ts, 'ring': [[now_ts, reading]]})
+        return reading, True
+
+    ring = body_state['ring']
+
+    # steady state - same reading as everything we hold - nothing to update
+    if reading == body_state['stable'] and all(mode == reading for _, mode in ring):
+        return reading, False
+
+    # start of a new run of readings
+    if not ring or ring[-1][1] != reading:
+        body_state['since'] = now_ts
+
+    # add this reading to the ring and keep only the last readings_needed
+    ring.append([now_ts, reading])
+    del ring[:-max(readings_needed, 1)]
+
+    # count the consecutive readings at the end of the ring that match this reading
+    run = 0
+    for _, mode in reversed(ring):
+        if mode != reading:
+            break
+        run += 1
+
+    # accept the change
+    if reading != body_state['stable']:
+        if run >= readings_needed or (dwell_seconds and now_ts - body_state['since'] >= dwell_seconds):
+            logger.info('Heat mode changed from [%s] to [%s] after %d readings', body_state['stable'], reading, run)
+            body_state['stable'] = reading
+        else:
+            logger.info('Heat mode reading [%s] not yet accepted - staying [%s] (%d of %d readings)',
+                        reading, body_state['stable'], run, readings_needed)
+
+    return body_state['stable'], True
+
+
+# debounce state by heat_mode_state_filename - read from the file on the first cycle of the
+# process only (pool_scheduler runs every cycle in one process)
+_heat_mode_state = {}
+
+
+def debounce_pool_settings(pool_settings, optiondict, now_ts=None):
+    '''
+    replace the pool_heat_mode and spa_heat_mode read in with the debounced values
+
+    the recent readings are kept in memory and saved in optiondict['heat_mode_state_filename']
+    which is read on the first cycle and only rewritten when a reading differs from the stable state
+
+    returns a copy of pool_settings with the debounced heat modes
+    '''
+    # nothing read or debounce not enabled
+    if not pool_settings or not optiondict['heat_mode_state_filename']:
+        return pool_settings
+
+    if now_ts is None:
+        now_ts = datetime.datetime.now().timestamp()
+
+    # read in the state we saved on the last run - first cycle of this process only
+    state = _heat_mode_state.get(optiondict['heat_mode_state_filename'])
+    if state is None:
+        state = {}
+        if os.path.exists(optiondict['heat_mode_state_filename']):
+            try:
+                state = kvutil.load_json_file_to_dict(optiondict['heat_mode_state_filename'])
+            except Exception as e:
+                logger.warning('Unable to read heat mode state %s - starting over:%s', optiondict['heat_mode_state_filename'], e)
+        _heat_mode_state[optiondict['heat_mode_state_filename']] = state
+
+    debounced = dict(pool_settings)
+    state_changed = False
+    for key in ('pool_heat_mode', 'spa_heat_mode'):
+        debounced[key], changed = debounce_heat_mode(state.setdefault(key, {}),
+                                                     pool_settings[key],
+                                                     now_ts,
+                                                     optiondict['heat_mode_debounce_readings'],
+                                                     optiondict['heat_mode_debounce_seconds'])
+        state_changed = state_changed or changed
+
+    # only write when something changed
+    if state_changed:
+        kvutil.dump_dict_to_json_file(optiondict['heat_mode_state_filename'], state)
+
+    return debounced
+
+
 def message_on_pool_state_change(pool_settings, optiondict):
     ''' create an email when the state changes on pool heater
     using a lock file to capture what the state currently is
@@ -380,14 +779,12 @@ def message_on_pool_state_change(pool_settings, optiondict):
             
         # create message that we are not currently reading pool settings
         # send message that heater is ON
-        msgid = kvgmailsendsimple.gmail_send_simple_message(
+        msgid = send_message(
+            optiondict,
             optiondict['pool_email_from'],
             optiondict['pool_email_to'],
             optiondict['pool_email_subject']+'Not Reading Pool Settings',
-            optiondict['pool_email_body']+'Not Reading Pool Settings',
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
+            optiondict['pool_email_body']+'Not Reading Pool Settings'
         )
 
         # create the lock file
@@ -395,7 +792,7 @@ def message_on_pool_state_change(pool_settings, optiondict):
             lock_file.write('Not Reading Pool Settings')
 
         # log message
-        logger.info('Not reading pool settings - sent message: %s and created file: %s', msgid['id'], optiondict['pool_missing_filename'])
+        logger.info('Not reading pool settings - sent message: %s and created file: %s', kvnotifier.message_id(msgid), optiondict['pool_missing_filename'])
 
         # return - we have nothing to process
         return
@@ -403,21 +800,19 @@ def message_on_pool_state_change(pool_settings, optiondict):
         # we are getting data and we have a lock file that must now be removed
 
         # send message that heater is off
-        msgid = kvgmailsendsimple.gmail_send_simple_message(
+        msgid = send_message(
+            optiondict,
             optiondict['pool_email_from'],
             optiondict['pool_email_to'],
             optiondict['pool_email_subject']+'NOW Reading Pool Settings',
-            optiondict['pool_email_body']+'NOW Reading Pool Settings',
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
+            optiondict['pool_email_body']+'NOW Reading Pool Settings'
         )
 
         # remove the lock file
         os.remove(optiondict['pool_missing_filename'])
         
         # log message
-        logger.info('NOW reading pool settings - sent message: %s and removed file: %s', msgid['id'], optiondict['pool_missing_filename'])
+        logger.info('NOW reading pool settings - sent message: %s and removed file: %s', kvnotifier.message_id(msgid), optiondict['pool_missing_filename'])
         
     
     # POOL
@@ -429,56 +824,50 @@ def message_on_pool_state_change(pool_settings, optiondict):
         # that the pool heater turned off and remove the lock file
         if pool_settings['pool_heat_mode'] == 'Off':
             # send message that heater is off
-            msgid = kvgmailsendsimple.gmail_send_simple_message(
+            msgid = send_message(
+                optiondict,
                 optiondict['pool_email_from'],
                 optiondict['pool_email_to'],
                 optiondict['pool_email_subject']+'OFF',
-                optiondict['pool_email_body']+'OFF',
-                optiondict['scopes'],
-                optiondict['file_token_json'],
-                optiondict['file_credentials_json']
+                optiondict['pool_email_body']+'OFF'
             )
 
             # remove the lock file
             os.remove(optiondict['pool_heater_filename'])
 
             # log message
-            logger.info('Pool heater off - sent message: %s and removed file: %s', msgid['id'], optiondict['pool_heater_filename'])
+            logger.info('Pool heater off - sent message: %s and removed file: %s', kvnotifier.message_id(msgid), optiondict['pool_heater_filename'])
 
         elif pool_days and pool_seconds < FIFTEEN_MIN_SECONDS:
             # we have a lock file and we have had this lock file exist for more than a day
             # we are greater than a day and less then the first 15 minutes of that next day
             # we should send another message about the duratoin of this being on
             # send message that heater is off
-            msgid = kvgmailsendsimple.gmail_send_simple_message(
+            msgid = send_message(
+                optiondict,
                 optiondict['pool_email_from'],
                 optiondict['pool_email_to'],
                 optiondict['pool_email_subject']+'STILL ON - DAY ' + str(pool_days),
-                'Pool Heater continues to be on',
-                optiondict['scopes'],
-                optiondict['file_token_json'],
-                optiondict['file_credentials_json']
+                'Pool Heater continues to be on'
             )
 
             # log message
             logger.info('Pool heater still ON [%s] days - sent message: %s and removed file: %s',
-                        pool_days, msgid['id'], optiondict['pool_heater_filename'])
+                        pool_days, kvnotifier.message_id(msgid), optiondict['pool_heater_filename'])
         elif pool_settings['pool_temp_set'] and float(pool_settings['pool_temp_set']) > MAX_POOL_TEMP:
             # SETTING GREATER THAN MAX
             # check to see if the pool setting exceeds our max
-            msgid = kvgmailsendsimple.gmail_send_simple_message(
+            msgid = send_message(
+                optiondict,
                 optiondict['pool_email_from'],
                 optiondict['pool_email_to'],
                 optiondict['pool_email_subject']+'SET OVER THE MAX SETTING:  ' + str(MAX_POOL_TEMP),
-                'Pool Heater set to a temp ' + pool_settings['pool_temp_set'] + ' that is over MAX SETTING:  ' + str(MAX_POOL_TEMP),
-                optiondict['scopes'],
-                optiondict['file_token_json'],
-                optiondict['file_credentials_json']
+                'Pool Heater set to a temp ' + pool_settings['pool_temp_set'] + ' that is over MAX SETTING:  ' + str(MAX_POOL_TEMP)
             )
 
             # log message
             logger.info('Pool heater set over max [%s/%s] days - sent message: %s and removed file: %s',
-                        pool_settings['pool_temp_set'], str(MAX_POOL_TEMP), msgid['id'], optiondict['pool_heater_filename'])
+                        pool_settings['pool_temp_set'], str(MAX_POOL_TEMP), kvnotifier.message_id(msgid), optiondict['pool_heater_filename'])
             
     else:
 
@@ -488,14 +877,12 @@ def message_on_pool_state_change(pool_settings, optiondict):
         # that the pool heater is now ON and create a lock file.
         if pool_settings['pool_heat_mode'] != 'Off':
             # send message that heater is ON
-            msgid = kvgmailsendsimple.gmail_send_simple_message(
+            msgid = send_message(
+                optiondict,
                 optiondict['pool_email_from'],
                 optiondict['pool_email_to'],
                 optiondict['pool_email_subject']+'ON',
-                optiondict['pool_email_body']+'ON',
-                optiondict['scopes'],
-                optiondict['file_token_json'],
-                optiondict['file_credentials_json']
+                optiondict['pool_email_body']+'ON'
             )
 
             # create the lock file
@@ -503,24 +890,22 @@ def message_on_pool_state_change(pool_settings, optiondict):
                 lock_file.write('Pool ON')
 
             # log message
-            logger.info('Pool heater ON - sent message: %s and created file: %s', msgid['id'], optiondict['pool_heater_filename'])
+            logger.info('Pool heater ON - sent message: %s and created file: %s', kvnotifier.message_id(msgid), optiondict['pool_heater_filename'])
             
             # SETTING GREATER THAN MAX - only check when we just turned on the heat
             if pool_settings['pool_temp_set'] and float(pool_settings['pool_temp_set']) > MAX_POOL_TEMP:
                 # check to see if the pool setting exceeds our max
-                msgid = kvgmailsendsimple.gmail_send_simple_message(
+                msgid = send_message(
+                    optiondict,
                     optiondict['pool_email_from'],
                     optiondict['pool_email_to'],
                     optiondict['pool_email_subject']+'SET OVER THE MAX SETTING:  ' + str(MAX_POOL_TEMP),
-                    'Pool Heater set to a temp ' + pool_settings['pool_temp_set'] + ' that is over MAX SETTING:  ' + str(MAX_POOL_TEMP),
-                    optiondict['scopes'],
-                    optiondict['file_token_json'],
-                    optiondict['file_credentials_json']
+                    'Pool Heater set to a temp ' + pool_settings['pool_temp_set'] + ' that is over MAX SETTING:  ' + str(MAX_POOL_TEMP)
                 )
                 
                 # log message
                 logger.info('Pool heater set over max [%s/%s] days - sent message: %s and removed file: %s',
-                            pool_settings['pool_temp_set'], str(MAX_POOL_TEMP), msgid['id'], optiondict['pool_heater_filename'])
+                            pool_settings['pool_temp_set'], str(MAX_POOL_TEMP), kvnotifier.message_id(msgid), optiondict['pool_heater_filename'])
 
     # return back the message id or none
     return msgid
@@ -529,7 +914,7 @@ def message_on_pool_turn_off(pool_settings, pool_heater_allowed, pool_heater_inv
     ''' create an email when we are creating a file that will turn off the pool
 
     pool_settings - dict of values read in
-    pool_heater_allowed - list of datetime values where the pool can be on
+    pool_heater_allowed - AllowedDates (or list of dates) where the pool can be on
     pool_heater_invalid_dates - list of strings and row numbers where we could not convert the string to a date
     optiondict - the options dictionary
 
@@ -543,14 +928,12 @@ def message_on_pool_turn_off(pool_settings, pool_heater_allowed, pool_heater_inv
     ### invalid dates in read file
     if pool_heater_invalid_dates:
         # send message that heater is ON
-        msgid = kvgmailsendsimple.gmail_send_simple_message(
+        msgid = send_message(
+            optiondict,
             optiondict['pool_email_from'],
             optiondict['pool_email_to'],
             optiondict['pool_email_subject']+'Invalid date lines in file',
-            'Unable to convert following lines in file to datetime strings:\n' + '\n'.join(pool_heater_invalid_dates),
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
+            'Unable to convert following lines in file to datetime strings:\n' + '\n'.join(pool_heater_invalid_dates)
         )
        
     ### NO DATA READ - POOL
@@ -575,14 +958,13 @@ def message_on_pool_turn_off(pool_settings, pool_heater_allowed, pool_heater_inv
     # that we are turning off the pool heater
     if pool_settings['pool_heat_mode'] != 'Off':
         # send message that heater is ON
-        msgid = kvgmailsendsimple.gmail_send_simple_message(
+        msgid = send_message(
+            optiondict,
             optiondict['pool_email_from'],
             optiondict['pool_email_to'],
             optiondict['pool_email_subject']+'Being Turned OFF',
             optiondict['pool_email_body']+'Being Turned OFF',
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
+            control_action=True
         )
 
         # create the lock file
@@ -590,7 +972,7 @@ def message_on_pool_turn_off(pool_settings, pool_heater_allowed, pool_heater_inv
             lock_file.write('Pool ON being turned OFF')
 
         # log message
-        logger.info('Pool heater ON - being turned OFF sent message: %s and created file: %s', msgid['id'], optiondict['pool_heater_off_filename'])
+        logger.info('Pool heater ON - being turned OFF sent message: %s and created file: %s', kvnotifier.message_id(msgid), optiondict['pool_heater_off_filename'])
             
 
     # return back the message id or none
@@ -629,14 +1011,12 @@ def message_on_spa_state_change(pool_settings, optiondict):
 
         # create message that we are not currently reading pool settings
         # send message that heater is ON
-        msgid = kvgmailsendsimple.gmail_send_simple_message(
+        msgid = send_message(
+            optiondict,
             optiondict['spa_email_from'],
             optiondict['spa_email_to'],
             optiondict['spa_email_subject']+'Not Reading Pool Settings',
-            optiondict['spa_email_body']+'Not Reading Pool Settings',
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
+            optiondict['spa_email_body']+'Not Reading Pool Settings'
         )
         
         # create the lock file
@@ -644,7 +1024,7 @@ def message_on_spa_state_change(pool_settings, optiondict):
             lock_file.write('Not Reading Pool Settings')
             
         # log message
-        logger.info('Not reading pool settings - sent message: %s and created file: %s', msgid['id'], optiondict['spa_missing_filename'])
+        logger.info('Not reading pool settings - sent message: %s and created file: %s', kvnotifier.message_id(msgid), optiondict['spa_missing_filename'])
 
         # return - we have nothing to process
         return
@@ -652,21 +1032,19 @@ def message_on_spa_state_change(pool_settings, optiondict):
         # we are getting data and we have a lock file that must now be removed
 
         # send message that heater is off
-        msgid = kvgmailsendsimple.gmail_send_simple_message(
+        msgid = send_message(
+            optiondict,
             optiondict['spa_email_from'],
             optiondict['spa_email_to'],
             optiondict['spa_email_subject']+'NOW Reading Pool Settings',
-            optiondict['spa_email_body']+'NOW Reading Pool Settings',
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
+            optiondict['spa_email_body']+'NOW Reading Pool Settings'
         )
 
         # remove the lock file
         os.remove(optiondict['spa_missing_filename'])
 
         # log message
-        logger.info('NOW reading pool settings - sent message: %s and removed file: %s', msgid['id'], optiondict['spa_missing_filename'])
+        logger.info('NOW reading pool settings - sent message: %s and removed file: %s', kvnotifier.message_id(msgid), optiondict['spa_missing_filename'])
         
             
     # SPA
@@ -678,21 +1056,19 @@ def message_on_spa_state_change(pool_settings, optiondict):
         # that the spa heater turned off and remove the lock file
         if pool_settings['spa_heat_mode'] == 'Off':
             # send message that heater is off
-            msgid = kvgmailsendsimple.gmail_send_simple_message(
+            msgid = send_message(
+                optiondict,
                 optiondict['spa_email_from'],
                 optiondict['spa_email_to'],
                 optiondict['spa_email_subject']+'OFF',
-                optiondict['spa_email_body']+'OFF',
-                optiondict['scopes'],
-                optiondict['file_token_json'],
-                optiondict['file_credentials_json']
+                optiondict['spa_email_body']+'OFF'
             )
 
             # remove the lock file
             os.remove(optiondict['spa_heater_filename'])
 
             # log message
-            logger.info('SPA heater off - sent message: %s and removed file: %s', msgid['id'], optiondict['spa_heater_filename'])
+            logger.info('SPA heater off - sent message: %s and removed file: %s', kvnotifier.message_id(msgid), optiondict['spa_heater_filename'])
 
         elif optiondict['spa_heater_off_filename'] and optiondict['spa_heater_off_hours'] and spa_seconds > optiondict['spa_heater_off_hours'] * 60 * 60:
             # we have a desire to turn off the spa because we defined two variable - filename and hours
@@ -701,14 +1077,13 @@ def message_on_spa_state_change(pool_settings, optiondict):
             # and send message that we are going to turn off the spa
             
             # send message that heater is ON
-            msgid = kvgmailsendsimple.gmail_send_simple_message(
+            msgid = send_message(
+                optiondict,
                 optiondict['spa_email_from'],
                 optiondict['spa_email_to'],
                 optiondict['spa_email_subject']+'Being Turned OFF',
                 optiondict['spa_email_body']+'Being Turned OFF',
-                optiondict['scopes'],
-                optiondict['file_token_json'],
-                optiondict['file_credentials_json']
+                control_action=True
             )
 
             # create the lock file
@@ -716,26 +1091,24 @@ def message_on_spa_state_change(pool_settings, optiondict):
                 lock_file.write('SPA ON being turned OFF')
 
             # log message
-            logger.info('SPA heater on too long turning off SPA - sent message: %s and created file: %s', msgid['id'], optiondict['spa_heater_off_filename'])
+            logger.info('SPA heater on too long turning off SPA - sent message: %s and created file: %s', kvnotifier.message_id(msgid), optiondict['spa_heater_off_filename'])
             
         elif spa_days and spa_seconds < FIFTEEN_MIN_SECONDS:
             # we have a lock file and we have had this lock file exist for more than a day
             # we are greater than a day and less then the first 15 minutes of that next day
             # we should send another message about the duratoin of this being on
             # send message that heater is off
-            msgid = kvgmailsendsimple.gmail_send_simple_message(
+            msgid = send_message(
+                optiondict,
                 optiondict['spa_email_from'],
                 optiondict['spa_email_to'],
                 optiondict['spa_email_subject']+'STILL ON - DAY ' + str(spa_days),
-                'SPA Heater continues to be on',
-                optiondict['scopes'],
-                optiondict['file_token_json'],
-                optiondict['file_credentials_json']
+                'SPA Heater continues to be on'
             )
 
             # log message
             logger.info('SPA heater still ON [%s] days - sent message: %s and removed file: %s',
-                        spa_days, msgid['id'], optiondict['spa_heater_filename'])
+                        spa_days, kvnotifier.message_id(msgid), optiondict['spa_heater_filename'])
             
     else:
 
@@ -745,14 +1118,12 @@ def message_on_spa_state_change(pool_settings, optiondict):
         # that the spa heater is now ON and create a lock file.
         if pool_settings['spa_heat_mode'] != 'Off':
             # send message that heater is ON
-            msgid = kvgmailsendsimple.gmail_send_simple_message(
+            msgid = send_message(
+                optiondict,
                 optiondict['spa_email_from'],
                 optiondict['spa_email_to'],
                 optiondict['spa_email_subject']+'ON',
-                optiondict['spa_email_body']+'ON',
-                optiondict['scopes'],
-                optiondict['file_token_json'],
-                optiondict['file_credentials_json']
+                optiondict['spa_email_body']+'ON'
             )
 
             # create the lock file
@@ -760,49 +1131,92 @@ def message_on_spa_state_change(pool_settings, optiondict):
                 lock_file.write('SPA ON')
 
             # log message
-            logger.info('SPA heater ON - sent message: %s and created file: %s', msgid['id'], optiondict['spa_heater_filename'])
+            logger.info('SPA heater ON - sent message: %s and created file: %s', kvnotifier.message_id(msgid), optiondict['spa_heater_filename'])
 
 
     # return back the message id or none
     return msgid
     
 # ---------------------------------------------------------------------------
-if __name__ == '__main__':
+def run_pool_cycle(optiondict):
+    '''
+    one pool cycle - read the screenlogic output, message on state changes, create the
+    heater off files and write the metrics
 
-    # capture the command line
-    optiondict = kvutil.kv_parse_command_line( optiondictconfig, debug=False )
+    called once when pool.py is run and every cycle by pool_scheduler.py
 
-    # set variables based on what came form command line
-    debug = optiondict['debug']
+    returns the pool settings read
+    '''
+    global now, now_str
 
-    # print header to show what is going on (convert this to a kvutil function:  kvutil.loggingStart(logger,optiondict))
-    kvutil.loggingAppStart( logger, optiondict, kvutil.scriptinfo()['name'] )
+    # set the time for this cycle
+    now = datetime.datetime.now()
+    now_str = now.strftime('%Y-%m-%d:%H:%M:%S')
+
+    # the notify metrics are for this cycle
+    kvnotifier.reset_send_stats()
 
     # refresh the token - always do this as we don't always send an email
-    kvgmailsendsimple.gmail_refresh_token_take_no_action(
-            optiondict['pool_email_from'],
-            optiondict['scopes'],
-            optiondict['file_token_json'],
-            optiondict['file_credentials_json']
-    )
+    kvnotifier.notifier_from_optiondict(optiondict).refresh(optiondict['pool_email_from'])
     # log message
-    logger.info('Refreshed the gmail token')
+    logger.info('Refreshed the %s token', optiondict['notify_backend'])
         
+    # time each stage of the run
+    metrics = kvmetrics.MetricsRegistry('pool_')
+
     # process the pool file
     logger.info( "Call read and save pool data function" )
-    pool_settings = read_parse_output_pool(optiondict['input_filename'], optiondict['pool_filename'])
+    with metrics.stage('read_parse'):
+        pool_settings = read_parse_output_pool(optiondict['input_filename'], optiondict['pool_filename'])
+
+    # act on heat mode changes only after they hold for several readings
+    with metrics.stage('debounce'):
+        pool_settings = debounce_pool_settings(pool_settings, optiondict)
 
     # POOL - capture valid dates for pool to be enabled
-    pool_heater_allowed, pool_heater_invalid_dates = read_pool_heater_allowable_file(optiondict['pool_heater_allowed_filename'])
+    with metrics.stage('heater_allowed'):
+        pool_heater_allowed, pool_heater_invalid_dates = read_pool_heater_allowable_file(optiondict['pool_heater_allowed_filename'],
+                                                                                         optiondict['pool_heater_allowed_cache_filename'])
 
     # POOL - determine if we need to message people
-    message_on_pool_state_change(pool_settings, optiondict)
+    with metrics.stage('pool_state'):
+        message_on_pool_state_change(pool_settings, optiondict)
     
     # SPA determine if we need to message people
-    message_on_spa_state_change(pool_settings, optiondict)
+    with metrics.stage('spa_state'):
+        message_on_spa_state_change(pool_settings, optiondict)
     
     # POOL - generate file to turn off pool
-    message_on_pool_turn_off(pool_settings, pool_heater_allowed, pool_heater_invalid_dates, optiondict)
+    with metrics.stage('pool_turn_off'):
+        message_on_pool_turn_off(pool_settings, pool_heater_allowed, pool_heater_invalid_dates, optiondict)
 
-# eof
+    # release any connection held by the notifier (sends any rate limit summary)
+    with metrics.stage('notify_close'):
+        kvnotifier.close_notifiers()
 
+    # write the metrics for the node exporter
+    if optiondict['metrics_filename']:
+        add_pool_metrics(metrics, pool_settings)
+        add_lock_metrics(metrics, optiondict)
+        kvmetrics.add_notify_metrics(metrics)
+        metrics.write(optiondict['metrics_filename'])
+
+    return pool_settings
+
+# ---------------------------------------------------------------------------
+if __name__ == '__main__':
+
+    # capture the command line - reuse the options of the last run when the config is unchanged
+    optiondict = kvutil.kv_parse_command_line( optiondictconfig, debug=False,
+                                               cache_filename=os.path.splitext(kvutil.scriptinfo()['name'])[0] + '_options.cache' )
+
+    # set variables based on what came form command line
+    debug = optiondict['debug']
+
+    # print header to show what is going on (convert this to a kvutil function:  kvutil.loggingStart(logger,optiondict))
+    kvutil.loggingAppStart( logger, optiondict, kvutil.scriptinfo()['name'] )
+
+    # run the pool cycle once
+    run_pool_cycle(optiondict)
+
+# eof
@@ -0,0 +1,254 @@
+'''
+@author:   Ken Venner
+@contact:  ken@venerllc.com
+@version:  1.00
+
+Replaces the cron entry that ran run_pool.sh - one long running process
+that runs the pool cycle and the chk_log_update checks on their own cadence
+
+pool task (every pool_interval_seconds):
+    screenlogicpy -i screenlogic_host > input_filename
+    pool.run_pool_cycle()
+    turn off the pool/spa heater when pool created the heater off file
+
+chk_log_update task (every chk_interval_seconds):
+    chk_log_update.run_check_cycle()
+
+The tasks run one at a time (see kvschedule) - no run overlaps another and
+a run that takes longer than its interval skips the runs it missed.  The
+options for pool and chk_log_update are read from their own conf_json
+files (plus pool_args/chk_args - list of key=value set in
+pool_scheduler.json) and read again when one of those files changes.
+
+screenlogicpy is still run as a command - its output is the text that pool
+parses.
+
+The task run counts and run seconds histograms are written to metrics_filename.
+
+'''
+import os.path
+import os
+import sys
+import copy
+import signal
+import logging
+import subprocess
+import kvutil
+import kvmetrics
+import kvschedule
+import pool
+import chk_log_update
+
+
+# Logging Setup
+# logging.basicConfig(level=logging.INFO)
+logging.basicConfig(filename=os.path.splitext(kvutil.scriptinfo()['name'])[0]+'.log',
+                    level=logging.INFO,
+                    format='%(asctime)s - %(name)s - %(threadName)s -  %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+# application variables
+optiondictconfig = {
+    'AppVersion' : {
+        'value': '1.00',
+        'description' : 'defines the version number for the app',
+    },
+    'debug' : {
+        'value' : False,
+        'type'  : 'bool',
+        'description' : 'defines if we are running in debug mode',
+    },
+    'verbose' : {
+        'value' : 1,
+        'type'  : 'int',
+        'description' : 'defines the display level for print messages',
+    },
+    'conf_json' : {
+        'value' : ['pool_scheduler.json'],
+        'description' : 'defines the json configuration file to be read',
+    },
+    'screenlogic_cmd' : {
+        'value' : 'screenlogicpy',
+        'description' : 'defines the command used to talk to the screenlogic gateway',
+    },
+    'screenlogic_host' : {
+        'value' : '192.168.8.141',
+        'description' : 'defines the ip address of the screenlogic gateway',
+    },
+    'screenlogic_timeout_seconds' : {
+        'value' : 60,
+        'type'  : 'int',
+        'description' : 'defines the seconds a screenlogic command can run before it is stopped',
+    },
+    'pool_interval_seconds' : {
+        'value' : 300,
+        'type'  : 'int',
+        'description' : 'defines the seconds between pool cycles (0 - pool cycle not run)',
+    },
+    'pool_jitter_seconds' : {
+        'value' : 10,
+        'type'  : 'int',
+        'description' : 'defines the most random seconds a pool cycle is delayed',
+    },
+    'pool_args' : {
+        'value' : [],
+        'description' : 'defines the list of key=value options passed to pool (set in the conf_json file)',
+    },
+    'chk_interval_seconds' : {
+        'value' : 600,
+        'type'  : 'int',
+        'description' : 'defines the seconds between chk_log_update checks (0 - checks not run)',
+    },
+    'chk_jitter_seconds' : {
+        'value' : 30,
+        'type'  : 'int',
+        'description' : 'defines the most random seconds a chk_log_update check is delayed',
+    },
+    'chk_args' : {
+        'value' : [],
+        'description' : 'defines the list of key=value options passed to chk_log_update (set in the conf_json file)',
+    },
+    'lock_filename' : {
+        'value' : 'pool_scheduler.lck',
+        'description' : 'defines the file locked so only one scheduler runs',
+    },
+    'metrics_filename' : {
+        'value' : 'pool_scheduler.prom',
+        'description' : 'defines the prometheus textfile the task metrics are written to (not set - no metrics)',
+    },
+}
+
+
+def parse_module_options(module_optiondictconfig, args, cache_filename=None):
+    '''
+    the optiondict a script gets when run with args (list of key=value) on its command line
+    cache_filename - see kvutil.kv_parse_command_line
+    '''
+    saved_argv = sys.argv
+    sys.argv = [saved_argv[0]] + list(args)
+    try:
+        return kvutil.kv_parse_command_line(copy.deepcopy(module_optiondictconfig), cache_filename=cache_filename)
+    finally:
+        sys.argv = saved_argv
+
+
+class ModuleOptions:
+    '''
+    the options of a script - read again when one of its conf_json files changes
+
+    cache_filename - options cache (see kvutil.kv_parse_command_line) - a restart with the same config skips the parse
+
+    get() - the current optiondict
+    '''
+
+    def __init__(self, name, module_optiondictconfig, args, cache_filename=None):
+        self.name = name
+        self.module_optiondictconfig = module_optiondictconfig
+        self.args = args
+        self.cache_filename = cache_filename
+        self.optiondict = None
+        self.signature = None
+
+    def get(self):
+        if self.optiondict is not None:
+            signature = kvutil.conf_json_signature(self.optiondict.get('conf_json'))
+            if signature == self.signature:
+                return self.optiondict
+            logger.info('%s conf_json changed - reading the options again', self.name)
+        self.optiondict = parse_module_options(self.module_optiondictconfig, self.args, self.cache_filename)
+        self.signature = kvutil.conf_json_signature(self.optiondict.get('conf_json'))
+        return self.optiondict
+
+
+def run_screenlogic(optiondict, args):
+    '''
+    run the screenlogic command with args
+
+    returns the completed process - None when it could not be run or timed out
+    '''
+    cmd = [optiondict['screenlogic_cmd'], '-i', optiondict['screenlogic_host']] + list(args)
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=optiondict['screenlogic_timeout_seconds'])
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error('Unable to run %s:%s', cmd, e)
+        return None
+    if proc.returncode:
+        logger.error('%s returned %s:%s', cmd, proc.returncode, proc.stderr.strip())
+    return proc
+
+
+def pool_task(optiondict, pool_options):
+    '''
+    one pool cycle - the steps of run_pool.sh without starting a new process for pool
+    '''
+    pool_optiondict = pool_options.get()
+
+    # capture the gateway status - pool reads this file (empty when the gateway did not answer)
+    proc = run_screenlogic(optiondict, [])
+    kvutil.write_file_atomic(pool_optiondict['input_filename'], proc.stdout if proc else '')
+
+    pool.run_pool_cycle(pool_optiondict)
+
+    # pool created a file asking for a heater to be turned off
+    for body, fname_key in (('pool', 'pool_heater_off_filename'), ('spa', 'spa_heater_off_filename')):
+        fname = pool_optiondict[fname_key]
+        if fname and os.path.exists(fname):
+            proc = run_screenlogic(optiondict, ['set', 'heat-mode', body, '0'])
+            if proc and not proc.returncode:
+                logger.info('Turned off the %s heater - removing:%s', body, fname)
+                os.remove(fname)
+            else:
+                # left in place so the next cycle tries again
+                logger.error('Unable to turn off the %s heater - will retry:%s', body, fname)
+
+
+def build_tasks(optiondict):
+    '''
+    the scheduler tasks enabled in optiondict
+    '''
+    tasks = []
+    cache_base = os.path.splitext(kvutil.scriptinfo()['name'])[0]
+    if optiondict['pool_interval_seconds']:
+        pool_options = ModuleOptions('pool', pool.optiondictconfig, optiondict['pool_args'],
+                                     cache_base + '_pool_options.cache')
+        tasks.append(kvschedule.Task('pool', lambda: pool_task(optiondict, pool_options),
+                                     optiondict['pool_interval_seconds'], optiondict['pool_jitter_seconds']))
+    if optiondict['chk_interval_seconds']:
+        chk_options = ModuleOptions('chk_log_update', chk_log_update.optiondictconfig, optiondict['chk_args'],
+                                    cache_base + '_chk_options.cache')
+        tasks.append(kvschedule.Task('chk_log_update', lambda: chk_log_update.run_check_cycle(chk_options.get()),
+                                     optiondict['chk_interval_seconds'], optiondict['chk_jitter_seconds']))
+    return tasks
+
+
+# ---------------------------------------------------------------------------
+if __name__ == '__main__':
+
+    # capture the command line
+    optiondict = kvutil.kv_parse_command_line( optiondictconfig, debug=False )
+
+    # set variables based on what came form command line
+    debug = optiondict['debug']
+
+    # print header to show what is going on (convert this to a kvutil function:  kvutil.loggingStart(logger,optiondict))
+    kvutil.loggingAppStart( logger, optiondict, kvutil.scriptinfo()['name'] )
+
+    # only one scheduler at a time
+    if optiondict['lock_filename']:
+        lock_fd = kvschedule.instance_lock(optiondict['lock_filename'])
+
+    def write_metrics(scheduler, task):
+        if optiondict['metrics_filename']:
+            metrics = kvmetrics.MetricsRegistry('pool_scheduler_')
+            scheduler.add_metrics(metrics)
+            metrics.write(optiondict['metrics_filename'])
+
+    scheduler = kvschedule.Scheduler(build_tasks(optiondict), on_run=write_metrics)
+
+    # systemd/kill - finish the task that is running and stop
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+
+    scheduler.run()
+
+# eof
@@ -3,6 +3,9 @@
 # Version:  2024-09-07;kv - added in spa turn off file
 #           2024-08-31;kv
 
+# Superseded by pool_scheduler.py - one long running process that runs
+# these steps (and chk_log_update) without a cron entry
+
 # Move the execution folder
 # Activate python in VENV
 # Run the program to determine what is going on
@@ -0,0 +1,414 @@
+import kvutil
+
+import chk_log_update
+
+import unittest
+
+import os
+import json
+import time
+import sys
+import tempfile
+import threading
+import subprocess
+import unittest.mock
+
+
+def build_optiondict(tmpdir, check_files, **kwargs):
+    optiondict = {k: v['value'] for k, v in chk_log_update.optiondictconfig.items()}
+    optiondict['notify_backend'] = 'file'
+    optiondict['notify_filename'] = os.path.join(tmpdir, 'messages.txt')
+    optiondict['metrics_filename'] = os.path.join(tmpdir, 'chk_log_update.prom')
+    optiondict['check_files'] = check_files
+    optiondict.update(kwargs)
+    return optiondict
+
+
+def sent_subjects(optiondict):
+    if not os.path.exists(optiondict['notify_filename']):
+        return []
+    return [json.loads(x)['email_subject'] for x in kvutil.read_list_from_file_lines(optiondict['notify_filename'])]
+
+
+def check_rec(tmpdir, name, max_age_seconds=60, max_lock_age_seconds=600):
+    return {
+        'fname': os.path.join(tmpdir, name),
+        'max_age_seconds': max_age_seconds,
+        'lock_fname': os.path.join(tmpdir, name + '.lck'),
+        'max_lock_age_seconds': max_lock_age_seconds,
+    }
+
+
+def write_file(fname, age_seconds=0):
+    with open(fname, 'w') as f:
+        f.write('data\n')
+    if age_seconds:
+        mtime = time.time() - age_seconds
+        os.utime(fname, (mtime, mtime))
+
+
+def append_file(fname, text):
+    with open(fname, 'a') as f:
+        f.write(text)
+
+
+# Testing class
+class TestKVchk_log_update(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmpdir.name
+
+    def tearDown(self):
+        chk_log_update.kvnotifier.close_notifiers()
+        self.tmpdir.cleanup()
+
+    #def stat_check_files(check_files, max_workers=16, timeout=30):
+    def test_stat_check_files_p01_simple(self):
+        recs = [check_rec(self.tmp, 'a.csv'), check_rec(self.tmp, 'b.csv')]
+        write_file(recs[0]['fname'])
+        write_file(recs[1]['lock_fname'])
+        results = chk_log_update.stat_check_files(recs)
+        self.assertTrue(results[0]['fname'])
+        self.assertIsNone(results[0]['lock'])
+        self.assertIsNone(results[1]['fname'])
+        self.assertTrue(results[1]['lock'])
+        self.assertTrue(all(x['error'] is None for x in results))
+    def test_stat_check_files_p02_directory_is_not_file(self):
+        rec = check_rec(self.tmp, 'adir')
+        os.mkdir(rec['fname'])
+        self.assertIsNone(chk_log_update.stat_check_files([rec])[0]['fname'])
+    def test_stat_check_files_p03_parallel(self):
+        recs = [check_rec(self.tmp, 'f{}.csv'.format(cnt)) for cnt in range(20)]
+        real_stat = os.stat
+        def slow_stat(path, *args, **kwargs):
+            time.sleep(0.1)
+            return real_stat(path, *args, **kwargs)
+        start = time.monotonic()
+        with unittest.mock.patch.object(chk_log_update.os, 'stat', slow_stat):
+            chk_log_update.stat_check_files(recs, max_workers=40)
+        self.assertLess(time.monotonic() - start, 1.0)
+    def test_stat_check_files_f01_timeout(self):
+        recs = [check_rec(self.tmp, 'hung.csv')]
+        real_stat = os.stat
+        def hung_stat(path, *args, **kwargs):
+            time.sleep(1)
+            return real_stat(path, *args, **kwargs)
+        with unittest.mock.patch.object(chk_log_update.os, 'stat', hung_stat):
+            results = chk_log_update.stat_check_files(recs, timeout=0.2)
+        self.assertEqual(results[0]['error'], 'timeout')
+    def test_stat_check_files_f02_timeout_per_check(self):
+        # two slow checks take both threads - the slow checks queued behind them get their own timeout
+        recs = [check_rec(self.tmp, name) for name in ('slow1.csv', 'slow2.csv', 'slow3.csv', 'slow4.csv', 'a.csv')]
+        real_stat = os.stat
+        def slow_stat(path, *args, **kwargs):
+            if os.path.basename(path).startswith('slow') and path.endswith('.csv'):
+                time.sleep(0.3)
+            return real_stat(path, *args, **kwargs)
+        with unittest.mock.patch.object(chk_log_update.os, 'stat', slow_stat):
+            results = chk_log_update.stat_check_files(recs, max_workers=2, timeout=0.5)
+        self.assertEqual([x['error'] for x in results], [None, None, None, None, None])
+    def test_stat_check_files_f03_hung_stat_does_not_block_exit(self):
+        # the stat never returns - the process still exits after the timeout
+        script = ('import os, time, chk_log_update\n'
+                  'os.stat = lambda *args, **kwargs: time.sleep(60)\n'
+                  'rec = {"fname": "hung.csv", "lock_fname": "hung.csv.lck"}\n'
+                  'print(chk_log_update.stat_check_files([rec], timeout=0.2)[0]["error"])\n')
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(chk_log_update.__file__)))
+        start = time.monotonic()
+        proc = subprocess.run([sys.executable, '-c', script], cwd=self.tmp, env=env, capture_output=True, text=True, timeout=30)
+        self.assertEqual(proc.stdout.strip(), 'timeout')
+        self.assertLess(time.monotonic() - start, 10)
+
+    #def message_on_file_too_old(fname, max_age_seconds, lock_fname, max_lock_age_seconds, optiondict, stats=None):
+    def test_message_on_file_too_old_p01_fresh(self):
+        rec = check_rec(self.tmp, 'data.csv')
+        write_file(rec['fname'])
+        optiondict = build_optiondict(self.tmp, [rec])
+        self.assertIsNone(chk_log_update.message_on_file_too_old(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], optiondict))
+    def test_message_on_file_too_old_p02_stale_over_a_day(self):
+        rec = check_rec(self.tmp, 'data.csv', max_age_seconds=3600)
+        write_file(rec['fname'], age_seconds=86400 + 60)
+        optiondict = build_optiondict(self.tmp, [rec])
+        self.assertTrue(chk_log_update.message_on_file_too_old(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], optiondict))
+        self.assertTrue(os.path.exists(rec['lock_fname']))
+        # lock file holds off the next message
+        self.assertIsNone(chk_log_update.message_on_file_too_old(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], optiondict))
+        self.assertEqual(len(sent_subjects(optiondict)), 1)
+    def test_message_on_file_too_old_p03_timeout_stats(self):
+        rec = check_rec(self.tmp, 'data.csv')
+        optiondict = build_optiondict(self.tmp, [rec])
+        stats = {'lock': None, 'fname': None, 'error': 'timeout'}
+        chk_log_update.message_on_file_too_old(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], optiondict, stats)
+        self.assertIn('unable to check (timeout)', sent_subjects(optiondict)[0])
+
+    #def content_timestamp(fname, content):
+    def test_message_on_file_too_old_p04_content_timestamp_stale(self):
+        # file was just written but the last record it holds is old
+        rec = dict(check_rec(self.tmp, 'pool_temps.csv', max_age_seconds=3600), content_timestamp=True)
+        old = time.strftime('%Y-%m-%d:%H:%M:%S', time.localtime(time.time() - 7200))
+        with open(rec['fname'], 'w') as f:
+            f.write('now_str,pool\n' + ''.join('{},80\n'.format(old) for _ in range(1000)))
+        optiondict = build_optiondict(self.tmp, [rec])
+        stats = chk_log_update.stat_check_files([rec])[0]
+        self.assertAlmostEqual(stats['content_ts'], time.time() - 7200, delta=5)
+        self.assertTrue(chk_log_update.message_on_file_too_old(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], optiondict, stats))
+        self.assertIn('got stale', sent_subjects(optiondict)[0])
+    def test_message_on_file_too_old_p05_content_timestamp_fresh(self):
+        rec = dict(check_rec(self.tmp, 'pool_temps.csv', max_age_seconds=3600), content_timestamp=True)
+        with open(rec['fname'], 'w') as f:
+            f.write('now_str,pool\n' + time.strftime('%Y-%m-%d:%H:%M:%S') + ',80\n')
+        os.utime(rec['fname'], (time.time() - 7200, time.time() - 7200))
+        optiondict = build_optiondict(self.tmp, [rec])
+        self.assertIsNone(chk_log_update.message_on_file_too_old(rec['fname'], rec['max_age_seconds'], rec['lock_fname'], rec['max_lock_age_seconds'], optiondict,
+                                                                 content=chk_log_update.content_options(rec)))
+    def test_content_timestamp_p01_column_format(self):
+        fname = os.path.join(self.tmp, 'data.txt')
+        with open(fname, 'w') as f:
+            f.write('x|07/02/2024 10:15\n\n')
+        content = chk_log_update.content_options({'content_timestamp': True, 'timestamp_column': 1, 'delimiter': '|',
+                                                  'timestamp_format': '%m/%d/%Y %H:%M'})
+        self.assertEqual(chk_log_update.content_timestamp(fname, content), time.mktime((2024, 7, 2, 10, 15, 0, 0, 0, -1)))
+    def test_content_timestamp_f01_header_only_uses_mtime(self):
+        rec = dict(check_rec(self.tmp, 'pool_temps.csv'), content_timestamp=True)
+        with open(rec['fname'], 'w') as f:
+            f.write('now_str,pool\n')
+        stats = chk_log_update.stat_check_files([rec])[0]
+        self.assertIsNone(stats['content_ts'])
+        self.assertEqual(chk_log_update.check_timestamp(stats), stats['fname'].st_mtime)
+
+    #def add_check_metrics(metrics, check_files, check_stats, now_ts=None):
+    def test_add_check_metrics_p01_ages(self):
+        recs = [check_rec(self.tmp, 'a.csv'), check_rec(self.tmp, 'missing.csv')]
+        write_file(recs[0]['fname'], age_seconds=100)
+        write_file(recs[0]['lock_fname'], age_seconds=50)
+        metrics = chk_log_update.kvmetrics.MetricsRegistry('chk_log_update_')
+        chk_log_update.add_check_metrics(metrics, recs, chk_log_update.stat_check_files(recs))
+        lines = metrics.render().splitlines()
+        age = [x for x in lines if x.startswith('chk_log_update_file_age_seconds{file="' + recs[0]['fname'])][0]
+        self.assertAlmostEqual(float(age.split()[-1]), 100, delta=5)
+        self.assertIn('chk_log_update_file_age_seconds{file="' + recs[1]['fname'] + '"} NaN', lines)
+        self.assertIn('chk_log_update_file_exists{file="' + recs[1]['fname'] + '"} 0', lines)
+        lock = [x for x in lines if x.startswith('chk_log_update_lock_age_seconds{file="' + recs[0]['fname'])][0]
+        self.assertAlmostEqual(float(lock.split()[-1]), 50, delta=5)
+
+    #def daemon_watch_dirs(key):
+    def test_daemon_watch_dirs_p01_wildcard_dir(self):
+        os.mkdir(os.path.join(self.tmp, 'a'))
+        key = os.path.join(self.tmp, '*', 'data.csv')
+        self.assertEqual(chk_log_update.daemon_watch_dirs(key), [self.tmp, os.path.join(self.tmp, 'a')])
+        self.assertEqual(chk_log_update.daemon_watch_dirs(os.path.join(self.tmp, 'data.csv')), [self.tmp])
+
+    #def resolve_check_files(check_files):
+    def test_resolve_check_files_p01_glob_newest(self):
+        write_file(os.path.join(self.tmp, 'a.csv'), age_seconds=500)
+        write_file(os.path.join(self.tmp, 'b.csv'), age_seconds=10)
+        write_file(os.path.join(self.tmp, 'c.txt'))
+        rec = {'glob': os.path.join(self.tmp, '*.csv'), 'max_age_seconds': 60, 'lock_fname': os.path.join(self.tmp, 'csv.lck'), 'max_lock_age_seconds': 600}
+        resolved = chk_log_update.resolve_check_files([rec])
+        self.assertEqual(len(resolved), 1)
+        self.assertEqual(len(resolved[0]['candidates']), 2)
+        stats = chk_log_update.stat_check_files(resolved)[0]
+        self.assertEqual(stats['path'], os.path.join(self.tmp, 'b.csv'))
+        optiondict = build_optiondict(self.tmp, [rec])
+        self.assertIsNone(chk_log_update.message_on_file_too_old(resolved[0]['fname'], 60, rec['lock_fname'], 600, optiondict, stats))
+    def test_resolve_check_files_p02_dir_all(self):
+        datadir = os.path.join(self.tmp, 'data')
+        os.mkdir(datadir)
+        write_file(os.path.join(datadir, 'a.csv'), age_seconds=500)
+        write_file(os.path.join(datadir, 'b.csv'))
+        os.mkdir(os.path.join(datadir, 'subdir'))
+        rec = {'dir': datadir, 'max_age_seconds': 60, 'lock_fname': os.path.join(self.tmp, 'data.lck'), 'max_lock_age_seconds': 600}
+        resolved = chk_log_update.resolve_check_files([rec])
+        self.assertEqual([os.path.basename(x['fname']) for x in resolved], ['a.csv', 'b.csv'])
+        self.assertEqual(resolved[0]['lock_fname'], os.path.join(self.tmp, 'data-a.csv.lck'))
+        optiondict = build_optiondict(self.tmp, [rec])
+        for res, stats in zip(resolved, chk_log_update.stat_check_files(resolved)):
+            chk_log_update.message_on_file_too_old(res['fname'], 60, res['lock_fname'], 600, optiondict, stats)
+        self.assertEqual(len(sent_subjects(optiondict)), 1)
+        self.assertIn('a.csv-got stale', sent_subjects(optiondict)[0])
+    def test_resolve_check_files_p03_glob_no_match(self):
+        rec = {'glob': os.path.join(self.tmp, '*.csv'), 'max_age_seconds': 60, 'lock_fname': os.path.join(self.tmp, 'csv.lck'), 'max_lock_age_seconds': 600}
+        resolved = chk_log_update.resolve_check_files([rec])
+        self.assertEqual(resolved[0]['candidates'], [])
+        self.assertIsNone(chk_log_update.stat_check_files(resolved)[0]['fname'])
+    def test_resolve_check_files_f01_bad_record(self):
+        with self.assertRaises(Exception):
+            chk_log_update.resolve_check_files([{'max_age_seconds': 60}])
+
+    #def message_digest_on_files_too_old(check_files, check_stats, optiondict, now_ts=None):
+    def test_message_digest_on_files_too_old_p01_one_message(self):
+        recs = [check_rec(self.tmp, 'a.csv'), check_rec(self.tmp, 'b.csv'), check_rec(self.tmp, 'c.csv'), check_rec(self.tmp, 'fresh.csv')]
+        write_file(recs[0]['fname'], age_seconds=3 * 3600)
+        write_file(recs[1]['fname'], age_seconds=2 * 86400)
+        write_file(recs[3]['fname'])
+        optiondict = build_optiondict(self.tmp, recs)
+        self.assertTrue(chk_log_update.message_digest_on_files_too_old(recs, chk_log_update.stat_check_files(recs), optiondict))
+        msgs = [json.loads(x) for x in kvutil.read_list_from_file_lines(optiondict['notify_filename'])]
+        self.assertEqual(len(msgs), 1)
+        self.assertIn('3 files stale or missing', msgs[0]['email_subject'])
+        self.assertIn(recs[0]['fname'] + ' - got stale - age 3h 00m', msgs[0]['email_body'])
+        self.assertIn(recs[1]['fname'] + ' - got stale - age 2d 00h 00m', msgs[0]['email_body'])
+        self.assertIn(recs[2]['fname'] + ' - does not exist', msgs[0]['email_body'])
+        self.assertNotIn(recs[3]['fname'], msgs[0]['email_body'])
+        self.assertEqual([os.path.exists(x['lock_fname']) for x in recs], [True, True, True, False])
+        # every file is inside its re-notify window - no message
+        self.assertIsNone(chk_log_update.message_digest_on_files_too_old(recs, chk_log_update.stat_check_files(recs), optiondict))
+        self.assertEqual(len(sent_subjects(optiondict)), 1)
+    def test_message_digest_on_files_too_old_p02_lock_window_per_file(self):
+        recs = [check_rec(self.tmp, 'a.csv', max_lock_age_seconds=600), check_rec(self.tmp, 'b.csv', max_lock_age_seconds=60)]
+        for rec in recs:
+            write_file(rec['fname'], age_seconds=3600)
+            write_file(rec['lock_fname'], age_seconds=120)
+        optiondict = build_optiondict(self.tmp, recs)
+        chk_log_update.message_digest_on_files_too_old(recs, chk_log_update.stat_check_files(recs), optiondict)
+        # only b.csv is past its window - single file subject
+        self.assertEqual(sent_subjects(optiondict), [optiondict['email_subject'] + recs[1]['fname'] + '-got stale'])
+    def test_message_digest_on_files_too_old_p03_nothing_due(self):
+        recs = [check_rec(self.tmp, 'a.csv')]
+        write_file(recs[0]['fname'])
+        optiondict = build_optiondict(self.tmp, recs)
+        self.assertIsNone(chk_log_update.message_digest_on_files_too_old(recs, chk_log_update.stat_check_files(recs), optiondict))
+        self.assertEqual(sent_subjects(optiondict), [])
+
+    #def scan_log_checks(log_checks, optiondict):
+    def test_scan_log_checks_p01_threshold_in_digest(self):
+        log = os.path.join(self.tmp, 'pool.log')
+        write_file(log)
+        log_rec = {'log_fname': log, 'lock_fname': log + '.lck', 'max_lock_age_seconds': 600,
+                   'patterns': [{'name': 'insufficient', 'regex': 'Insufficient lines created', 'threshold': 2, 'window_seconds': 3600}]}
+        rec = check_rec(self.tmp, 'missing.csv')
+        optiondict = build_optiondict(self.tmp, [rec], log_checks=[log_rec],
+                                      log_checkpoint_filename=os.path.join(self.tmp, 'logscan.json'))
+        # first run records the checkpoint at the end of the file
+        self.assertEqual(chk_log_update.scan_log_checks([log_rec], optiondict)[0], [])
+        with open(log, 'a') as f:
+            f.write('Insufficient lines created - unable to parse file - EXITTING\n')
+        self.assertEqual(chk_log_update.scan_log_checks([log_rec], optiondict)[0], [])
+        with open(log, 'a') as f:
+            f.write('Insufficient lines created - unable to parse file - EXITTING\n')
+        log_findings, results = chk_log_update.scan_log_checks([log_rec], optiondict)
+        self.assertEqual(results[0]['rates'], {'insufficient': 2})
+        self.assertIn('insufficient x2 in 1h 00m', log_findings[0]['problem'])
+        chk_log_update.check_messages([rec], chk_log_update.stat_check_files([rec]), optiondict, log_findings)
+        msgs = [json.loads(x) for x in kvutil.read_list_from_file_lines(optiondict['notify_filename'])]
+        self.assertEqual(len(msgs), 1)
+        self.assertIn('2 file alerts', msgs[0]['email_subject'])
+        self.assertTrue(os.path.exists(log_rec['lock_fname']))
+        # inside the lock window - no new finding
+        self.assertEqual(chk_log_update.scan_log_checks([log_rec], optiondict)[0], [])
+
+    #def format_age(seconds):
+    def test_format_age_p01_simple(self):
+        self.assertEqual(chk_log_update.format_age(59), '0h 00m')
+        self.assertEqual(chk_log_update.format_age(3 * 3600 + 5 * 60), '3h 05m')
+        self.assertEqual(chk_log_update.format_age(86400 + 3600), '1d 01h 00m')
+
+    #def run_daemon(optiondict, max_loops=None):
+    def test_run_daemon_p01_stale_fires_on_timer(self):
+        rec = check_rec(self.tmp, 'data.csv', max_age_seconds=1)
+        write_file(rec['fname'])
+        optiondict = build_optiondict(self.tmp, [rec], daemon_tick_seconds=0.5)
+        chk_log_update.run_daemon(optiondict, max_loops=1)
+        self.assertEqual(sent_subjects(optiondict), [])
+        chk_log_update.run_daemon(optiondict, max_loops=4)
+        self.assertEqual(len(sent_subjects(optiondict)), 1)
+        self.assertIn('got stale', sent_subjects(optiondict)[0])
+    def test_run_daemon_p02_missing(self):
+        rec = check_rec(self.tmp, 'missing.csv')
+        optiondict = build_optiondict(self.tmp, [rec], daemon_tick_seconds=0.1)
+        last_write = chk_log_update.run_daemon(optiondict, max_loops=1)
+        self.assertIsNone(last_write[os.path.abspath(rec['fname'])])
+        self.assertIn('does not exist', sent_subjects(optiondict)[0])
+    def test_run_daemon_p03_fresh_no_message(self):
+        rec = check_rec(self.tmp, 'data.csv', max_age_seconds=60)
+        write_file(rec['fname'])
+        optiondict = build_optiondict(self.tmp, [rec], daemon_tick_seconds=0.1)
+        chk_log_update.run_daemon(optiondict, max_loops=2)
+        self.assertEqual(sent_subjects(optiondict), [])
+    def test_run_daemon_p04_digest_of_expired(self):
+        recs = [check_rec(self.tmp, 'a.csv'), check_rec(self.tmp, 'b.csv')]
+        optiondict = build_optiondict(self.tmp, recs, daemon_tick_seconds=0.1)
+        chk_log_update.run_daemon(optiondict, max_loops=1)
+        self.assertEqual(len(sent_subjects(optiondict)), 1)
+        self.assertIn('2 files stale or missing', sent_subjects(optiondict)[0])
+    def test_run_daemon_p05_dir_new_file(self):
+        datadir = os.path.join(self.tmp, 'data')
+        os.mkdir(datadir)
+        write_file(os.path.join(datadir, 'a.csv'))
+        rec = {'dir': datadir, 'max_age_seconds': 60, 'lock_fname': os.path.join(self.tmp, 'data.lck'), 'max_lock_age_seconds': 600}
+        optiondict = build_optiondict(self.tmp, [rec], daemon_tick_seconds=0.1, daemon_poll_seconds=0.1)
+        # created after the daemon started - already stale
+        timer = threading.Timer(0.2, write_file, [os.path.join(datadir, 'b.csv'), 120])
+        timer.start()
+        last_write = chk_log_update.run_daemon(optiondict, max_loops=10)
+        timer.join()
+        self.assertIn(os.path.join(datadir, 'b.csv'), last_write)
+        self.assertEqual(len(sent_subjects(optiondict)), 1)
+        self.assertIn('b.csv', sent_subjects(optiondict)[0])
+    def test_run_daemon_p06_log_checks_scanned(self):
+        log = os.path.join(self.tmp, 'pool.log')
+        write_file(log)
+        log_rec = {'log_fname': log, 'lock_fname': log + '.lck', 'max_lock_age_seconds': 600,
+                   'patterns': [{'name': 'traceback', 'regex': 'Traceback'}]}
+        optiondict = build_optiondict(self.tmp, [], log_checks=[log_rec], daemon_tick_seconds=0.1, daemon_log_scan_seconds=0,
+                                      log_checkpoint_filename=os.path.join(self.tmp, 'logscan.json'))
+        # logged after the daemon started - found on a later scan
+        timer = threading.Timer(0.2, append_file, [log, 'Traceback (most recent call last):\n'])
+        timer.start()
+        chk_log_update.run_daemon(optiondict, max_loops=10)
+        timer.join()
+        self.assertEqual(len(sent_subjects(optiondict)), 1)
+        self.assertIn('logged errors (traceback x1', sent_subjects(optiondict)[0])
+    def test_run_daemon_p09_missed_write_rescheduled_on_age(self):
+        rec = check_rec(self.tmp, 'data.csv', max_age_seconds=1)
+        write_file(rec['fname'], 0.5)
+        # polling once an hour - the write below is not seen as an event
+        optiondict = build_optiondict(self.tmp, [rec], daemon_tick_seconds=0.1, daemon_poll_seconds=3600)
+        timer = threading.Timer(0.2, write_file, [rec['fname']])
+        timer.start()
+        with unittest.mock.patch.object(chk_log_update.kvwatch, '_load_inotify', return_value=None):
+            chk_log_update.run_daemon(optiondict, max_loops=20)
+        timer.join()
+        # the timer fired on the old age, found the file fresh and came back when it went stale
+        self.assertEqual(len(sent_subjects(optiondict)), 1)
+        self.assertIn('got stale', sent_subjects(optiondict)[0])
+    def test_run_daemon_p10_missing_dir_watched_later(self):
+        later = os.path.join(self.tmp, 'later')
+        rec = dict(check_rec(later, 'data.csv'), lock_fname=os.path.join(self.tmp, 'data.csv.lck'))
+        optiondict = build_optiondict(self.tmp, [rec], daemon_tick_seconds=0.1, daemon_resolve_seconds=0)
+        def create():
+            os.mkdir(later)
+            write_file(rec['fname'])
+        timer = threading.Timer(0.2, create)
+        timer.start()
+        last_write = chk_log_update.run_daemon(optiondict, max_loops=10)
+        timer.join()
+        self.assertIsNotNone(last_write[os.path.abspath(rec['fname'])])
+    def test_run_daemon_p08_metrics_written(self):
+        rec = check_rec(self.tmp, 'data.csv', max_age_seconds=60)
+        write_file(rec['fname'], 30)
+        missing = check_rec(self.tmp, 'missing.csv')
+        optiondict = build_optiondict(self.tmp, [rec, missing], daemon_tick_seconds=0.1)
+        chk_log_update.run_daemon(optiondict, max_loops=1)
+        with open(optiondict['metrics_filename']) as f:
+            text = f.read()
+        self.assertIn('chk_log_update_file_age_seconds{file="' + rec['fname'] + '"} 3', text)
+        self.assertIn('chk_log_update_file_exists{file="' + missing['fname'] + '"} 0', text)
+        # the missing file message created its lock file
+        self.assertIn('chk_log_update_lock_age_seconds{file="' + missing['fname'] + '",lock_fname="' + missing['lock_fname'] + '"} 0', text)
+        self.assertIn('chk_log_update_notify_messages_sent{backend="file"}', text)
+    def test_run_daemon_p07_glob_wildcard_dir(self):
+        rec = {'glob': os.path.join(self.tmp, '*', 'data.csv'), 'max_age_seconds': 60, 'lock_fname': os.path.join(self.tmp, 'csv.lck'), 'max_lock_age_seconds': 600}
+        optiondict = build_optiondict(self.tmp, [rec], daemon_tick_seconds=0.1, daemon_poll_seconds=0.1)
+        def create():
+            os.mkdir(os.path.join(self.tmp, 'sub'))
+            write_file(os.path.join(self.tmp, 'sub', 'data.csv'))
+        timer = threading.Timer(0.2, create)
+        timer.start()
+        last_write = chk_log_update.run_daemon(optiondict, max_loops=10)
+        timer.join()
+        self.assertIsNotNone(last_write[os.path.abspath(rec['glob'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import kvdate
+
+import unittest
+
+import datetime
+
+
+# Testing class
+class TestKVdate(unittest.TestCase):
+    #def datetime_from_str(value, skipblank=False):
+    def test_datetime_from_str_p01_formats(self):
+        expected = {
+            '02/07/24': datetime.datetime(2024, 2, 7),
+            '2/7/2024': datetime.datetime(2024, 2, 7),
+            '02-07-24': datetime.datetime(2024, 2, 7),
+            '02-07-2024': datetime.datetime(2024, 2, 7),
+            '2024-02-07T10:15:30': datetime.datetime(2024, 2, 7, 10, 15, 30),
+            '2024-02-07T10:15:30.250': datetime.datetime(2024, 2, 7, 10, 15, 30, 250000),
+            '2024-02-07 10:15:30': datetime.datetime(2024, 2, 7, 10, 15, 30),
+            '2024-02-07 10:15': datetime.datetime(2024, 2, 7, 10, 15),
+            '2024-02-07:10:15:30': datetime.datetime(2024, 2, 7, 10, 15, 30),
+            '2024-02-07': datetime.datetime(2024, 2, 7),
+            '2024-2-7': datetime.datetime(2024, 2, 7),
+            '20240207': datetime.datetime(2024, 2, 7),
+            '2024-02-07T10:15:30Z': datetime.datetime(2024, 2, 7, 10, 15, 30),
+        }
+        for value, dt in expected.items():
+            result = kvdate.datetime_from_str(value)
+            self.assertEqual(result, dt, value)
+            self.assertIsNone(result.tzinfo, value)
+    def test_datetime_from_str_p02_memo_does_not_change_result(self):
+        # alternate formats so the remembered pattern is always the wrong one
+        for _ in range(3):
+            self.assertEqual(kvdate.datetime_from_str('02/07/24'), datetime.datetime(2024, 2, 7))
+            self.assertEqual(kvdate.datetime_from_str('02-07-2024'), datetime.datetime(2024, 2, 7))
+    def test_datetime_from_str_p03_skipblank(self):
+        self.assertEqual(kvdate.datetime_from_str('', skipblank=True), '')
+    def test_datetime_from_str_f01_iso_shapes_we_do_not_support(self):
+        # fromisoformat accepts these - datetime_from_str never did
+        for value in ('2024-02-07T10:15', '2024-02-07T10', '2024-02-07 10:15:30+00:00', '2024-02-07:10:15:3a', 'garbage'):
+            with self.assertRaises(Exception, msg=value):
+                kvdate.datetime_from_str(value)
+    def test_datetime_from_str_f03_compact_time(self):
+        # fromisoformat takes the time without the ':' separators - datetime_from_str never did
+        for value in ('2024-01-05 12345678', '2024-01-05T1234.567', '2024-01-05:12345678', '2024-01-05T123456.789'):
+            with self.assertRaises(Exception, msg=value):
+                kvdate.datetime_from_str(value)
+    def test_datetime_from_str_f02_bad_date(self):
+        with self.assertRaises(ValueError):
+            kvdate.datetime_from_str('2024-02-30')
+
+    #def datetimezone_from_str(value, skipblank=False):
+    def test_datetimezone_from_str_p01_formats(self):
+        utc8 = datetime.timezone(datetime.timedelta(hours=-8))
+        for value in ('2024-02-07 10:15:30-0800', '2024-02-07T10:15:30-08:00', '2024-02-07T10:15:30.000-0800'):
+            self.assertEqual(kvdate.datetimezone_from_str(value), datetime.datetime(2024, 2, 7, 10, 15, 30, tzinfo=utc8), value)
+    def test_datetimezone_from_str_f01_no_zone(self):
+        with self.assertRaises(Exception):
+            kvdate.datetimezone_from_str('2024-02-07 10:15:30')
+
+
+    #def detect_datefmt(values, sample_size=20):
+    def test_detect_datefmt_p01_simple(self):
+        self.assertEqual(kvdate.detect_datefmt(['', '2024-02-07:10:15:30', '2024-02-07:11:15:30']), '%Y-%m-%d:%H:%M:%S')
+        self.assertEqual(kvdate.detect_datefmt(['02/07/2024', 'bad', '2/8/2024']), '%m/%d/%Y')
+        self.assertIsNone(kvdate.detect_datefmt(['', 'bad']))
+
+    #def datetimes_from_strs(values, datefmt=None, sample_size=20, as_numpy=False):
+    def test_datetimes_from_strs_p01_bad_rows_returned(self):
+        values = ['2024-02-07:10:15:30', '2024-02-07:10:15:3x', '', '2024-13-07:10:15:30', '2024-02-07 10:15:30', '2024-02-08:11:00:00']
+        parsed, bad = kvdate.datetimes_from_strs(values)
+        self.assertEqual(parsed, [datetime.datetime(2024, 2, 7, 10, 15, 30), None, None, None, None, datetime.datetime(2024, 2, 8, 11)])
+        self.assertEqual([idx for idx, _ in bad], [1, 3, 4])
+    def test_datetimes_from_strs_p02_strptime_format(self):
+        parsed, bad = kvdate.datetimes_from_strs(['02/07/2024', '2/8/2024', 'x'])
+        self.assertEqual(parsed, [datetime.datetime(2024, 2, 7), datetime.datetime(2024, 2, 8), None])
+        self.assertEqual(bad, [(2, 'x')])
+    def test_datetimes_from_strs_p03_same_as_datetime_from_str(self):
+        values = ['2024-02-07T10:15:30Z', '2024-02-07T10:15:31Z']
+        parsed, bad = kvdate.datetimes_from_strs(values)
+        self.assertEqual(parsed, [kvdate.datetime_from_str(x) for x in values])
+        self.assertEqual(bad, [])
+    def test_datetimes_from_strs_p04_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('numpy not installed')
+        values = ['2024-02-07:10:15:30', '2024-02-07:10:15:3x', '', '2024-13-07:10:15:30', '2024-02-08:11:00:00']
+        parsed, bad = kvdate.datetimes_from_strs(values, as_numpy=True)
+        self.assertEqual(parsed.dtype, np.dtype('datetime64[s]'))
+        self.assertEqual(parsed[0], np.datetime64('2024-02-07T10:15:30'))
+        self.assertTrue(np.isnat(parsed[1]) and np.isnat(parsed[2]))
+        self.assertEqual([idx for idx, _ in bad], [1, 3])
+        parsed, bad = kvdate.datetimes_from_strs(['02/07/2024', 'x'], as_numpy=True)
+        self.assertEqual(parsed[0], np.datetime64('2024-02-07'))
+        self.assertEqual(bad, [(1, 'x')])
+    def test_datetimes_from_strs_p05_not_zero_padded(self):
+        parsed, bad = kvdate.datetimes_from_strs(['2024-7-1', '2024-7-2', '2024-12-25'])
+        self.assertEqual(parsed, [datetime.datetime(2024, 7, 1), datetime.datetime(2024, 7, 2), datetime.datetime(2024, 12, 25)])
+        self.assertEqual(bad, [])
+        parsed, bad = kvdate.datetimes_from_strs(['2024-7-1 1:02:03', '2024-07-02 10:02:03'])
+        self.assertEqual(parsed, [datetime.datetime(2024, 7, 1, 1, 2, 3), datetime.datetime(2024, 7, 2, 10, 2, 3)])
+        self.assertEqual(bad, [])
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('numpy not installed')
+        parsed, bad = kvdate.datetimes_from_strs(['2024-7-1 1:02:03', '2024-07-02 10:02:03', 'x'], '%Y-%m-%d %H:%M:%S', as_numpy=True)
+        self.assertEqual(parsed[0], np.datetime64('2024-07-01T01:02:03'))
+        self.assertEqual(parsed[1], np.datetime64('2024-07-02T10:02:03'))
+        self.assertEqual(bad, [(2, 'x')])
+    def test_datetimes_from_strs_f01_no_format(self):
+        with self.assertRaises(Exception):
+            kvdate.datetimes_from_strs(['bad', 'worse'])
+
+    #def get_tz(tzstr=None):
+    def test_get_tz_p01_cached(self):
+        self.assertIs(kvdate.get_tz('America/Los_Angeles'), kvdate.get_tz('America/Los_Angeles'))
+        self.assertTrue(kvdate.valid_tz_string('America/Los_Angeles'))
+        self.assertFalse(kvdate.valid_tz_string('Not/AZone'))
+        self.assertIn('America/Los_Angeles', kvdate.zone_names())
+
+    #def datetimes2utc(values, default_tz=None, no_tz=False):
+    def test_datetimes2utc_p01_matches_datetime2utcdatetime_across_dst(self):
+        # every 10 minutes across the spring and fall DST changes
+        for start in (datetime.datetime(2024, 3, 9), datetime.datetime(2024, 11, 2)):
+            values = [start + datetime.timedelta(minutes=10 * cnt) for cnt in range(3 * 24 * 6)]
+            for zone in ('America/Los_Angeles', 'Australia/Lord_Howe'):
+                expected = [kvdate.datetime2utcdatetime(x, zone) for x in values]
+                self.assertEqual(kvdate.datetimes2utc(values, zone), expected)
+                self.assertEqual(kvdate.datetimes2utc(values, zone, no_tz=True), [x.replace(tzinfo=None) for x in expected])
+    def test_datetimes2utc_p02_none_passed_through(self):
+        self.assertEqual(kvdate.datetimes2utc([None, datetime.datetime(2024, 7, 1, 12)], 'America/Los_Angeles', no_tz=True),
+                         [None, datetime.datetime(2024, 7, 1, 19)])
+    def test_datetimes2utc_p03_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest('numpy not installed')
+        start = datetime.datetime(2024, 11, 2)
+        values = [start + datetime.timedelta(minutes=10 * cnt) for cnt in range(3 * 24 * 6)]
+        arr = np.array(values + [None], dtype='datetime64[s]')
+        result = kvdate.datetimes2utc(arr, 'America/Los_Angeles')
+        expected = [kvdate.datetime2utcdatetime(x, 'America/Los_Angeles', no_tz=True) for x in values]
+        self.assertEqual(list(result[:-1]), list(np.array(expected, dtype='datetime64[s]')))
+        self.assertTrue(np.isnat(result[-1]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import kvgmailsendsimple
+
+import unittest
+
+import os
+import sys
+import base64
+import email
+import subprocess
+
+
+# fake gmail service - records batches instead of calling google
+class FakeSendRequest:
+    def __init__(self, body):
+        self.body = body
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+    def add(self, request, request_id=None):
+        self.requests.append((request_id, request))
+    def execute(self):
+        self.service.round_trips += 1
+        for request_id, request in self.requests:
+            msg = email.message_from_bytes(base64.urlsafe_b64decode(request.body['raw']))
+            if 'fail' in msg['Subject']:
+                self.callback(request_id, None, Exception('bad message'))
+            else:
+                self.callback(request_id, {'id': 'id-' + request_id}, None)
+
+class FakeService:
+    def __init__(self):
+        self.round_trips = 0
+    def users(self):
+        return self
+    def messages(self):
+        return self
+    def send(self, userId, body):
+        return FakeSendRequest(body)
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+
+def build_messages(cnt, fail_idx=None):
+    return [
+        {'email_to': 'to@example.com',
+         'email_subject': 'fail' if idx == fail_idx else 'subject ' + str(idx),
+         'email_body': 'body ' + str(idx)}
+        for idx in range(cnt)
+    ]
+
+
+# Testing class
+class TestKVgmailsendsimple(unittest.TestCase):
+
+    def test_import_p01_google_deferred(self):
+        proc = subprocess.run([sys.executable, '-c', 'import sys, kvgmailsendsimple; print(sorted(m for m in sys.modules if m.startswith(("google", "googleapiclient"))))'],
+                              cwd=os.path.dirname(os.path.abspath(kvgmailsendsimple.__file__)),
+                              capture_output=True, text=True, check=True)
+        self.assertEqual(proc.stdout.strip(), '[]')
+
+    def test_convert_email_to_filename_p01_simple(self):
+        self.assertEqual(kvgmailsendsimple.convert_email_to_filename('a.b@gmail.com'), 'a_b_gmail_com.json')
+
+    def test_create_message_body_p01_simple(self):
+        body = kvgmailsendsimple.create_message_body('from@example.com', 'to@example.com', 'subj', 'text')
+        msg = email.message_from_bytes(base64.urlsafe_b64decode(body['raw']))
+        self.assertEqual(msg['To'], 'to@example.com')
+        self.assertEqual(msg['From'], 'from@example.com')
+        self.assertEqual(msg['Subject'], 'subj')
+
+    def test_gmail_send_batch_messages_p01_single_round_trip(self):
+        service = FakeService()
+        results = kvgmailsendsimple.gmail_send_batch_messages('from@example.com', build_messages(10), service=service)
+        self.assertEqual(service.round_trips, 1)
+        self.assertEqual([x['id'] for x in results], ['id-' + str(idx) for idx in range(10)])
+        self.assertTrue(all(x['error'] is None for x in results))
+    def test_gmail_send_batch_messages_p02_chunked(self):
+        service = FakeService()
+        results = kvgmailsendsimple.gmail_send_batch_messages('from@example.com', build_messages(7), batch_size=3, service=service)
+        self.assertEqual(service.round_trips, 3)
+        self.assertEqual(len(results), 7)
+    def test_gmail_send_batch_messages_p03_empty(self):
+        service = FakeService()
+        self.assertEqual(kvgmailsendsimple.gmail_send_batch_messages('from@example.com', [], service=service), [])
+        self.assertEqual(service.round_trips, 0)
+    def test_gmail_send_batch_messages_f01_per_message_error(self):
+        service = FakeService()
+        results = kvgmailsendsimple.gmail_send_batch_messages('from@example.com', build_messages(3, fail_idx=1), service=service)
+        self.assertEqual(results[0]['id'], 'id-0')
+        self.assertIsNone(results[1]['id'])
+        self.assertEqual(results[1]['error'], 'bad message')
+        self.assertEqual(results[2]['id'], 'id-2')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import kvlogscan
+
+import unittest
+
+import os
+import tempfile
+
+
+# clock we move forward by hand
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+    def __call__(self):
+        return self.now
+
+
+def append(fname, text):
+    with open(fname, 'a') as f:
+        f.write(text)
+
+
+PATTERNS = [{'name': 'traceback', 'regex': 'Traceback'}, 'Insufficient lines']
+
+
+# Testing class
+class TestKVlogscan(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmpdir.name
+        self.log = os.path.join(self.tmp, 'pool.log')
+        self.checkpoint = os.path.join(self.tmp, 'checkpoint.json')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def scanner(self, **kwargs):
+        return kvlogscan.LogScanner(self.checkpoint, clock=self.clock, **kwargs)
+
+    #def LogScanner.scan(fname, patterns):
+    def test_scan_p01_first_scan_starts_at_end(self):
+        append(self.log, 'Traceback old\n')
+        result = self.scanner().scan(self.log, PATTERNS)
+        self.assertEqual(result['matches'], {'traceback': 0, 'Insufficient lines': 0})
+        result = self.scanner(start_at_end=False).scan(self.log, PATTERNS)
+        self.assertEqual(result['matches']['traceback'], 1)
+    def test_scan_p02_incremental_across_runs(self):
+        append(self.log, 'start\n')
+        scanner = self.scanner()
+        scanner.scan(self.log, PATTERNS)
+        scanner.save()
+        append(self.log, 'Traceback one\nok\nInsufficient lines created\n')
+        scanner = self.scanner()
+        result = scanner.scan(self.log, PATTERNS)
+        self.assertEqual(result['matches'], {'traceback': 1, 'Insufficient lines': 1})
+        self.assertEqual(result['bytes_read'], len('Traceback one\nok\nInsufficient lines created\n'))
+        scanner.save()
+        # nothing new - nothing read
+        result = self.scanner().scan(self.log, PATTERNS)
+        self.assertEqual(result['bytes_read'], 0)
+    def test_scan_p03_partial_line_waits(self):
+        append(self.log, 'start\n')
+        scanner = self.scanner()
+        scanner.scan(self.log, PATTERNS)
+        append(self.log, 'Trace')
+        self.assertEqual(scanner.scan(self.log, PATTERNS)['matches']['traceback'], 0)
+        append(self.log, 'back\n')
+        self.assertEqual(scanner.scan(self.log, PATTERNS)['matches']['traceback'], 1)
+    def test_scan_p04_rotation_rename(self):
+        append(self.log, 'start\n')
+        scanner = self.scanner()
+        scanner.scan(self.log, PATTERNS)
+        append(self.log, 'Traceback before rotate\n')
+        os.rename(self.log, self.log + '.1')
+        append(self.log, 'Traceback after rotate\n')
+        result = scanner.scan(self.log, PATTERNS)
+        self.assertTrue(result['rotated'])
+        self.assertEqual(result['matches']['traceback'], 2)
+    def test_scan_p05_truncated(self):
+        append(self.log, 'start line that is long\n')
+        scanner = self.scanner()
+        scanner.scan(self.log, PATTERNS)
+        with open(self.log, 'w') as f:
+            f.write('Traceback\n')
+        result = scanner.scan(self.log, PATTERNS)
+        self.assertTrue(result['rotated'])
+        self.assertEqual(result['matches']['traceback'], 1)
+    def test_scan_p06_max_bytes(self):
+        append(self.log, 'start\n')
+        scanner = self.scanner(max_bytes=12)
+        scanner.scan(self.log, PATTERNS)
+        append(self.log, 'Traceback\nTraceback\nTraceback\n')
+        counts = [scanner.scan(self.log, PATTERNS)['matches']['traceback'] for _ in range(3)]
+        self.assertEqual(counts, [1, 1, 1])
+    def test_scan_p07_rotation_reads_rest_past_max_bytes(self):
+        append(self.log, 'start\n')
+        scanner = self.scanner(max_bytes=12)
+        scanner.scan(self.log, PATTERNS)
+        append(self.log, 'Traceback\nTraceback\nTraceback\nTraceback')
+        os.rename(self.log, self.log + '.1')
+        append(self.log, 'ok\n')
+        result = scanner.scan(self.log, PATTERNS)
+        self.assertTrue(result['rotated'])
+        self.assertEqual(result['matches']['traceback'], 4)
+        self.assertEqual(result['lines'], 5)
+    def test_scan_f01_missing(self):
+        self.assertEqual(self.scanner().scan(self.log, PATTERNS)['error'], 'missing')
+
+    #def LogScanner.rate(fname, name, window_seconds):
+    def test_rate_p01_window(self):
+        append(self.log, 'start\n')
+        scanner = self.scanner()
+        scanner.scan(self.log, PATTERNS)
+        append(self.log, 'Traceback\nTraceback\n')
+        scanner.scan(self.log, PATTERNS)
+        self.clock.now += 1800
+        append(self.log, 'Traceback\n')
+        scanner.scan(self.log, PATTERNS)
+        self.assertEqual(scanner.rate(self.log, 'traceback', 3600), 3)
+        self.assertEqual(scanner.rate(self.log, 'traceback', 600), 1)
+        self.clock.now += 3600
+        self.assertEqual(scanner.rate(self.log, 'traceback', 3600), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import kvmetrics
+
+import unittest
+
+import os
+import time
+import tempfile
+import unittest.mock
+
+
+# Testing class
+class TestKVmetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    #def MetricsRegistry.render():
+    def test_render_p01_help_type_labels(self):
+        metrics = kvmetrics.MetricsRegistry('app_')
+        metrics.gauge('temp', 81.5, {'body': 'pool'}, 'temperature')
+        metrics.gauge('temp', 100, {'body': 'spa'})
+        metrics.gauge('ok', True)
+        metrics.gauge('missing', None, {'file': 'C:\\dir\\"x".csv'})
+        self.assertEqual(metrics.render().splitlines(), [
+            '# HELP app_temp temperature',
+            '# TYPE app_temp gauge',
+            'app_temp{body="pool"} 81.5',
+            'app_temp{body="spa"} 100',
+            '# TYPE app_ok gauge',
+            'app_ok 1',
+            '# TYPE app_missing gauge',
+            'app_missing{file="C:\\\\dir\\\\\\"x\\".csv"} NaN',
+        ])
+
+    #def MetricsRegistry.stage(name):
+    def test_stage_p01_accumulates(self):
+        metrics = kvmetrics.MetricsRegistry()
+        for _ in range(2):
+            with metrics.stage('parse'):
+                time.sleep(0.01)
+        line = [x for x in metrics.render().splitlines() if x.startswith('stage_duration_seconds{stage="parse"}')][0]
+        self.assertGreaterEqual(float(line.split()[-1]), 0.02)
+    def test_stage_p02_recorded_on_exception(self):
+        metrics = kvmetrics.MetricsRegistry()
+        with self.assertRaises(ValueError):
+            with metrics.stage('bad'):
+                raise ValueError('boom')
+        self.assertIn('stage_duration_seconds{stage="bad"}', metrics.render())
+
+    #def MetricsRegistry.histogram(name, histogram, labels=None, help=None):
+    def test_histogram_p01_cumulative_buckets(self):
+        histogram = kvmetrics.Histogram((0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+        metrics = kvmetrics.MetricsRegistry('app_')
+        metrics.histogram('seconds', histogram, {'task': 'pool'}, 'run seconds')
+        self.assertEqual(metrics.render().splitlines(), [
+            '# HELP app_seconds run seconds',
+            '# TYPE app_seconds histogram',
+            'app_seconds_bucket{task="pool",le="0.1"} 2',
+            'app_seconds_bucket{task="pool",le="1"} 3',
+            'app_seconds_bucket{task="pool",le="+Inf"} 4',
+            'app_seconds_sum{task="pool"} 3.65',
+            'app_seconds_count{task="pool"} 4',
+        ])
+
+    #def write_textfile(filename, text):
+    def test_write_p01_atomic_replace(self):
+        fname = os.path.join(self.tmp, 'app.prom')
+        metrics = kvmetrics.MetricsRegistry('app_')
+        metrics.gauge('temp', 1)
+        metrics.write(fname)
+        with open(fname) as f:
+            text = f.read()
+        self.assertIn('app_temp 1', text)
+        self.assertIn('app_last_run_timestamp_seconds', text)
+        self.assertEqual(os.listdir(self.tmp), ['app.prom'])
+    def test_write_textfile_p01_world_readable(self):
+        fname = os.path.join(self.tmp, 'app.prom')
+        old_umask = os.umask(0o077)
+        try:
+            kvmetrics.write_textfile(fname, 'x 1\n')
+        finally:
+            os.umask(old_umask)
+        self.assertEqual(os.stat(fname).st_mode & 0o777, 0o644)
+    def test_write_textfile_f01_failure_keeps_old_file(self):
+        fname = os.path.join(self.tmp, 'app.prom')
+        kvmetrics.write_textfile(fname, 'old\n')
+        with unittest.mock.patch.object(kvmetrics.kvutil.os, 'replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                kvmetrics.write_textfile(fname, 'new\n')
+        with open(fname) as f:
+            self.assertEqual(f.read(), 'old\n')
+        self.assertEqual(os.listdir(self.tmp), ['app.prom'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import kvutil
+
+import kvnotifier
+import kvratelimit
+import kvsmtpserver
+
+import unittest
+import unittest.mock
+
+import json
+import socket
+
+
+# create a filename
+filename = kvutil.filename_unique( { 'base_filename' : 't_kvnotifiertest', 'file_ext' : '.txt', 'uniqtype' : 'datecnt', 'overwrite' : True, 'forceuniq' : True } )
+state_filename = kvutil.filename_unique( { 'base_filename' : 't_kvnotifierstate', 'file_ext' : '.json', 'uniqtype' : 'datecnt', 'overwrite' : True, 'forceuniq' : True } )
+
+
+# clock we move forward by hand
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+    def __call__(self):
+        return self.now
+
+
+def rate_limited_notifier(clock, capacity=2, refill_seconds=60):
+    limiter = kvratelimit.AudienceRateLimiter(state_filename, capacity, refill_seconds, clock=clock)
+    return kvnotifier.RateLimitedNotifier(kvnotifier.FileNotifier(filename), limiter)
+
+
+def sent_subjects():
+    return [json.loads(x)['email_subject'] for x in kvutil.read_list_from_file_lines(filename)]
+
+
+# Testing class
+class TestKVnotifier(unittest.TestCase):
+    # executed on each test
+    def setUp(self):
+        kvutil.remove_filename(filename,kvutil.functionName(2), debug=False)
+        kvutil.remove_filename(state_filename,kvutil.functionName(2), debug=False)
+
+    def tearDown(self):
+        kvnotifier.close_notifiers()
+        kvutil.remove_filename(filename,kvutil.functionName(2), debug=False)
+        kvutil.remove_filename(state_filename,kvutil.functionName(2), debug=False)
+
+    # executed at the end of all tests - cleans up the environment
+    @classmethod
+    def tearDownClass(cls):
+        kvutil.remove_filename(filename,kvutil.functionName(), debug=False)
+        kvutil.remove_filename(state_filename,kvutil.functionName(), debug=False)
+
+    @classmethod
+    def setUpClass(cls):
+        kvutil.remove_filename(filename,kvutil.functionName(), debug=False)
+        kvutil.remove_filename(state_filename,kvutil.functionName(), debug=False)
+
+    #class Notifier
+    def test_notifier_f01_send_required(self):
+        class NoSend(kvnotifier.Notifier):
+            backend = 'nosend'
+        with self.assertRaises(TypeError):
+            NoSend()
+
+    #def FileNotifier.send(...)
+    def test_filenotifier_send_p01_simple(self):
+        notifier = kvnotifier.FileNotifier(filename)
+        msgid = notifier.send('from@example.com', 'to@example.com', 'subject', 'body')
+        msgid2 = notifier.send('from@example.com', 'to@example.com', 'subject2', 'body2')
+        self.assertTrue(msgid['id'])
+        self.assertNotEqual(msgid['id'], msgid2['id'])
+        recs = [json.loads(x) for x in kvutil.read_list_from_file_lines(filename)]
+        self.assertEqual(len(recs), 2)
+        self.assertEqual(recs[0]['id'], msgid['id'])
+        self.assertEqual(recs[1]['email_subject'], 'subject2')
+
+    #def send_stats():
+    def test_send_stats_p01_counts_sends(self):
+        before = kvnotifier.send_stats().get('file', {'count': 0, 'errors': 0})
+        notifier = kvnotifier.FileNotifier(filename)
+        notifier.send('from@example.com', 'to@example.com', 'subject', 'body')
+        bad = kvnotifier.FileNotifier('/nonexistent-dir/messages.txt')
+        with self.assertRaises(OSError):
+            bad.send('from@example.com', 'to@example.com', 'subject', 'body')
+        after = kvnotifier.send_stats()['file']
+        self.assertEqual(after['count'] - before['count'], 2)
+        self.assertEqual(after['errors'] - before['errors'], 1)
+        self.assertGreaterEqual(after['max_seconds'], 0.0)
+
+    #def SMTPNotifier.send(...)
+    def test_smtpnotifier_send_p01_connection_reuse(self):
+        with kvsmtpserver.LocalSMTPServer() as server:
+            notifier = kvnotifier.SMTPNotifier(server.host, server.port)
+            for cnt in range(5):
+                notifier.send('from@example.com', 'a@example.com, b@example.com', 'subject ' + str(cnt), 'body')
+            notifier.close()
+        self.assertEqual(len(server.messages), 5)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(server.messages[0]['rcpt_tos'], ['<a@example.com>', '<b@example.com>'])
+        self.assertIn('Subject: subject 4', server.messages[4]['data'])
+    def test_smtpnotifier_send_f01_server_unreachable(self):
+        # a port nothing listens on
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        before = kvnotifier.send_stats().get('smtp', {'errors': 0})['errors']
+        notifier = kvnotifier.SMTPNotifier('127.0.0.1', port, timeout=5)
+        msgid = notifier.send('from@example.com', 'to@example.com', 'subject', 'body')
+        self.assertIsNone(msgid)
+        self.assertIsNone(kvnotifier.message_id(msgid))
+        self.assertEqual(kvnotifier.send_stats()['smtp']['errors'], before + 1)
+        notifier.close()
+    def test_smtpnotifier_send_many_p01_simple(self):
+        messages = [{'email_from': 'from@example.com', 'email_to': 'to@example.com', 'email_subject': 's' + str(cnt), 'email_body': 'b'}
+                    for cnt in range(3)]
+        with kvsmtpserver.LocalSMTPServer() as server:
+            notifier = kvnotifier.SMTPNotifier(server.host, server.port)
+            results = notifier.send_many(messages)
+            notifier.close()
+        self.assertEqual(len(server.messages), 3)
+        self.assertTrue(all(x['id'] and x['error'] is None for x in results))
+
+    #def RateLimitedNotifier.send(...)
+    def test_ratelimitednotifier_send_p01_storm_suppressed(self):
+        clock = FakeClock()
+        notifier = rate_limited_notifier(clock)
+        results = [notifier.send('from@example.com', 'to@example.com', 'alert ' + str(cnt), 'body') for cnt in range(5)]
+        self.assertTrue(results[0]['id'] and results[1]['id'])
+        self.assertTrue(all(x['suppressed'] for x in results[2:]))
+        self.assertEqual(sent_subjects(), ['alert 0', 'alert 1'])
+    def test_ratelimitednotifier_send_p02_summary_after_refill(self):
+        clock = FakeClock()
+        notifier = rate_limited_notifier(clock)
+        for cnt in range(4):
+            notifier.send('from@example.com', 'to@example.com', 'alert ' + str(cnt), 'body')
+        # one token back - summary goes out on flush
+        clock.now += 60
+        notifier.flush()
+        subjects = sent_subjects()
+        self.assertEqual(len(subjects), 3)
+        self.assertIn('2 message(s) suppressed', subjects[2])
+        # nothing left to summarize
+        clock.now += 600
+        notifier.flush()
+        self.assertEqual(len(sent_subjects()), 3)
+    def test_ratelimitednotifier_send_p03_state_persisted(self):
+        clock = FakeClock()
+        notifier = rate_limited_notifier(clock)
+        for cnt in range(3):
+            notifier.send('from@example.com', 'to@example.com', 'alert ' + str(cnt), 'body')
+        # a new run reads the bucket state back from disk
+        notifier = rate_limited_notifier(clock)
+        self.assertTrue(notifier.send('from@example.com', 'to@example.com', 'alert 3', 'body')['suppressed'])
+        self.assertEqual(len(notifier.limiter.suppressed('to@example.com')), 2)
+    def test_ratelimitednotifier_send_p04_audiences_independent(self):
+        clock = FakeClock()
+        notifier = rate_limited_notifier(clock, capacity=1)
+        self.assertTrue(notifier.send('from@example.com', 'a@example.com, b@example.com', 'pool', 'body')['id'])
+        self.assertTrue(notifier.send('from@example.com', 'spa@example.com', 'spa', 'body')['id'])
+        # same recipient list in a different order is the same audience
+        self.assertTrue(notifier.send('from@example.com', 'B@example.com,a@example.com', 'pool', 'body')['suppressed'])
+
+    def test_ratelimitednotifier_send_f01_failed_summary_kept(self):
+        clock = FakeClock()
+        notifier = rate_limited_notifier(clock)
+        for cnt in range(4):
+            notifier.send('from@example.com', 'to@example.com', 'alert ' + str(cnt), 'body')
+        clock.now += 60
+        # the backend fails - the suppressed messages and the token are kept
+        with unittest.mock.patch.object(notifier.notifier, 'send', return_value=None):
+            notifier.flush()
+        with unittest.mock.patch.object(notifier.notifier, 'send', side_effect=OSError('down')):
+            notifier.flush()
+        self.assertEqual(len(notifier.limiter.suppressed('to@example.com')), 2)
+        self.assertEqual(notifier.limiter.tokens('to@example.com'), 1.0)
+        notifier.flush()
+        self.assertIn('2 message(s) suppressed', sent_subjects()[2])
+        self.assertEqual(notifier.limiter.suppressed('to@example.com'), [])
+
+    #def RateLimitedNotifier.send_now(...)
+    def test_ratelimitednotifier_send_now_p01_not_held_back(self):
+        clock = FakeClock()
+        notifier = rate_limited_notifier(clock, capacity=1)
+        notifier.send('from@example.com', 'to@example.com', 'alert', 'body')
+        self.assertTrue(notifier.send('from@example.com', 'to@example.com', 'alert 2', 'body')['suppressed'])
+        self.assertTrue(notifier.send_now('from@example.com', 'to@example.com', 'Being Turned OFF', 'body')['id'])
+        self.assertEqual(sent_subjects(), ['alert', 'Being Turned OFF'])
+
+    #def notifier_from_optiondict(optiondict):
+    def test_notifier_from_optiondict_p01_file(self):
+        optiondict = {'notify_backend': 'file', 'notify_filename': filename}
+        notifier = kvnotifier.notifier_from_optiondict(optiondict)
+        self.assertIsInstance(notifier, kvnotifier.FileNotifier)
+        self.assertIs(notifier, kvnotifier.notifier_from_optiondict(dict(optiondict)))
+    def test_notifier_from_optiondict_p02_default_gmail(self):
+        notifier = kvnotifier.notifier_from_optiondict({'scopes': None, 'file_token_json': None, 'file_credentials_json': None})
+        self.assertIsInstance(notifier, kvnotifier.GmailNotifier)
+    def test_notifier_from_optiondict_p03_smtp(self):
+        notifier = kvnotifier.notifier_from_optiondict({'notify_backend': 'smtp', 'smtp_host': 'mail.example.com', 'smtp_port': 2525})
+        self.assertIsInstance(notifier, kvnotifier.SMTPNotifier)
+        self.assertEqual(notifier.port, 2525)
+    def test_notifier_from_optiondict_p04_rate_limited(self):
+        notifier = kvnotifier.notifier_from_optiondict({'notify_backend': 'file', 'notify_filename': filename,
+                                                        'notify_rate_filename': state_filename})
+        self.assertIsInstance(notifier, kvnotifier.RateLimitedNotifier)
+        self.assertIsInstance(notifier.notifier, kvnotifier.FileNotifier)
+    def test_notifier_from_optiondict_f01_unknown(self):
+        with self.assertRaises(Exception):
+            kvnotifier.notifier_from_optiondict({'notify_backend': 'pigeon'})
+    def test_notifier_from_optiondict_f02_file_no_filename(self):
+        with self.assertRaises(Exception):
+            kvnotifier.notifier_from_optiondict({'notify_backend': 'file', 'notify_filename': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import kvschedule
+import kvmetrics
+
+import unittest
+
+import os
+import tempfile
+
+
+class FakeClock:
+    '''
+    clock advanced by sleep() and by the tasks run
+    '''
+    def __init__(self, now=1000.0):
+        self.now = now
+    def __call__(self):
+        return self.now
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+# Testing class
+class TestKVschedule(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmpdir.name
+        self.clock = FakeClock()
+        self.ran = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def task(self, name, interval, seconds=0.0, jitter=0, fail=False, run_at_start=True):
+        def func():
+            self.ran.append((name, self.clock.now))
+            self.clock.now += seconds
+            if fail:
+                raise ValueError('boom')
+        return kvschedule.Task(name, func, interval, jitter, run_at_start)
+
+    def scheduler(self, tasks, rand=None):
+        return kvschedule.Scheduler(tasks, clock=self.clock, sleep=self.clock.sleep, rand=rand or (lambda low, high: high))
+
+    #def Scheduler.run(max_runs=None):
+    def test_run_p01_own_cadence(self):
+        scheduler = self.scheduler([self.task('fast', 10), self.task('slow', 25, run_at_start=False)])
+        scheduler.run(max_runs=6)
+        self.assertEqual(self.ran, [('fast', 1000), ('fast', 1010), ('fast', 1020), ('slow', 1025), ('fast', 1030), ('fast', 1040)])
+    def test_run_p02_jitter_does_not_move_cadence(self):
+        scheduler = self.scheduler([self.task('pool', 10, jitter=3)])
+        scheduler.run(max_runs=3)
+        self.assertEqual(self.ran, [('pool', 1003), ('pool', 1013), ('pool', 1023)])
+    def test_run_p03_overrun_skips(self):
+        slow = self.task('slow', 10, seconds=25)
+        scheduler = self.scheduler([slow])
+        scheduler.run(max_runs=2)
+        # the runs due at 1010 and 1020 were missed - next on the cadence is 1030
+        self.assertEqual(self.ran, [('slow', 1000), ('slow', 1030)])
+        self.assertEqual(slow.skipped, 4)
+        self.assertEqual(slow.durations.count, 2)
+        self.assertEqual(slow.last_seconds, 25)
+    def test_run_p04_no_overlap_between_tasks(self):
+        scheduler = self.scheduler([self.task('a', 10, seconds=6), self.task('b', 10, seconds=6)])
+        scheduler.run(max_runs=3)
+        # b waits for a to finish
+        self.assertEqual(self.ran, [('a', 1000), ('b', 1006), ('a', 1012)])
+    def test_run_f01_error_counted(self):
+        bad = self.task('bad', 10, fail=True)
+        scheduler = self.scheduler([bad])
+        scheduler.run(max_runs=2)
+        self.assertEqual((bad.runs, bad.errors), (2, 2))
+    def test_run_f02_stop(self):
+        calls = []
+        scheduler = self.scheduler([self.task('a', 10)])
+        scheduler.on_run = lambda s, t: (calls.append(t.name), s.stop())
+        scheduler.run()
+        self.assertEqual(calls, ['a'])
+
+    #def Task(name, func, interval_seconds, ...):
+    def test_task_f01_interval(self):
+        with self.assertRaises(Exception):
+            kvschedule.Task('bad', lambda: None, 0)
+
+    #def Scheduler.add_metrics(metrics):
+    def test_add_metrics_p01_histogram(self):
+        scheduler = self.scheduler([self.task('pool', 10, seconds=0.3)])
+        scheduler.run(max_runs=2)
+        metrics = kvmetrics.MetricsRegistry('app_')
+        scheduler.add_metrics(metrics)
+        lines = metrics.render().splitlines()
+        self.assertIn('app_task_runs{task="pool"} 2', lines)
+        self.assertIn('app_task_duration_seconds_bucket{task="pool",le="0.25"} 0', lines)
+        self.assertIn('app_task_duration_seconds_bucket{task="pool",le="0.5"} 2', lines)
+        self.assertIn('app_task_duration_seconds_count{task="pool"} 2', lines)
+
+    #def instance_lock(filename):
+    def test_instance_lock_f01_held(self):
+        fname = os.path.join(self.tmp, 'sched.lck')
+        fd = kvschedule.instance_lock(fname)
+        if fd is None:
+            self.skipTest('no fcntl')
+        try:
+            with self.assertRaises(Exception):
+                kvschedule.instance_lock(fname)
+        finally:
+            os.close(fd)
+        os.close(kvschedule.instance_lock(fname))
+
+if __name__ == '__main__':
+    unittest.main()
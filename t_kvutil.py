@@ -0,0 +1,375 @@
+import kvutil
+
+import unittest
+import unittest.mock
+
+import os
+import sys
+import json
+import time
+import datetime
+import tempfile
+
+
+def write_file(fname, text='data\n'):
+    with open(fname, 'w') as f:
+        f.write(text)
+
+
+# Testing class
+class TestKVutil(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    #def scandir_index(dirpath, use_cache=True):
+    def test_scandir_index_p01_cached_until_dir_changes(self):
+        write_file(os.path.join(self.tmp, 'a.txt'))
+        first = kvutil.scandir_index(self.tmp)
+        self.assertEqual(first, [('a.txt', True)])
+        self.assertIs(kvutil.scandir_index(self.tmp), first)
+        # adding a file changes the directory mtime - force a visible change on coarse clocks
+        write_file(os.path.join(self.tmp, 'b.txt'))
+        mtime = time.time() + 5
+        os.utime(self.tmp, (mtime, mtime))
+        self.assertEqual(sorted(kvutil.scandir_index(self.tmp)), [('a.txt', True), ('b.txt', True)])
+    def test_scandir_index_p02_change_inside_mtime_granularity(self):
+        write_file(os.path.join(self.tmp, 'a.txt'))
+        mtime_ns = os.stat(self.tmp).st_mtime_ns
+        kvutil.scandir_index(self.tmp)
+        # a file added with the directory mtime left where it was - the ctime still moves
+        write_file(os.path.join(self.tmp, 'b.txt'))
+        os.utime(self.tmp, ns=(mtime_ns, mtime_ns))
+        self.assertEqual(sorted(kvutil.scandir_index(self.tmp)), [('a.txt', True), ('b.txt', True)])
+    def test_scandir_index_p03_cache_bounded(self):
+        with unittest.mock.patch.object(kvutil, 'SCANDIR_INDEX_CACHE_SIZE', 2), \
+                unittest.mock.patch.object(kvutil, '_scandir_index_cache', {}):
+            dirs = [os.path.join(self.tmp, name) for name in ('a', 'b', 'c')]
+            for d in dirs:
+                os.mkdir(d)
+                kvutil.scandir_index(d)
+            self.assertEqual(list(kvutil._scandir_index_cache), dirs[1:])
+    def test_scandir_index_f01_missing_dir(self):
+        with self.assertRaises(OSError):
+            kvutil.scandir_index(os.path.join(self.tmp, 'missing'))
+
+    #def filename_glob(file_glob, files_only=False, use_cache=False):
+    def test_filename_glob_p01_matches_glob(self):
+        for name in ('a.csv', 'b.csv', 'c.txt', '.hidden.csv'):
+            write_file(os.path.join(self.tmp, name))
+        os.mkdir(os.path.join(self.tmp, 'd.csv'))
+        pattern = os.path.join(self.tmp, '*.csv')
+        self.assertEqual(sorted(kvutil.filename_glob(pattern)), sorted(kvutil.glob.glob(pattern)))
+        self.assertEqual(sorted(os.path.basename(x) for x in kvutil.filename_glob(pattern, files_only=True)), ['a.csv', 'b.csv'])
+        self.assertEqual([os.path.basename(x) for x in kvutil.filename_glob(os.path.join(self.tmp, '.*.csv'))], ['.hidden.csv'])
+    def test_filename_glob_p02_no_magic(self):
+        write_file(os.path.join(self.tmp, 'a.csv'))
+        self.assertEqual(kvutil.filename_glob(os.path.join(self.tmp, 'a.csv')), [os.path.join(self.tmp, 'a.csv')])
+    def test_filename_glob_p03_missing_dir(self):
+        self.assertEqual(kvutil.filename_glob(os.path.join(self.tmp, 'missing', '*.csv')), [])
+
+
+    #def read_last_line(filename, encoding='utf-8', blocksize=4096):
+    def test_read_last_line_p01_reads_across_blocks(self):
+        fname = os.path.join(self.tmp, 'a.csv')
+        write_file(fname, 'header\n' + 'x' * 100 + '\n' + 'last,line\r\n\n')
+        self.assertEqual(kvutil.read_last_line(fname, blocksize=8), 'last,line')
+        self.assertEqual(kvutil.read_last_line(fname), 'last,line')
+    def test_read_last_line_p02_single_line_and_empty(self):
+        fname = os.path.join(self.tmp, 'a.csv')
+        write_file(fname, 'only')
+        self.assertEqual(kvutil.read_last_line(fname, blocksize=3), 'only')
+        write_file(fname, '')
+        self.assertEqual(kvutil.read_last_line(fname), '')
+
+    #def scriptinfo():
+    def test_scriptinfo_p01_memoized(self):
+        kvutil._scriptinfo_cache = None
+        info = kvutil.scriptinfo()
+        self.assertEqual(set(info), {'name', 'source', 'dir'})
+        self.assertTrue(info['name'].endswith('.py'))
+        # the caller can not change the saved answer
+        info['name'] = 'changed'
+        self.assertNotEqual(kvutil.scriptinfo()['name'], 'changed')
+    def test_scriptinfo_p02_frozen(self):
+        kvutil._scriptinfo_cache = None
+        sys.frozen = True
+        try:
+            info = kvutil.scriptinfo()
+        finally:
+            del sys.frozen
+            kvutil._scriptinfo_cache = None
+        self.assertEqual(info['name'], os.path.basename(sys.executable))
+        self.assertEqual(info['dir'], os.path.dirname(sys.executable))
+
+    #def str2bool(value):
+    def test_str2bool_p01_values(self):
+        for value in ('y', 'Yes', 'TRUE', 'on', '1', 't'):
+            self.assertIs(kvutil.str2bool(value), True)
+        for value in ('n', 'No', 'false', 'OFF', '0', 'f'):
+            self.assertIs(kvutil.str2bool(value), False)
+    def test_str2bool_f01_invalid(self):
+        with self.assertRaises(ValueError):
+            kvutil.str2bool('maybe')
+
+    #def kv_parse_command_line(optiondictconfig, raise_error=False, keymapdict=None, debug=False, cache_filename=None):
+    def parse_cached(self, argv, conf_json):
+        optiondictconfig = {
+            'AppVersion': {'value': '1.00'},
+            'conf_json': {'value': [conf_json], 'type': 'liststr'},
+            'count': {'value': 1, 'type': 'int'},
+            'flag': {'value': False, 'type': 'bool'},
+        }
+        save_argv = sys.argv
+        sys.argv = ['prog'] + argv
+        try:
+            return kvutil.kv_parse_command_line(optiondictconfig, cache_filename=os.path.join(self.tmp, 'options.cache')), optiondictconfig
+        finally:
+            sys.argv = save_argv
+    def test_kv_parse_command_line_p01_cache(self):
+        conf_json = os.path.join(self.tmp, 'conf.json')
+        write_file(conf_json, '{"count": "5"}')
+        optiondict, _ = self.parse_cached(['flag=yes'], conf_json)
+        self.assertEqual((optiondict['count'], optiondict['flag']), (5, True))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, 'options.cache')))
+        # same inputs - the options come from the cache without reading the config
+        with unittest.mock.patch('kvutil.json.load') as json_load:
+            cached, _ = self.parse_cached(['flag=yes'], conf_json)
+            json_load.assert_not_called()
+        self.assertEqual(cached, optiondict)
+        # a changed command line or config file is parsed again
+        changed, optiondictconfig = self.parse_cached(['flag=no', 'debug=1'], conf_json)
+        self.assertEqual((changed['count'], changed['flag'], changed['debug']), (5, False, True))
+        self.assertIn('debug', optiondictconfig)
+        write_file(conf_json, '{"count": "70"}')
+        self.assertEqual(self.parse_cached(['flag=no', 'debug=1'], conf_json)[0]['count'], 70)
+        # the default options used are added to optiondictconfig on a cache hit too
+        cached, optiondictconfig = self.parse_cached(['flag=no', 'debug=1'], conf_json)
+        self.assertEqual(cached['count'], 70)
+        self.assertIn('debug', optiondictconfig)
+
+    def test_kv_parse_command_line_p02_cache_json_same_config_object(self):
+        cache_filename = os.path.join(self.tmp, 'options.cache')
+        optiondictconfig = {
+            'AppVersion': {'value': '1.00'},
+            'start': {'value': None, 'type': 'date'},
+        }
+        save_argv = sys.argv
+        sys.argv = ['prog', 'start=2024-02-07', 'debug=1']
+        try:
+            optiondict = kvutil.kv_parse_command_line(optiondictconfig, cache_filename=cache_filename)
+            # the cache is json - no code runs when it is loaded
+            with open(cache_filename) as t:
+                self.assertEqual(json.load(t)['optiondict']['start'], {'__datetime__': '2024-02-07T00:00:00'})
+            self.assertEqual(os.stat(cache_filename).st_mode & 0o777, 0o600)
+            # the defaults the first parse added to optiondictconfig do not change the key
+            with unittest.mock.patch('kvutil._kv_parse_cache_save') as cache_save:
+                cached = kvutil.kv_parse_command_line(optiondictconfig, cache_filename=cache_filename)
+                cache_save.assert_not_called()
+        finally:
+            sys.argv = save_argv
+        self.assertEqual(cached, optiondict)
+        self.assertEqual(cached['start'], datetime.datetime(2024, 2, 7))
+    def test_kv_parse_command_line_f01_cache_not_json(self):
+        cache_filename = os.path.join(self.tmp, 'options.cache')
+        # an old pickle cache (or anything else) is ignored and replaced
+        with open(cache_filename, 'wb') as t:
+            t.write(b'\x80\x04garbage')
+        optiondict, _ = self.parse_cached(['flag=yes'], os.path.join(self.tmp, 'none.json'))
+        self.assertTrue(optiondict['flag'])
+        with open(cache_filename) as t:
+            self.assertTrue(json.load(t)['optiondict']['flag'])
+
+    #def create_flat_key_lookup(src_data, fldlist, copy_fields=None, record_fields=None):
+    def lookup_data(self):
+        src = [{'a': 1, 'b': 'x', 'v': 10, 'w': 'p'}, {'a': 1, 'b': 'y', 'v': 11, 'w': 'q'},
+               {'a': 2, 'b': 'x', 'v': 12, 'w': 'r'}, {'a': 2, 'b': 'x', 'v': 13, 'w': 's'}]
+        dst = [{'a': 1, 'b': 'y', 'v': None, 'w': None}, {'a': 2, 'b': 'x', 'v': None, 'w': None},
+               {'a': 3, 'b': 'x', 'v': None, 'w': None}]
+        return src, dst
+    def test_create_flat_key_lookup_p01_same_as_nested(self):
+        src, dst = self.lookup_data()
+        expected = [dict(x) for x in dst]
+        nested_matched = kvutil.copy_matched_data(expected, kvutil.create_multi_key_lookup(src, ['a', 'b']), ['a', 'b'], ['v', 'w'])
+        for record_fields in (None, ['v', 'w']):
+            lookup = kvutil.create_flat_key_lookup(src, ['a', 'b'], record_fields=record_fields)
+            self.assertEqual(len(lookup), 3)
+            result = [dict(x) for x in dst]
+            self.assertEqual(kvutil.copy_matched_data(result, lookup, ['a', 'b'], ['v', 'w']), nested_matched)
+            self.assertEqual(result, expected)
+            self.assertEqual(kvutil.extract_unmatched_data(result, lookup, ['a', 'b']), [result[2]])
+        self.assertEqual(lookup.record((2, 'x')), {'v': 13, 'w': 's'})
+        self.assertIsNone(lookup.record((9, 'x')))
+    def test_create_flat_key_lookup_p02_single_key_first_wins(self):
+        src, dst = self.lookup_data()
+        lookup = kvutil.create_flat_key_lookup(src, ['a'], copy_fields=['v'])
+        self.assertEqual(lookup[(1,)], src[0])
+        self.assertEqual(kvutil.create_multi_key_lookup(src, ['a'])[1], src[0])
+    def test_create_flat_key_lookup_f01_copy_field_not_stored(self):
+        src, dst = self.lookup_data()
+        lookup = kvutil.create_flat_key_lookup(src, ['a', 'b'], record_fields=['v'])
+        with self.assertRaises(Exception):
+            kvutil.copy_matched_data(dst, lookup, ['a', 'b'], ['w'])
+
+    #def hash_join(probe_data, build_data, key_fields, how='inner', copy_fields=None, probe_keys=None, record_fields=None):
+    def test_hash_join_p01_inner_anti_update(self):
+        src, dst = self.lookup_data()
+        rows, stats = kvutil.hash_join(iter(dst), src, ['a', 'b'])
+        self.assertEqual([(rec['a'], value['v']) for rec, value in rows], [(1, 11), (2, 13)])
+        self.assertEqual((stats['matched'], stats['unmatched'], stats['build_duplicates']), (2, 1, 1))
+        rows, stats = kvutil.hash_join(iter(dst), src, ['a', 'b'], how='anti')
+        self.assertEqual(list(rows), [dst[2]])
+        # same result as the lookup helpers
+        expected = [dict(x) for x in dst]
+        kvutil.copy_matched_data(expected, kvutil.create_multi_key_lookup(src, ['a', 'b']), ['a', 'b'], ['v', 'w'])
+        rows, stats = kvutil.hash_join((dict(x) for x in dst), src, ['a', 'b'], how='update', copy_fields=['v', 'w'])
+        self.assertEqual(list(rows), expected)
+        self.assertEqual((stats['probe_records'], stats['matched']), (3, 2))
+    def test_hash_join_p02_probe_keys_and_missing_key(self):
+        src, dst = self.lookup_data()
+        probe = [{'id': 1, 'sub': 'x'}, {'id': 5}]
+        rows, stats = kvutil.hash_join(probe, src, ['a', 'b'], how='anti', probe_keys=['id', 'sub'])
+        # a probe record without the key fields can not match
+        self.assertEqual(list(rows), [probe[1]])
+        self.assertEqual((stats['matched'], stats['probe_missing_key']), (1, 1))
+    def test_hash_join_f01_bad_how(self):
+        with self.assertRaises(Exception):
+            kvutil.hash_join([], [], ['a'], how='outer')
+        with self.assertRaises(Exception):
+            kvutil.hash_join([], [], ['a'], how='update')
+
+    #def filename_unique(filename=None, filename_href=None, debug=False):
+    def unique(self, **kwargs):
+        options = {'base_filename': 'run', 'file_ext': '.txt', 'file_path': self.tmp + os.sep}
+        options.update(kwargs)
+        return os.path.basename(kvutil.filename_unique(options))
+    def test_filename_unique_p01_first_free_name(self):
+        self.assertEqual(self.unique(), 'run.txt')
+        for name in ('run.txt', 'runv01.txt', 'runv03.txt'):
+            write_file(os.path.join(self.tmp, name))
+        # the first free counter - gaps are reused like the original probe loop
+        self.assertEqual(self.unique(), 'runv02.txt')
+        self.assertEqual(self.unique(forceuniq=True), 'runv02.txt')
+        self.assertEqual(self.unique(overwrite=True), 'run.txt')
+    def test_filename_unique_p02_claim(self):
+        first = self.unique(claim=True, forceuniq=True)
+        second = self.unique(claim=True, forceuniq=True)
+        self.assertEqual((first, second), ('runv01.txt', 'runv02.txt'))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, first)))
+    def test_filename_unique_f01_max_count(self):
+        for cnt in range(1, 4):
+            write_file(os.path.join(self.tmp, 'runv{:02d}.txt'.format(cnt)))
+        with self.assertRaises(Exception):
+            self.unique(forceuniq=True, maxcnt=5)
+        self.assertEqual(self.unique(forceuniq=True, maxcnt=6), 'runv04.txt')
+
+    #def iter_file_lines(filename, stripblank=False, trim=False, encoding=None):
+    #def iter_mmap_lines(filename, reverse=False, stripblank=False, trim=False, encoding='utf-8'):
+    def test_iter_file_lines_p01_same_as_list(self):
+        fname = os.path.join(self.tmp, 'a.txt')
+        write_file(fname, 'one\n  two  \n\n   \nthree\r\nfour')
+        for stripblank in (False, True):
+            for trim in (False, True):
+                expected = kvutil.read_list_from_file_lines(fname, stripblank=stripblank, trim=trim)
+                self.assertEqual(list(kvutil.iter_file_lines(fname, stripblank=stripblank, trim=trim)), expected)
+                self.assertEqual(list(kvutil.iter_mmap_lines(fname, stripblank=stripblank, trim=trim)), expected)
+                self.assertEqual(list(kvutil.iter_mmap_lines(fname, reverse=True, stripblank=stripblank, trim=trim)), expected[::-1])
+        self.assertEqual(kvutil.read_list_from_file_lines(fname, stripblank=True, trim=True), ['one', 'two', 'three', 'four'])
+    def test_iter_mmap_lines_p02_line_endings(self):
+        fname = os.path.join(self.tmp, 'a.txt')
+        write_file(fname, 'a\nb\n')
+        self.assertEqual(list(kvutil.iter_mmap_lines(fname, reverse=True)), ['b', 'a'])
+        self.assertEqual(list(kvutil.iter_mmap_lines(fname)), ['a', 'b'])
+        write_file(fname, '\n')
+        self.assertEqual(list(kvutil.iter_mmap_lines(fname, reverse=True)), [''])
+        write_file(fname, '')
+        self.assertEqual(list(kvutil.iter_mmap_lines(fname, reverse=True)), [])
+        self.assertEqual(list(kvutil.iter_file_lines(fname)), [])
+
+    #def filename_list(filename=None, filenamelist=None, fileglob=None, strippath=False, includelist_filename=None,
+    #                  excludefilenamelist=None, excludelist_filename=None, glob_filename=None, use_cache=False):
+    def test_filename_list_p01_globs_and_excludes(self):
+        for name in ('a.csv', 'b.csv', 'c.txt'):
+            write_file(os.path.join(self.tmp, name))
+        include = os.path.join(self.tmp, 'include.lst')
+        write_file(include, os.path.join(self.tmp, 'c.txt') + '\n')
+        result = kvutil.filename_list(fileglob=os.path.join(self.tmp, '*.csv'), includelist_filename=include,
+                                      filenamelist=[os.path.join(self.tmp, 'a.csv')],
+                                      excludefilenamelist=[os.path.join(self.tmp, 'a.csv')], strippath=True)
+        # excluded even though it was listed twice
+        self.assertEqual(result, ['b.csv', 'c.txt'])
+    def test_filename_list_p02_glob_filename_string(self):
+        for name in ('a.csv', 'b.csv'):
+            write_file(os.path.join(self.tmp, name))
+        # a single glob string used to append the list of matches (unhashable)
+        self.assertEqual(kvutil.filename_list(filename=os.path.join(self.tmp, '*.csv'), glob_filename=True, strippath=True),
+                         ['a.csv', 'b.csv'])
+
+    #def filename_maxmin(file_glob, reverse=False, by='name', use_cache=False):
+    def test_filename_maxmin_p01_name_and_mtime(self):
+        for idx, name in enumerate(('b.csv', 'a.csv', 'c.csv')):
+            fname = os.path.join(self.tmp, name)
+            write_file(fname)
+            os.utime(fname, (1000 + idx, 1000 + idx))
+        pattern = os.path.join(self.tmp, '*.csv')
+        self.assertEqual(os.path.basename(kvutil.filename_maxmin(pattern)), 'a.csv')
+        self.assertEqual(os.path.basename(kvutil.filename_maxmin(pattern, reverse=True)), 'c.csv')
+        self.assertEqual(os.path.basename(kvutil.filename_maxmin(pattern, by='mtime')), 'b.csv')
+        self.assertEqual(os.path.basename(kvutil.filename_maxmin(pattern, reverse=True, by='mtime', use_cache=True)), 'c.csv')
+        self.assertIsNone(kvutil.filename_maxmin(os.path.join(self.tmp, '*.none')))
+
+    #def dump_dict_to_json_file(filename, optiondict, compact=False, fast=False, fsync=False):
+    def test_dump_dict_to_json_file_p01_atomic_replace(self):
+        fname = os.path.join(self.tmp, 'state.json')
+        write_file(fname, 'old')
+        os.chmod(fname, 0o640)
+        kvutil.dump_dict_to_json_file(fname, {'a': 1, 'b': [1, 2]}, fsync=True)
+        self.assertEqual(kvutil.load_json_file_to_dict(fname), {'a': 1, 'b': [1, 2]})
+        self.assertEqual(os.stat(fname).st_mode & 0o777, 0o640)
+        # no temp file left behind
+        self.assertEqual(os.listdir(self.tmp), ['state.json'])
+    def test_dump_dict_to_json_file_p02_compact_fast(self):
+        fname = os.path.join(self.tmp, 'state.json')
+        kvutil.dump_dict_to_json_file(fname, {'a': 1, 'b': [1, 2]}, compact=True)
+        with open(fname) as t:
+            self.assertEqual(t.read(), '{"a":1,"b":[1,2]}')
+        # json is used when orjson is not installed
+        kvutil.dump_dict_to_json_file(fname, {'a': 1}, fast=True)
+        self.assertEqual(kvutil.load_json_file_to_dict(fname), {'a': 1})
+    def test_dump_dict_to_json_file_f01_unserializable(self):
+        fname = os.path.join(self.tmp, 'state.json')
+        write_file(fname, '{"a": 1}')
+        with self.assertRaises(TypeError):
+            kvutil.dump_dict_to_json_file(fname, {'a': object()})
+        # the existing file is untouched
+        self.assertEqual(kvutil.load_json_file_to_dict(fname), {'a': 1})
+        self.assertEqual(os.listdir(self.tmp), ['state.json'])
+
+    #def write_file_atomic(filename, text, fsync=False, encoding='utf-8', binary=False, perms=None):
+    def test_write_file_atomic_p01_binary_perms(self):
+        fname = os.path.join(self.tmp, 'options.cache')
+        old_umask = os.umask(0o077)
+        try:
+            kvutil.write_file_atomic(fname, b'\x00\x01', binary=True, perms=0o600)
+            self.assertEqual(os.stat(fname).st_mode & 0o777, 0o600)
+            # perms win over the umask and over the file being replaced
+            kvutil.write_file_atomic(fname, b'\x02', binary=True, perms=0o644)
+            self.assertEqual(os.stat(fname).st_mode & 0o777, 0o644)
+        finally:
+            os.umask(old_umask)
+        with open(fname, 'rb') as t:
+            self.assertEqual(t.read(), b'\x02')
+        self.assertEqual(os.listdir(self.tmp), ['options.cache'])
+
+    #def load_json_file_to_dict(filename):
+    def test_load_json_file_to_dict_f01_bad_json(self):
+        fname = os.path.join(self.tmp, 'bad.json')
+        write_file(fname, '{\n"a": 1,\n"b": \n}')
+        with self.assertRaises(ValueError):
+            kvutil.load_json_file_to_dict(fname)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import kvwatch
+
+import unittest
+
+import os
+import tempfile
+
+
+# Testing class
+class TestKVwatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    #def TimerWheel.advance(now):
+    def test_timerwheel_advance_p01_in_order(self):
+        wheel = kvwatch.TimerWheel(1.0, slots=8, now=1000)
+        wheel.schedule('b', 1005.5)
+        wheel.schedule('a', 1003)
+        self.assertEqual(wheel.advance(1002), [])
+        self.assertEqual(wheel.advance(1006), ['a', 'b'])
+        self.assertEqual(len(wheel), 0)
+    def test_timerwheel_advance_p02_beyond_one_rotation(self):
+        wheel = kvwatch.TimerWheel(1.0, slots=8, now=1000)
+        wheel.schedule('far', 1020)
+        self.assertEqual(wheel.advance(1012), [])
+        self.assertEqual(wheel.advance(1019), [])
+        self.assertEqual(wheel.advance(1020), ['far'])
+    def test_timerwheel_advance_p03_reschedule(self):
+        wheel = kvwatch.TimerWheel(1.0, slots=8, now=1000)
+        wheel.schedule('a', 1002)
+        wheel.schedule('a', 1010)
+        self.assertEqual(wheel.advance(1005), [])
+        self.assertEqual(wheel.deadline('a'), 1010)
+        self.assertEqual(wheel.advance(1010), ['a'])
+    def test_timerwheel_advance_p04_past_fires_next_advance(self):
+        wheel = kvwatch.TimerWheel(1.0, slots=8, now=1000)
+        wheel.schedule('late', 900)
+        self.assertEqual(wheel.advance(1000), ['late'])
+    def test_timerwheel_cancel_p01_simple(self):
+        wheel = kvwatch.TimerWheel(1.0, slots=8, now=1000)
+        wheel.schedule('a', 1002)
+        wheel.cancel('a')
+        self.assertNotIn('a', wheel)
+        self.assertEqual(wheel.advance(1003), [])
+
+    #def DirectoryWatcher.add_dir(d):
+    def test_directorywatcher_add_dir_f01_missing_not_recorded(self):
+        watcher = kvwatch.DirectoryWatcher([self.tmpdir.name])
+        if watcher.mode != 'inotify':
+            watcher.close()
+            self.skipTest('inotify not available')
+        missing = os.path.join(self.tmpdir.name, 'later')
+        self.assertFalse(watcher.add_dir(missing))
+        self.assertNotIn(missing, watcher.dirs)
+        # created - the retry watches it
+        os.mkdir(missing)
+        self.assertTrue(watcher.add_dir(missing))
+        self.assertIn(missing, watcher.dirs)
+        watcher.close()
+
+    #def DirectoryWatcher.read_events(timeout):
+    def test_directorywatcher_read_events_p01_write(self):
+        watcher = kvwatch.DirectoryWatcher([self.tmpdir.name])
+        with open(os.path.join(self.tmpdir.name, 'watched.txt'), 'w') as f:
+            f.write('data')
+        events = watcher.read_events(timeout=2)
+        watcher.close()
+        self.assertIn((os.path.abspath(self.tmpdir.name), 'watched.txt'), events)
+    def test_directorywatcher_read_events_p02_poll(self):
+        watcher = kvwatch.DirectoryWatcher([self.tmpdir.name], poll_seconds=0, use_inotify=False)
+        self.assertEqual(watcher.mode, 'poll')
+        with open(os.path.join(self.tmpdir.name, 'watched.txt'), 'w') as f:
+            f.write('data')
+        events = watcher.read_events(timeout=0)
+        self.assertEqual(events, {(os.path.abspath(self.tmpdir.name), 'watched.txt')})
+        self.assertEqual(watcher.read_events(timeout=0), set())
+    def test_directorywatcher_read_events_p03_timeout(self):
+        watcher = kvwatch.DirectoryWatcher([self.tmpdir.name])
+        self.assertEqual(watcher.read_events(timeout=0.1), set())
+        watcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
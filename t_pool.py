@@ -1,12 +1,18 @@
 import kvutil
 
 import pool
+import kvnotifier
 
 import unittest
+import unittest.mock
 
 import time
 import copy
 import os
+import sys
+import datetime
+import tempfile
+import subprocess
 
 from stat import S_IREAD, S_IRGRP, S_IROTH, S_IWUSR
 
@@ -61,7 +67,171 @@ class TestKVpool(unittest.TestCase):
     def test_check_file_writable_f03_directory(self):
         self.assertFalse( pool.check_file_writable('.'), 'Writeable file not created: ' + '.' )
 
+
+    #def debounce_heat_mode(body_state, reading, now_ts, readings_needed, dwell_seconds=0):
+    def test_debounce_heat_mode_p01_first_reading(self):
+        body_state = {}
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Heater', 100, 2), ('Heater', True))
+        self.assertEqual(body_state['stable'], 'Heater')
+    def test_debounce_heat_mode_p02_steady_state_no_update(self):
+        body_state = {}
+        pool.debounce_heat_mode(body_state, 'Off', 100, 2)
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Off', 200, 2), ('Off', False))
+    def test_debounce_heat_mode_p03_change_after_k_readings(self):
+        body_state = {}
+        pool.debounce_heat_mode(body_state, 'Off', 100, 3)
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Heater', 200, 3)[0], 'Off')
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Heater', 300, 3)[0], 'Off')
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Heater', 400, 3)[0], 'Heater')
+        self.assertEqual(len(body_state['ring']), 3)
+    def test_debounce_heat_mode_p04_single_odd_reading_ignored(self):
+        body_state = {}
+        pool.debounce_heat_mode(body_state, 'Off', 100, 2)
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Heater', 200, 2)[0], 'Off')
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Off', 300, 2), ('Off', True))
+        # ring is clean again once the odd reading has rolled out
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Off', 400, 2), ('Off', True))
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Off', 500, 2), ('Off', False))
+    def test_debounce_heat_mode_p05_dwell_time(self):
+        body_state = {}
+        pool.debounce_heat_mode(body_state, 'Off', 100, 10, dwell_seconds=600)
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Heater', 200, 10, dwell_seconds=600)[0], 'Off')
+        self.assertEqual(pool.debounce_heat_mode(body_state, 'Heater', 800, 10, dwell_seconds=600)[0], 'Heater')
+
+    #def debounce_pool_settings(pool_settings, optiondict, now_ts=None):
+    def test_debounce_pool_settings_p01_persisted(self):
+        optiondict = {'heat_mode_state_filename': filename, 'heat_mode_debounce_readings': 2, 'heat_mode_debounce_seconds': 0}
+        settings = {'pool_heat_mode': 'Off', 'spa_heat_mode': 'Off', 'pool_temp_last': '70'}
+        self.assertEqual(pool.debounce_pool_settings(settings, optiondict, 100), settings)
+        settings_on = dict(settings, pool_heat_mode='Heater')
+        self.assertEqual(pool.debounce_pool_settings(settings_on, optiondict, 200)['pool_heat_mode'], 'Off')
+        self.assertEqual(pool.debounce_pool_settings(settings_on, optiondict, 300)['pool_heat_mode'], 'Heater')
+    def test_debounce_pool_settings_p03_state_read_once(self):
+        state_file = kvutil.filename_unique({'base_filename': 't_poolstate', 'file_ext': '.json', 'uniqtype': 'datecnt', 'overwrite': True, 'forceuniq': True})
+        kvutil.dump_dict_to_json_file(state_file, {'pool_heat_mode': {'stable': 'Heater', 'since': 50, 'ring': [[50, 'Heater']]}})
+        optiondict = {'heat_mode_state_filename': state_file, 'heat_mode_debounce_readings': 2, 'heat_mode_debounce_seconds': 0}
+        settings = {'pool_heat_mode': 'Off', 'spa_heat_mode': 'Off', 'pool_temp_last': '70'}
+        with unittest.mock.patch.object(pool.kvutil, 'load_json_file_to_dict', wraps=kvutil.load_json_file_to_dict) as load:
+            # the saved state holds the pool on for the first odd reading
+            self.assertEqual(pool.debounce_pool_settings(settings, optiondict, 100)['pool_heat_mode'], 'Heater')
+            self.assertEqual(pool.debounce_pool_settings(settings, optiondict, 200)['pool_heat_mode'], 'Off')
+            pool.debounce_pool_settings(settings, optiondict, 300)
+        self.assertEqual(load.call_count, 1)
+        pool._heat_mode_state.pop(state_file)
+        kvutil.remove_filename(state_file)
+    def test_debounce_pool_settings_p02_no_settings(self):
+        optiondict = {'heat_mode_state_filename': filename, 'heat_mode_debounce_readings': 2, 'heat_mode_debounce_seconds': 0}
+        self.assertIsNone(pool.debounce_pool_settings(None, optiondict, 100))
+        self.assertFalse(os.path.exists(filename))
+
+
+
+    #def add_pool_metrics(metrics, pool_settings):
+    def test_add_pool_metrics_p01_readings(self):
+        metrics = pool.kvmetrics.MetricsRegistry('pool_')
+        pool.add_pool_metrics(metrics, {'pool_temp_last': '81', 'pool_temp_set': '84', 'pool_heat_set': 'Off', 'pool_heat_mode': 'Heater',
+                                        'spa_temp_last': 'n/a', 'spa_temp_set': '100', 'spa_heat_set': 'On', 'spa_heat_mode': 'Off'})
+        text = metrics.render()
+        self.assertIn('pool_temperature_fahrenheit{body="pool"} 81.0', text)
+        self.assertIn('pool_temperature_fahrenheit{body="spa"} NaN', text)
+        self.assertIn('pool_heat_mode{body="pool",mode="Heater"} 1', text)
+        self.assertIn('pool_reading_ok 1', text)
+    def test_add_pool_metrics_p02_no_reading(self):
+        metrics = pool.kvmetrics.MetricsRegistry('pool_')
+        pool.add_pool_metrics(metrics, None)
+        self.assertIn('pool_reading_ok 0', metrics.render())
+        self.assertNotIn('temperature', metrics.render())
         
+    #def add_lock_metrics(metrics, optiondict, now_ts=None):
+    def test_add_lock_metrics_p01_ages(self):
+        lock = kvutil.filename_unique({'base_filename': 't_poollock', 'file_ext': '.lck', 'uniqtype': 'datecnt', 'overwrite': True, 'forceuniq': True})
+        with open(lock, 'w') as t:
+            t.write('Pool ON')
+        mtime = os.stat(lock).st_mtime
+        optiondict = {'pool_heater_filename': lock, 'pool_missing_filename': None, 'pool_heater_off_filename': 'not_there.lck',
+                      'spa_heater_filename': None, 'spa_missing_filename': None, 'spa_heater_off_filename': None}
+        metrics = pool.kvmetrics.MetricsRegistry('pool_')
+        pool.add_lock_metrics(metrics, optiondict, mtime + 30)
+        kvutil.remove_filename(lock)
+        text = metrics.render()
+        self.assertIn('pool_lock_age_seconds{body="pool",lock="heater_on",lock_fname="' + lock + '"} 30', text)
+        self.assertIn('pool_lock_age_seconds{body="pool",lock="heater_off",lock_fname="not_there.lck"} NaN', text)
+        self.assertNotIn('missing', text)
+
+
+    #def read_pool_heater_allowable_file(input_file, cache_file=None):
+    def test_read_pool_heater_allowable_file_p01_dates_ranges_rules(self):
+        with open(filename, 'w') as t:
+            t.write('# allowed dates\n2024-07-04\n\n2024-08-01..2024-08-10\n2024-08-05..2024-08-20\nweekends 2024-06-01..2024-06-30\nholidays\nfri,sat\n')
+        allowed, invalid = pool.read_pool_heater_allowable_file(filename)
+        self.assertEqual(invalid, [])
+        self.assertEqual(allowed.ranges, [[datetime.date(2024, 8, 1).toordinal(), datetime.date(2024, 8, 20).toordinal()]])
+        self.assertIn(datetime.date(2024, 7, 4), allowed)
+        self.assertIn(datetime.date(2024, 8, 15), allowed)
+        self.assertIn(datetime.datetime(2024, 6, 2, 10, 30), allowed)   # sunday in june
+        self.assertIn(datetime.date(2024, 11, 28), allowed)             # thanksgiving
+        self.assertIn(datetime.date(2025, 3, 7), allowed)               # friday
+        self.assertNotIn(datetime.date(2024, 7, 7), allowed)            # sunday outside june
+        self.assertNotIn(datetime.date(2024, 8, 21), allowed)           # wednesday after the range
+    def test_read_pool_heater_allowable_file_p02_cache(self):
+        cache_file = filename + '.json'
+        with open(filename, 'w') as t:
+            t.write('2024-07-04\nnot a date\n')
+        allowed, invalid = pool.read_pool_heater_allowable_file(filename, cache_file)
+        self.assertTrue(os.path.exists(cache_file))
+        cached, cached_invalid = pool.read_pool_heater_allowable_file(filename, cache_file)
+        self.assertEqual(cached.to_dict(), allowed.to_dict())
+        self.assertEqual(cached_invalid, invalid)
+        self.assertEqual(len(invalid), 1)
+        self.assertTrue(invalid[0].startswith('2|not a date|'))
+        # the file changing rebuilds the rules
+        with open(filename, 'w') as t:
+            t.write('2024-07-05..2024-07-06\n')
+        changed, invalid = pool.read_pool_heater_allowable_file(filename, cache_file)
+        self.assertEqual(invalid, [])
+        self.assertIn(datetime.date(2024, 7, 6), changed)
+        self.assertNotIn(datetime.date(2024, 7, 4), changed)
+        os.remove(cache_file)
+    def test_read_pool_heater_allowable_file_p03_no_file(self):
+        allowed, invalid = pool.read_pool_heater_allowable_file(filename)
+        self.assertEqual(len(allowed), 0)
+        self.assertNotIn(datetime.date.today(), allowed)
+    def test_read_pool_heater_allowable_file_f01_bad_range(self):
+        with open(filename, 'w') as t:
+            t.write('2024-07-10..2024-07-01\nweekends bogus\n')
+        allowed, invalid = pool.read_pool_heater_allowable_file(filename)
+        self.assertEqual(len(invalid), 2)
+        self.assertEqual(len(allowed), 0)
+    def test_us_holidays_p01_floating(self):
+        holidays = pool.us_holidays(2025)
+        self.assertIn(datetime.date(2025, 5, 26), holidays)     # memorial day
+        self.assertIn(datetime.date(2025, 9, 1), holidays)      # labor day
+        self.assertIn(datetime.date(2025, 1, 20), holidays)     # mlk day
+        self.assertEqual(len(holidays), 11)
+
+
+    #def send_message(optiondict, email_from, email_to, email_subject, email_body, control_action=False):
+    def test_send_message_p01_control_action_not_rate_limited(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            optiondict = {'notify_backend': 'file', 'notify_filename': os.path.join(tmp, 'messages.txt'),
+                          'notify_rate_filename': os.path.join(tmp, 'rate.json'), 'notify_rate_capacity': 1,
+                          'notify_rate_refill_seconds': 900}
+            try:
+                self.assertTrue(pool.send_message(optiondict, 'f@example.com', 't@example.com', 'Heater ON', 'body')['id'])
+                self.assertTrue(pool.send_message(optiondict, 'f@example.com', 't@example.com', 'Heater ON', 'body')['suppressed'])
+                self.assertTrue(pool.send_message(optiondict, 'f@example.com', 't@example.com', 'Being Turned OFF', 'body',
+                                                  control_action=True)['id'])
+            finally:
+                kvnotifier.close_notifiers()
+
+    def test_import_p01_deferred_libraries(self):
+        # a cycle that sends nothing and converts no timezone never loads these
+        with tempfile.TemporaryDirectory() as cwd:
+            proc = subprocess.run([sys.executable, '-c', 'import sys, pool; print(sorted(m for m in ("dateutil", "smtplib", "googleapiclient", "kvgmailsendsimple") if m in sys.modules))'],
+                                  cwd=cwd, env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(pool.__file__))),
+                                  capture_output=True, text=True, check=True)
+        self.assertEqual(proc.stdout.strip(), '[]')
+
 
 #def read_parse_output_pool(input_file, output_file):
 #def message_on_pool_state_change(pool_settings, optiondict):
@@ -0,0 +1,67 @@
+import pool_scheduler
+
+import unittest
+
+import os
+import sys
+import json
+import tempfile
+
+
+# Testing class
+class TestPoolScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tmp = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_conf(self, fname, conf):
+        with open(fname, 'w') as f:
+            json.dump(conf, f)
+
+    #def parse_module_options(module_optiondictconfig, args):
+    def test_parse_module_options_p01_args(self):
+        config = {'conf_json': {'value': []}, 'count': {'value': 1, 'type': 'int'}}
+        argv = list(sys.argv)
+        optiondict = pool_scheduler.parse_module_options(config, ['count=5'])
+        self.assertEqual(optiondict['count'], 5)
+        # the command line and config are left alone
+        self.assertEqual(sys.argv, argv)
+        self.assertEqual(config['count']['value'], 1)
+
+    #def ModuleOptions.get():
+    def test_module_options_p01_reload_on_change(self):
+        conf = os.path.join(self.tmp, 'mod.json')
+        self.write_conf(conf, {'count': 2})
+        options = pool_scheduler.ModuleOptions('mod', {'conf_json': {'value': [conf]}, 'count': {'value': 1, 'type': 'int'}}, [])
+        first = options.get()
+        self.assertEqual(first['count'], 2)
+        self.assertIs(options.get(), first)
+        self.write_conf(conf, {'count': 30})
+        self.assertEqual(options.get()['count'], 30)
+
+    #def run_screenlogic(optiondict, args):
+    @unittest.skipIf(os.name == 'nt', 'stand in command is a shebang script')
+    def test_run_screenlogic_p01_output(self):
+        # stand in for screenlogicpy - prints the arguments it was given
+        cmd = os.path.join(self.tmp, 'screenlogic')
+        with open(cmd, 'w') as f:
+            f.write('#!{}\nimport sys\nprint(" ".join(sys.argv[1:]))\n'.format(sys.executable))
+        os.chmod(cmd, 0o755)
+        optiondict = {'screenlogic_cmd': cmd, 'screenlogic_host': '10.0.0.1', 'screenlogic_timeout_seconds': 10}
+        proc = pool_scheduler.run_screenlogic(optiondict, ['set', 'heat-mode', 'pool', '0'])
+        self.assertEqual(proc.stdout, '-i 10.0.0.1 set heat-mode pool 0\n')
+    def test_run_screenlogic_f01_missing_command(self):
+        optiondict = {'screenlogic_cmd': os.path.join(self.tmp, 'none'), 'screenlogic_host': 'x', 'screenlogic_timeout_seconds': 10}
+        self.assertIsNone(pool_scheduler.run_screenlogic(optiondict, []))
+
+    #def build_tasks(optiondict):
+    def test_build_tasks_p01_disabled(self):
+        optiondict = {'pool_interval_seconds': 0, 'pool_jitter_seconds': 0, 'pool_args': [],
+                      'chk_interval_seconds': 60, 'chk_jitter_seconds': 5, 'chk_args': []}
+        self.assertEqual([x.name for x in pool_scheduler.build_tasks(optiondict)], ['chk_log_update'])
+
+if __name__ == '__main__':
+    unittest.main()